@@ -3,3 +3,13 @@ from django.apps import AppConfig
 
 class BaseConfig(AppConfig):
     name = 'base'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from . import bloom, cache, invalidation
+        # Generation counters in a shared cache are bumped once, by the process making the change. A cache in each
+        # process's memory has its own counters, bumped for the changes of every process
+        invalidation.subscribe(lambda namespaces: cache.bump(*namespaces), remote=not cache.is_shared())
+        # Hear about data changed by other processes, see base/invalidation.py
+        request_started.connect(invalidation.start_listener_for_server, dispatch_uid='invalidation_listener')
+        bloom.build_at_startup()
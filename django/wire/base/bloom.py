@@ -0,0 +1,196 @@
+"""
+A Bloom filter of every username, to answer "no such user" without a query.
+
+A Bloom filter can wrongly say a username might exist, at a rate of about USERNAME_FILTER['ERROR_RATE'], but never
+wrongly says one does not. Code looking a user up by name asks the filter first and only queries the database when the
+username might exist, so requests for unknown users, and checks that a new username is free, usually cost no query.
+
+Each process builds its filter from the user table when it starts, see base/apps.py, and again in a background thread
+every USERNAME_FILTER['REBUILD_INTERVAL'] seconds, which also drops the usernames of deleted users. Requests keep using
+the old filter until the new one is swapped in, and only build it themselves if it could not be built at startup. The
+user table is always read from the primary database, as a lagging replica would miss usernames the bus already added. Creating or renaming a
+user publishes its username on the invalidation bus, see base/invalidation.py, so every process adds new usernames to
+its filter as soon as they are saved. Users created without sending post_save are only known once the filter is rebuilt.
+Usernames are hashed with MD5, which is only used to spread them over the filter and is available on every Python
+version the site supports.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connection
+from wire.routers import pinned_to_primary
+from . import invalidation
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE_PREFIX = 'username:'
+
+
+class BloomFilter:
+    """
+    A fixed size set of strings that can only be added to, and whose membership test can give false positives
+    """
+
+    def __init__(self, capacity, error_rate):
+        """
+        :param capacity: The number of items the filter is sized for
+        :param error_rate: The rate of false positives once the filter holds capacity items
+        """
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        """
+        :param item: A string
+        :return: Generator of the bits set for the item, from two halves of one hash
+        """
+        digest = hashlib.md5(item.encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.size for index in range(self.hash_count))
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class UsernameFilter:
+    """
+    The Bloom filter of usernames for this process, built lazily and kept up to date by the invalidation bus
+    """
+
+    def __init__(self):
+        self.filter = None
+        self.built = 0
+        # Usernames delivered while the filter is being built, added to it once it is done
+        self.pending = None
+        self.rebuilding = False
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        invalidation.subscribe(self.namespaces_changed)
+
+    def stale(self):
+        """
+        :return: True if the filter has not been built, is too old or holds more usernames than it was sized for
+        """
+        return (self.filter is None or self.filter.count > self.filter.capacity
+                or self.built + settings.USERNAME_FILTER['REBUILD_INTERVAL'] < time.time())
+
+    def build(self):
+        """
+        Build the filter from every username in the primary database, sized for twice as many users so it can grow
+
+        :return: The new filter
+        """
+        with self.build_lock:
+            if not self.stale():
+                return self.filter
+            with self.lock:
+                self.pending = []
+            try:
+                with pinned_to_primary():
+                    new_filter = BloomFilter(max(User.objects.count() * 2, settings.USERNAME_FILTER['MIN_CAPACITY']),
+                                             settings.USERNAME_FILTER['ERROR_RATE'])
+                    for username in User.objects.values_list('username', flat=True).iterator():
+                        new_filter.add(username)
+                with self.lock:
+                    for username in self.pending:
+                        new_filter.add(username)
+                    self.filter = new_filter
+                    self.built = time.time()
+            finally:
+                with self.lock:
+                    self.pending = None
+            return new_filter
+
+    def rebuild(self):
+        """
+        Build a new filter in a background thread, while the current one keeps being used
+        """
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self.run_rebuild, name='username-filter', daemon=True).start()
+
+    def run_rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Failed to rebuild the username filter')
+        finally:
+            self.rebuilding = False
+            connection.close()
+
+    def may_exist(self, username):
+        """
+        :param username: A username
+        :return: False if there is certainly no user with the username, True if there might be
+        """
+        if not settings.USERNAME_FILTER['ENABLED']:
+            return True
+        current = self.filter
+        if current is None:
+            # Only when it could not be built at startup
+            current = self.build()
+        elif self.stale():
+            self.rebuild()
+        return username in current
+
+    def add(self, username):
+        """
+        :param username: A username that now exists
+        """
+        with self.lock:
+            if self.filter is not None:
+                self.filter.add(username)
+            if self.pending is not None:
+                self.pending.append(username)
+
+    def namespaces_changed(self, namespaces):
+        """
+        Add the usernames published by wire_profile/signals.py when users are saved
+
+        :param namespaces: list of invalidated namespaces
+        """
+        for namespace in namespaces:
+            if namespace.startswith(NAMESPACE_PREFIX):
+                self.add(namespace[len(NAMESPACE_PREFIX):])
+
+
+usernames = UsernameFilter()
+
+
+def build_at_startup():
+    """
+    Build this process's filter before it handles requests. When the database cannot be read yet, such as while running
+    migrate on a new database, the first request needing the filter builds it instead
+    """
+    if not settings.USERNAME_FILTER['ENABLED']:
+        return
+    try:
+        usernames.build()
+    except DatabaseError as error:
+        logger.warning('Could not build the username filter at startup: %s', error)
+    finally:
+        # Worker processes forked after startup must not share the connection
+        connection.close()
+
+
+def username_namespace(username):
+    """
+    :param username: The username of a saved user
+    :return: The namespace to publish so every process adds the username to its filter
+    """
+    return NAMESPACE_PREFIX + username
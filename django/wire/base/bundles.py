@@ -0,0 +1,115 @@
+"""
+Bundling of static files.
+
+Each bundle in STATIC_BUNDLES is made of several JavaScript or CSS files, concatenated and minified so a page needs one
+request for them instead of one each. Bundles are built by collectstatic, see base/storage.py, and included in
+templates with the bundle tag from base/templatetags/bundles.py.
+
+Minification uses rjsmin and rcssmin, and precompression uses brotli as well as gzip. They are installed by .travis.yml
+and the Vagrantfile, but bundles are still built without them, only concatenated or only gzipped, and the
+static_bundle_report command warns when any is missing.
+"""
+import gzip
+import posixpath
+import re
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CSS_URL = re.compile(r'''url\((\s*['"]?)([^'")]+)(['"]?\s*)\)''')
+SOURCE_MAP = re.compile(r'^\s*(//|/\*)# sourceMappingURL=.*$', re.MULTILINE)
+PRECOMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.map', '.json', '.txt', '.eot', '.ttf')
+
+
+def read_source(path):
+    """
+    :param path: The path of a static file, relative to the static directories
+    :return: The contents of the file, found with the staticfiles finders
+    """
+    with open(finders.find(path), encoding='utf-8') as source:
+        return source.read()
+
+
+def rewrite_css_urls(content, source, bundle):
+    """
+    Make the relative urls in a CSS file point to the same files from the bundle's directory
+
+    :param content: The CSS
+    :param source: The path of the CSS file
+    :param bundle: The path of the bundle the CSS is added to
+    :return: The CSS with rewritten urls
+    """
+    def rewrite(match):
+        url = match.group(2)
+        if url.startswith(('/', '#', 'data:')) or '://' in url:
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+        return 'url({}{}{})'.format(match.group(1), posixpath.relpath(path, posixpath.dirname(bundle)), match.group(3))
+    return CSS_URL.sub(rewrite, content)
+
+
+def minify(path, content):
+    """
+    :param path: The path of a JavaScript or CSS file, files named .min. are assumed to be minified already
+    :param content: The contents of the file
+    :return: The minified contents, or the contents unchanged if no minifier is installed
+    """
+    if '.min.' in path:
+        return content
+    if path.endswith('.js') and rjsmin:
+        return rjsmin.jsmin(content)
+    if path.endswith('.css') and rcssmin:
+        return rcssmin.cssmin(content)
+    return content
+
+
+def build_bundle(bundle, read=read_source):
+    """
+    Concatenate and minify the files of a bundle
+
+    :param bundle: The path of a bundle in STATIC_BUNDLES
+    :param read: Function returning the contents of a static file from its path
+    :return: The contents of the bundle
+    """
+    parts = []
+    for source in settings.STATIC_BUNDLES[bundle]:
+        content = SOURCE_MAP.sub('', read(source))
+        if bundle.endswith('.css'):
+            content = rewrite_css_urls(content, source, bundle)
+        parts.append(minify(source, content).strip())
+    # A semicolon keeps scripts without a trailing one from running into the next
+    return (';\n' if bundle.endswith('.js') else '\n').join(parts) + '\n'
+
+
+def precompress(content):
+    """
+    :param content: The bytes of a static file
+    :return: dictionary of file extensions, '.gz' and '.br' when brotli is installed, to the compressed bytes
+    """
+    compressed = {'.gz': gzip.compress(content, 9)}
+    if brotli:
+        compressed['.br'] = brotli.compress(content)
+    return compressed
+
+
+def missing_packages():
+    """
+    :return: list of the optional packages that are not installed, with what is skipped without them
+    """
+    packages = [('rjsmin', rjsmin, 'JavaScript is not minified'), ('rcssmin', rcssmin, 'CSS is not minified'),
+                ('brotli', brotli, 'files are not precompressed with brotli')]
+    return ['{}, {}'.format(name, skipped) for name, module, skipped in packages if module is None]
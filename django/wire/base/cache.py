@@ -0,0 +1,251 @@
+"""
+Versioned caching of query results.
+
+Every cached result depends on one or more namespaces, such as 'messages:user:5'. Each namespace has a generation
+counter that is embedded in the cache keys of the results depending on it. Bumping the counter when the underlying
+data changes makes every old key unreachable at once, so invalidation never has to find or delete keys. Old entries
+simply expire. Works with any Django cache backend.
+
+Filling the cache is protected against stampedes, see cached_query. The hits, misses, stale results served and early
+refreshes are counted in the cache and available from cache_stats.
+
+Generation counters are bumped through the invalidation bus, see base/invalidation.py. A shared cache backend has one
+set of counters, bumped only by the process publishing a change, while per-process caches such as LocMemCache are bumped
+in every process. LocalCache keeps entries in process memory and drops them when the bus invalidates one of
+their namespaces.
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from wire.routers import is_pinned, pinned_to_primary
+from . import invalidation
+
+STATS = ('hits', 'misses', 'stale', 'refreshes')
+
+
+def is_shared():
+    """
+    :return: True if the default cache is shared between processes, False if each process keeps its own in memory
+    """
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def generation_key(namespace):
+    return 'generation:' + namespace
+
+
+def new_generation():
+    """
+    Start counters from the current time rather than 1, so a counter evicted from the cache never comes back with a
+    generation that was used before
+    """
+    return int(time.time() * 1000)
+
+
+def generations(namespaces):
+    """
+    Get the current generation of each namespace, starting any that do not have one yet
+
+    :param namespaces: list of namespaces
+    :return: dictionary of namespaces to generations
+    """
+    keys = {namespace: generation_key(namespace) for namespace in namespaces}
+    stored = cache.get_many(list(keys.values()))
+    current = {}
+    for namespace, key in keys.items():
+        if key not in stored:
+            cache.add(key, new_generation(), None)
+            stored[key] = cache.get(key)
+        current[namespace] = stored[key]
+    return current
+
+
+def bump(*namespaces):
+    """
+    Invalidate every cached result depending on the given namespaces. With read replicas, also note that they changed,
+    so results recomputed while the replicas may still lag behind are read from the primary
+
+    :param namespaces: The namespaces whose data has changed
+    """
+    for namespace in namespaces:
+        try:
+            cache.incr(generation_key(namespace))
+        except ValueError:
+            cache.set(generation_key(namespace), new_generation(), None)
+    if settings.REPLICA_DATABASES:
+        cache.set_many({'changed:' + namespace: True for namespace in namespaces}, settings.REPLICA_PIN_SECONDS)
+
+
+def recently_changed(namespaces):
+    """
+    :param namespaces: list of namespaces
+    :return: True if any of the namespaces changed in the last REPLICA_PIN_SECONDS, when replicas are used
+    """
+    return bool(settings.REPLICA_DATABASES and namespaces
+                and cache.get_many(['changed:' + namespace for namespace in namespaces]))
+
+
+def versioned_key(name, namespaces):
+    """
+    :param name: A name identifying the query and its parameters
+    :param namespaces: The namespaces the query result depends on
+    :return: A cache key for the current generations of the given namespaces
+    """
+    current = generations(namespaces)
+    versions = ':'.join('{}'.format(current[namespace]) for namespace in namespaces)
+    return 'query:{}:{}'.format(hashlib.md5(name.encode()).hexdigest(), versions)
+
+
+def count(stat):
+    """
+    Add one to a cache statistic
+
+    :param stat: The statistic to count, one of STATS
+    """
+    try:
+        cache.incr('cache_stats:' + stat)
+    except ValueError:
+        cache.add('cache_stats:' + stat, 0, None)
+        cache.incr('cache_stats:' + stat)
+
+
+def cache_stats():
+    """
+    :return: dictionary of each statistic to the number of times it has happened
+    """
+    stored = cache.get_many(['cache_stats:' + stat for stat in STATS])
+    return {stat: stored.get('cache_stats:' + stat, 0) for stat in STATS}
+
+
+def compute_and_store(key, compute, timeout, namespaces=()):
+    """
+    Compute a result and store it with the time it expires and how long it took to compute. Results depending on
+    recently changed namespaces are computed on the primary, so a lagging replica never fills the cache shared by
+    every client
+
+    :param key: The cache key to store the result under
+    :param compute: Function that evaluates the query
+    :param timeout: Seconds until the result is stale
+    :param namespaces: The namespaces the result depends on
+    :return: The computed result
+    """
+    started = time.time()
+    with pinned_to_primary(is_pinned() or recently_changed(list(namespaces))):
+        value = compute()
+    finished = time.time()
+    # Keep stale results a little longer than their timeout, so they can be served while one process recomputes them
+    cache.set(key, (value, finished + timeout, finished - started), timeout + settings.QUERY_CACHE_STALE_TIMEOUT)
+    return value
+
+
+def cached_query(name, namespaces, compute, timeout=None):
+    """
+    Get a query result from the cache, computing and storing it if it is not cached for the current generations.
+
+    Only one process recomputes a result at a time. While it does, the others serve the stale result, or wait for the
+    new one if there is none. Results are also recomputed a little before they expire, with a probability that rises
+    as expiry gets closer and with the time the query takes, so popular keys rarely expire at all.
+
+    :param name: A name identifying the query and its parameters
+    :param namespaces: The namespaces the query result depends on
+    :param compute: Function that evaluates the query, its result must be picklable
+    :param timeout: Seconds to keep the result, defaults to QUERY_CACHE_TIMEOUT
+    :return: The query result
+    """
+    timeout = timeout or settings.QUERY_CACHE_TIMEOUT
+    key = versioned_key(name, namespaces)
+    lock_key = 'lock:' + key
+    entry = cache.get(key)
+
+    if entry is not None:
+        value, expires, compute_time = entry
+        early = time.time() - compute_time * settings.QUERY_CACHE_EARLY_REFRESH_BETA * math.log(1 - random.random())
+        if early < expires:
+            count('hits')
+            return value
+        if cache.add(lock_key, True, settings.QUERY_CACHE_LOCK_TIMEOUT):
+            count('refreshes' if time.time() < expires else 'misses')
+            try:
+                return compute_and_store(key, compute, timeout, namespaces)
+            finally:
+                cache.delete(lock_key)
+        count('stale')
+        return value
+
+    deadline = time.time() + settings.QUERY_CACHE_LOCK_TIMEOUT
+    while not cache.add(lock_key, True, settings.QUERY_CACHE_LOCK_TIMEOUT):
+        # Another process is computing the result, use it once it is ready
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            count('hits')
+            return entry[0]
+        if time.time() > deadline:
+            break
+    count('misses')
+    try:
+        return compute_and_store(key, compute, timeout, namespaces)
+    finally:
+        cache.delete(lock_key)
+
+
+class LocalCache:
+    """
+    A cache in the memory of this process. Entries are dropped as soon as the invalidation bus delivers an event for one
+    of their namespaces, so they can be kept for a long time
+    """
+
+    def __init__(self, timeout, max_entries=10000):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.entries = {}
+        self.keys_by_namespace = {}
+        self.lock = threading.Lock()
+        invalidation.subscribe(self.invalidate)
+
+    def get(self, key, default=None):
+        """
+        :param key: The key to look up
+        :param default: Returned if the key is not cached
+        :return: The cached value
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.time():
+            return default
+        return entry[0]
+
+    def set(self, key, value, namespaces):
+        """
+        Cache a value. Values are not cached inside a transaction, as the data they were read from could still be
+        rolled back without any invalidation event
+
+        :param key: The key to store the value under
+        :param value: The value to cache
+        :param namespaces: The namespaces the value depends on
+        """
+        if connection.in_atomic_block:
+            return
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries = {}
+                self.keys_by_namespace = {}
+            self.entries[key] = (value, time.time() + self.timeout)
+            for namespace in namespaces:
+                self.keys_by_namespace.setdefault(namespace, set()).add(key)
+
+    def invalidate(self, namespaces):
+        """
+        Drop every entry depending on the given namespaces
+
+        :param namespaces: list of namespaces
+        """
+        with self.lock:
+            for namespace in namespaces:
+                for key in self.keys_by_namespace.pop(namespace, ()):
+                    self.entries.pop(key, None)
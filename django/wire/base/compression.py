@@ -0,0 +1,167 @@
+"""
+Compression of responses with brotli or gzip.
+
+The encoding is negotiated from the Accept-Encoding header, preferring brotli when the brotli package is installed.
+Responses smaller than COMPRESSION['MIN_SIZE'] are sent as they are, as compressing them costs more CPU than the bytes
+it saves. Streaming responses are compressed chunk by chunk and each chunk is flushed, so they are never buffered.
+Views can change the settings for their responses with the compression decorator.
+
+Only the content types in COMPRESSION['CONTENT_TYPES'] are compressed. HTML is left out by default, as compressing
+pages that contain secrets, such as CSRF tokens, next to user input makes them vulnerable to the BREACH attack.
+"""
+import re
+import zlib
+from functools import wraps
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ACCEPT_ENCODING = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*')
+
+
+def compression(**options):
+    """
+    Change the compression settings for the responses of a view
+
+    :param options: Any of the keys of the COMPRESSION setting in lower case, e.g. min_size=0 or enabled=False
+    :return: The view decorator
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped_view(request, *args, **kwargs):
+            request.compression_options = options
+            return view(request, *args, **kwargs)
+        return wrapped_view
+    return decorator
+
+
+def accepted_encodings(header):
+    """
+    :param header: The Accept-Encoding header of a request
+    :return: set of the encodings the client accepts
+    """
+    accepted = set()
+    for part in header.lower().split(','):
+        match = ACCEPT_ENCODING.fullmatch(part)
+        if match:
+            try:
+                quality = float(match.group(2) or 1)
+            except ValueError:
+                continue
+            if quality > 0:
+                accepted.add(match.group(1))
+    return accepted
+
+
+def choose_encoding(header):
+    """
+    :param header: The Accept-Encoding header of a request
+    :return: 'br', 'gzip' or None if neither is supported by both sides
+    """
+    accepted = accepted_encodings(header)
+    if brotli and ('br' in accepted or '*' in accepted):
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+class Compressor:
+    """
+    Incremental compression with one encoding
+    """
+
+    def __init__(self, encoding, options):
+        self.encoding = encoding
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=options['BROTLI_QUALITY'])
+        else:
+            # A window size of 31 writes the gzip header and trailer
+            self.compressor = zlib.compressobj(options['GZIP_LEVEL'], zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self.compressor.process(data)
+        return self.compressor.compress(data)
+
+    def flush(self):
+        """
+        :return: Everything compressed so far that has not been returned yet, so it can be sent straight away
+        """
+        if self.encoding == 'br':
+            return self.compressor.flush()
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+def compress(data, encoding, options):
+    """
+    :param data: The bytes to compress
+    :param encoding: 'br' or 'gzip'
+    :param options: The compression settings
+    :return: The compressed bytes
+    """
+    compressor = Compressor(encoding, options)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding, options):
+    """
+    :param chunks: Iterable of bytes
+    :param encoding: 'br' or 'gzip'
+    :param options: The compression settings
+    :return: Generator of compressed chunks, one for each chunk given
+    """
+    compressor = Compressor(encoding, options)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk) + compressor.flush()
+        if compressed:
+            yield compressed
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        options = dict(settings.COMPRESSION)
+        options.update({key.upper(): value for key, value in getattr(request, 'compression_options', {}).items()})
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if (not options['ENABLED'] or response.has_header('Content-Encoding') or response.status_code in (204, 304)
+                or not content_type.startswith(tuple(options['CONTENT_TYPES']))):
+            return response
+        if not response.streaming and len(response.content) < options['MIN_SIZE']:
+            return response
+
+        # Responses differ by Accept-Encoding from here on, whether they end up compressed or not
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding, options)
+            del response['Content-Length']
+        else:
+            compressed = compress(response.content, encoding, options)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        if response.has_header('ETag'):
+            # The compressed bytes differ from the ones the ETag was made from
+            response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+        response['Content-Encoding'] = encoding
+        return response
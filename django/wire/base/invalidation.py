@@ -0,0 +1,216 @@
+"""
+Cross-process invalidation bus.
+
+Code that changes data publishes the cache namespaces it affected. The process making the change invalidates them
+straight away, and once the transaction commits every other process is told to invalidate them too. Every event is
+written to the InvalidationEvent table, and a thread in each process delivers the events it has not seen yet. On
+PostgreSQL the thread is woken with NOTIFY as soon as an event is written, other databases are polled. NOTIFY only
+carries a wake-up, never the namespaces, so events of any size can be sent. A listener that loses its connection reads
+every event it missed when it reconnects, so process-local caches are never left stale.
+
+Process-local caches can subscribe to the bus, so they can keep entries for a long time and still never serve data
+that another process has changed. Each web server process starts its listener when it handles its first request.
+"""
+import json
+import logging
+import select
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+from django.core.handlers.wsgi import WSGIHandler
+from django.db.models import Q
+from django.utils import timezone
+from .models import InvalidationEvent
+
+CHANNEL = 'wire_invalidation'
+
+logger = logging.getLogger(__name__)
+
+# Events are read again for this many seconds after they were written, in case one written earlier committed later
+LOOKBACK_SECONDS = 10
+
+# Old events are deleted at most this often by each process
+CLEANUP_INTERVAL = 60
+
+_handlers = []
+# Handlers only called in the process publishing an event
+_publish_handlers = []
+_listener = None
+# The last event delivered to this process, kept across reconnections
+_last_event_id = None
+# Events delivered in the last LOOKBACK_SECONDS, mapped to when they were delivered
+_recent_events = {}
+_last_cleanup = 0
+
+
+def subscribe(handler, remote=True):
+    """
+    Call the given handler with the list of invalidated namespaces whenever an event is delivered to this process
+
+    :param handler: Function taking a list of namespaces
+    :param remote: Whether to call it for events published by other processes too, which is needed for state kept in
+        each process. Handlers updating state shared by every process only need calling where the event is published
+    """
+    (_handlers if remote else _publish_handlers).append(handler)
+
+
+def deliver(namespaces):
+    """
+    Invalidate the given namespaces in this process
+
+    :param namespaces: list of namespaces
+    """
+    for handler in _handlers:
+        handler(namespaces)
+
+
+def publish(*namespaces):
+    """
+    Invalidate the given namespaces in this process now, and in every process once the current transaction commits
+
+    :param namespaces: The namespaces whose data has changed
+    """
+    for handler in _publish_handlers:
+        handler(namespaces)
+    deliver(namespaces)
+    transaction.on_commit(lambda: broadcast_committed(namespaces))
+
+
+def broadcast_committed(namespaces):
+    """
+    Broadcast the namespaces changed by a committed transaction. The changes are saved whether or not the broadcast
+    succeeds, so a failure is logged rather than reported to the code that made them
+
+    :param namespaces: The namespaces whose data has changed
+    """
+    try:
+        broadcast(namespaces)
+    except DatabaseError:
+        logger.exception('Failed to broadcast invalidation of %s namespaces', len(namespaces))
+
+
+def broadcast(namespaces):
+    """
+    Send an invalidation event to every process, including this one
+
+    :param namespaces: The namespaces whose data has changed
+    """
+    InvalidationEvent.objects.create(namespaces=json.dumps(list(namespaces)), created=timezone.now())
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, ''])
+
+
+def latest_event_id():
+    """
+    :return: The id of the newest event, or 0 if there are none
+    """
+    return InvalidationEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def poll_events(last_id):
+    """
+    Deliver events published since the given event, and remove events too old for any process to still need. Events
+    written in the last LOOKBACK_SECONDS are read again, as an event with a smaller id can commit after a larger one
+
+    :param last_id: The id of the last event delivered to this process
+    :return: The id of the last event delivered
+    """
+    global _last_cleanup
+    now = time.time()
+    for event_id, delivered in list(_recent_events.items()):
+        if delivered < now - LOOKBACK_SECONDS:
+            del _recent_events[event_id]
+
+    recent = timezone.now() - timedelta(seconds=LOOKBACK_SECONDS)
+    events = InvalidationEvent.objects.filter(Q(id__gt=last_id) | Q(created__gte=recent))\
+        .exclude(id__in=list(_recent_events)).order_by('id')
+    for event in events:
+        deliver(json.loads(event.namespaces))
+        _recent_events[event.id] = now
+        last_id = max(last_id, event.id)
+
+    if _last_cleanup < now - CLEANUP_INTERVAL:
+        _last_cleanup = now
+        InvalidationEvent.objects.filter(
+            created__lt=timezone.now() - timedelta(seconds=settings.INVALIDATION_EVENT_RETENTION)).delete()
+    return last_id
+
+
+def listen_postgresql():
+    """
+    Deliver events whenever NOTIFY says new ones were written, using a dedicated connection to the primary database
+    """
+    global _last_event_id
+    database = connections['default']
+    listener = database.get_new_connection(database.get_connection_params())
+    listener.autocommit = True
+    try:
+        with listener.cursor() as cursor:
+            cursor.execute('LISTEN ' + CHANNEL)
+        while True:
+            # Catch up on events written while not listening, then wait for the next ones
+            _last_event_id = poll_events(_last_event_id)
+            connection.close()
+            while select.select([listener], [], [], settings.INVALIDATION_POLL_INTERVAL * 5) == ([], [], []):
+                pass
+            listener.poll()
+            del listener.notifies[:]
+    finally:
+        listener.close()
+
+
+def listen_polling():
+    """
+    Deliver events from the InvalidationEvent table, checking for new ones every INVALIDATION_POLL_INTERVAL seconds
+    """
+    global _last_event_id
+    while True:
+        try:
+            _last_event_id = poll_events(_last_event_id)
+        finally:
+            connection.close()
+        time.sleep(settings.INVALIDATION_POLL_INTERVAL)
+
+
+def listen():
+    """
+    Receive events for as long as the process runs, reconnecting after database errors
+    """
+    global _last_event_id
+    while True:
+        try:
+            if _last_event_id is None:
+                # Only events published after the process started can be relevant to it
+                _last_event_id = latest_event_id()
+            if connections['default'].vendor == 'postgresql':
+                listen_postgresql()
+            else:
+                listen_polling()
+        except Exception:
+            logger.exception('Invalidation bus listener failed, reconnecting')
+            connection.close()
+            time.sleep(settings.INVALIDATION_POLL_INTERVAL)
+
+
+def start_listener():
+    """
+    Start receiving events from other processes in a background thread, once per process
+    """
+    global _listener
+    if _listener is None:
+        _listener = threading.Thread(target=listen, name='invalidation-bus', daemon=True)
+        _listener.start()
+
+
+def start_listener_for_server(sender, **kwargs):
+    """
+    Start the listener when a web server, including runserver, handles its first request. Requests made by the test
+    client do not start it
+
+    :param sender: The class of the handler handling the request
+    """
+    if isinstance(sender, type) and issubclass(sender, WSGIHandler):
+        start_listener()
@@ -0,0 +1,66 @@
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from base import compression
+
+WORDS = ('the', 'wire', 'new', 'today', 'just', 'great', 'coffee', 'code', 'django', 'python', 'release', 'bug',
+         'fixed', 'deploy', 'friday', 'weekend', 'music', 'game', 'news', 'thanks', 'everyone', 'follow', 'love')
+
+
+def feed_payload(size, seed=0):
+    """
+    :param size: The number of messages in the feed
+    :param seed: Seed for the random message texts, so runs can be compared
+    :return: The JSON of a feed shaped like the ones get_messages returns
+    """
+    generator = random.Random(seed)
+    start = datetime(2018, 1, 1, tzinfo=timezone.utc)
+    messages = [{
+        'id': 1000 + number,
+        'message_text': ' '.join(generator.choice(WORDS) for word in range(generator.randint(3, 30))),
+        'created': start + timedelta(seconds=generator.randint(0, 10 ** 7)),
+        'user': generator.randint(1, 500),
+    } for number in range(size)]
+    return json.dumps(messages, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+class Command(BaseCommand):
+    help = 'Measure the CPU cost and the bytes saved by compressing typical feed payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200, 1000],
+                            help='The numbers of messages in the feeds to compress')
+        parser.add_argument('--repeat', type=int, default=20, help='The number of times to compress each feed')
+
+    def handle(self, *args, **options):
+        """
+        Compress feeds of several sizes at several levels and report the compressed size and the time taken
+
+        :param args: unused
+        :param options: sizes and repeat
+        """
+        settings_to_try = [('gzip', 'GZIP_LEVEL', level) for level in (1, 6, 9)]
+        if compression.brotli:
+            settings_to_try += [('br', 'BROTLI_QUALITY', quality) for quality in (1, 4, 6, 11)]
+        else:
+            self.stdout.write('brotli is not installed, only gzip is measured')
+
+        row = '{:>8} {:>10} {:>6} {:>10} {:>10} {:>7} {:>10} {:>8}'
+        self.stdout.write(row.format('messages', 'bytes', 'codec', 'level', 'compressed', 'ratio', 'ms', 'MB/s'))
+        for size in options['sizes']:
+            payload = feed_payload(size)
+            for encoding, option, level in settings_to_try:
+                compression_options = dict(settings.COMPRESSION, **{option: level})
+                start = time.perf_counter()
+                for repeat in range(options['repeat']):
+                    compressed = compression.compress(payload, encoding, compression_options)
+                seconds = (time.perf_counter() - start) / options['repeat']
+                self.stdout.write(row.format(
+                    size, len(payload), encoding, level, len(compressed),
+                    '{:.2f}'.format(len(payload) / len(compressed)), '{:.3f}'.format(seconds * 1000),
+                    '{:.1f}'.format(len(payload) / seconds / 10 ** 6),
+                ))
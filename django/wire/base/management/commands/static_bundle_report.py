@@ -0,0 +1,56 @@
+import gzip
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand
+from base import bundles
+
+# The bundles each page includes
+PAGES = {
+    'home': ['bundles/global.css', 'bundles/global.js', 'bundles/home.js'],
+    'profile': ['bundles/global.css', 'bundles/profile.css', 'bundles/global.js', 'bundles/profile.js'],
+    'current profile': ['bundles/global.css', 'bundles/profile.css', 'bundles/global.js',
+                        'bundles/current_profile.js'],
+    'search results': ['bundles/global.css', 'bundles/global.js', 'bundles/search.js'],
+    'other pages': ['bundles/global.css', 'bundles/global.js'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Report the static file requests and bytes of each page, with and without bundling'
+
+    def handle(self, *args, **options):
+        """
+        Compare loading the files of each page one by one with loading its bundles, precompressed with gzip
+
+        :param args: unused
+        :param options: unused
+        """
+        for missing in bundles.missing_packages():
+            self.stderr.write(self.style.WARNING('Not installed: {}'.format(missing)))
+
+        sizes = {}
+        for bundle, sources in settings.STATIC_BUNDLES.items():
+            for source in sources:
+                with open(finders.find(source), 'rb') as source_file:
+                    sizes[source] = self.measure(source_file.read())
+            sizes[bundle] = self.measure(bundles.build_bundle(bundle).encode('utf-8'))
+
+        row = '{:<16} {:>8} {:>12} {:>12} {:>8} {:>12} {:>12}'
+        self.stdout.write(row.format('page', 'requests', 'bytes', 'gzip bytes', 'requests', 'bytes', 'gzip bytes'))
+        self.stdout.write(row.format('', 'before', 'before', 'before', 'after', 'after', 'after'))
+        for page, page_bundles in PAGES.items():
+            before = [source for bundle in page_bundles for source in settings.STATIC_BUNDLES[bundle]]
+            self.stdout.write(row.format(
+                page,
+                len(before), sum(sizes[source][0] for source in before), sum(sizes[source][1] for source in before),
+                len(page_bundles), sum(sizes[bundle][0] for bundle in page_bundles),
+                sum(sizes[bundle][1] for bundle in page_bundles),
+            ))
+
+    @staticmethod
+    def measure(content):
+        """
+        :param content: The bytes of a file
+        :return: The size of the file and its size compressed with gzip
+        """
+        return len(content), len(gzip.compress(content, 9))
@@ -0,0 +1,106 @@
+"""
+A lean path through the middleware for public read endpoints.
+
+Views decorated with public_read only return public data in JSON, so GET requests to them skip loading the session,
+the logged in user and flash messages. They never read or write the session, so they make no session or user queries
+and never set a session cookie. They are not exempt from CSRF protection, which costs nothing
+for GET and HEAD requests, so requests to them with other methods are checked as usual.
+
+Every other request resolves the logged in user from the cache. The fields most views need are cached under the user
+id and the session's auth hash, and invalidated whenever the user is saved or deleted, so changing the password or
+the profile takes effect straight away. Other fields are loaded from the database only if they are used.
+"""
+from functools import wraps
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.urls import Resolver404, resolve
+from django.utils.functional import SimpleLazyObject
+from .cache import cached_query
+
+# In the order of the model's fields, as User.from_db expects
+CACHED_USER_FIELDS = ('id', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff', 'is_active')
+
+
+def public_read(view):
+    """
+    Mark a view as returning the same public data to everyone, so GET requests to it take the lean path
+
+    :param view: The view function to decorate
+    :return: The decorated view
+    """
+    @wraps(view)
+    def wrapped_view(request, *args, **kwargs):
+        return view(request, *args, **kwargs)
+    wrapped_view.public_read = True
+    return wrapped_view
+
+
+def is_public_read(request):
+    """
+    :param request: The current request
+    :return: True if the request is a GET or HEAD request to a view decorated with public_read
+    """
+    if not hasattr(request, 'public_read'):
+        try:
+            view = resolve(request.path_info).func
+        except Resolver404:
+            view = None
+        request.public_read = request.method in ('GET', 'HEAD') and getattr(view, 'public_read', False)
+    return request.public_read
+
+
+# Django's process_response methods do nothing for requests without a session or message storage, so only
+# process_request needs to be skipped
+class LeanSessionMiddleware(SessionMiddleware):
+    def process_request(self, request):
+        if not is_public_read(request):
+            super().process_request(request)
+
+
+def get_cached_user(request):
+    """
+    Get the user logged in to the session, from the cache when possible
+
+    :param request: The current request
+    :return: The logged in user, or an AnonymousUser
+    """
+    try:
+        user_id = int(request.session[auth.SESSION_KEY])
+        session_hash = request.session[auth.HASH_SESSION_KEY]
+    except (KeyError, ValueError):
+        return auth.get_user(request)
+
+    loaded = []
+
+    def load_user():
+        # Verifies the session's auth hash, and flushes the session if it does not match
+        user = auth.get_user(request)
+        loaded.append(user)
+        if not user.is_authenticated:
+            return None
+        return [getattr(user, field) for field in CACHED_USER_FIELDS]
+
+    values = cached_query('auth_user:{}:{}'.format(user_id, session_hash), ['user:{}'.format(user_id)], load_user)
+    if loaded:
+        return loaded[0]
+    if values is None:
+        request.session.flush()
+        return AnonymousUser()
+    return User.from_db('default', CACHED_USER_FIELDS, values)
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        if is_public_read(request):
+            request.user = AnonymousUser()
+        else:
+            request.user = SimpleLazyObject(lambda: get_cached_user(request))
+
+
+class LeanMessageMiddleware(MessageMiddleware):
+    def process_request(self, request):
+        if not is_public_read(request):
+            super().process_request(request)
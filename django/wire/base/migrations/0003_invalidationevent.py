@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('base', '0002_delete_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvalidationEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('namespaces', models.TextField()),
+                ('created', models.DateTimeField(verbose_name='created')),
+            ],
+        ),
+    ]
@@ -1 +1,9 @@
 from django.db import models
+
+
+class InvalidationEvent(models.Model):
+    """
+    An invalidation bus event, for databases without LISTEN/NOTIFY. See base/invalidation.py
+    """
+    namespaces = models.TextField()
+    created = models.DateTimeField('created')
@@ -0,0 +1,84 @@
+"""
+Full page caching for anonymous visitors.
+
+Pages that look the same to every anonymous visitor are cached whole, under the surrogate keys of the data they show,
+such as 'page:home' or 'page:user:5'. Surrogate keys are namespaces of the versioned cache in base/cache.py, so purging
+a key through the invalidation bus makes every page tagged with it unreachable in every process. Cached responses carry
+a Surrogate-Key header and a shared max age, so a CDN or reverse proxy in front of the site can cache them too, and
+SURROGATE_PURGE_HANDLER is called with the purged keys so it can be told to drop them.
+"""
+from functools import wraps
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.template.response import SimpleTemplateResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.module_loading import import_string
+from . import invalidation
+from .cache import versioned_key
+
+
+def purge(*surrogate_keys):
+    """
+    Drop every cached page tagged with one of the given surrogate keys, here and in any HTTP cache in front of the site
+
+    :param surrogate_keys: The surrogate keys of the data that changed
+    """
+    invalidation.publish(*surrogate_keys)
+    if settings.SURROGATE_PURGE_HANDLER:
+        handler = import_string(settings.SURROGATE_PURGE_HANDLER)
+        transaction.on_commit(lambda: handler(list(surrogate_keys)))
+
+
+def is_cacheable(request):
+    """
+    :param request: The current request
+    :return: True if the page shown for this request is the same for every anonymous visitor
+    """
+    return (request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+            and len(messages.get_messages(request)) == 0)
+
+
+def add_surrogate_headers(response, surrogate_keys):
+    """
+    Let HTTP caches in front of the site cache the response until it is purged
+
+    :param response: The response for an anonymous visitor
+    :param surrogate_keys: The surrogate keys the response is tagged with
+    """
+    response['Surrogate-Key'] = ' '.join(surrogate_keys)
+    patch_cache_control(response, public=True, max_age=0, s_maxage=settings.PAGE_CACHE_TIMEOUT)
+    patch_vary_headers(response, ['Cookie'])
+
+
+def cache_anonymous_page(get_surrogate_keys):
+    """
+    Cache the responses of a view for anonymous visitors
+
+    :param get_surrogate_keys: Function taking the view's arguments and returning the surrogate keys of the page, or
+        None if the page should not be cached
+    :return: The view decorator
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped_view(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return view(request, *args, **kwargs)
+            surrogate_keys = get_surrogate_keys(request, *args, **kwargs)
+            if surrogate_keys is None:
+                return view(request, *args, **kwargs)
+
+            key = versioned_key('page:' + request.path, surrogate_keys)
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if isinstance(response, SimpleTemplateResponse):
+                    response.render()
+                add_surrogate_headers(response, surrogate_keys)
+                cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapped_view
+    return decorator
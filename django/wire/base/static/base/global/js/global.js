@@ -46,3 +46,94 @@ function formatUserList(username, buttonName, buttonType = 'default') {
 
     return userHTML
 }
+
+
+/*
+Real user timings, counted into histograms on the server by base/timing.py.
+
+Records how long the page took to load, and how long each AJAX call made
+with jQuery took along with the server's share of it from the Server-Timing
+header. Timings are sent in batches with navigator.sendBeacon, once
+BATCH_SIZE calls have been recorded and whenever the page is hidden or left.
+*/
+var wireTimings = (function() {
+    var BEACON_URL = "/timings";
+    var BATCH_SIZE = 10;
+    var navigation = null;
+    var ajax = [];
+
+    if (!window.performance || !navigator.sendBeacon) {
+        return {send: function() {}};
+    }
+
+    /*
+    @param header: The Server-Timing header of a response
+
+    @return Number: The milliseconds the server spent on the response, or null
+    */
+    function serverDuration(header) {
+        var match = /(?:^|,)\s*app;dur=([\d.]+)/.exec(header || "");
+        return match ? parseFloat(match[1]) : null;
+    }
+
+    function send() {
+        if (navigation === null && ajax.length === 0) {
+            return;
+        }
+        navigator.sendBeacon(BEACON_URL, JSON.stringify({navigation: navigation, ajax: ajax}));
+        navigation = null;
+        ajax = [];
+    }
+
+    function recordNavigation() {
+        var entries = performance.getEntriesByType ? performance.getEntriesByType("navigation") : [];
+        if (entries.length !== 0) {
+            navigation = {
+                page: location.pathname,
+                ttfb: entries[0].responseStart,
+                dom_ready: entries[0].domContentLoadedEventEnd,
+                load: entries[0].loadEventEnd
+            };
+        } else if (performance.timing) {
+            var timing = performance.timing;
+            navigation = {
+                page: location.pathname,
+                ttfb: timing.responseStart - timing.navigationStart,
+                dom_ready: timing.domContentLoadedEventEnd - timing.navigationStart,
+                load: timing.loadEventEnd - timing.navigationStart
+            };
+        }
+    }
+
+    $(document).ajaxSend(function(event, jqXHR) {
+        jqXHR.timingStart = performance.now();
+    });
+
+    $(document).ajaxComplete(function(event, jqXHR, ajaxSettings) {
+        if (jqXHR.timingStart === undefined) {
+            return;
+        }
+        ajax.push({
+            url: ajaxSettings.url,
+            duration: performance.now() - jqXHR.timingStart,
+            server: serverDuration(jqXHR.getResponseHeader("Server-Timing"))
+        });
+        if (ajax.length >= BATCH_SIZE) {
+            send();
+        }
+    });
+
+    // loadEventEnd is only set once every load handler has returned
+    $(window).on("load", function() {
+        setTimeout(recordNavigation, 0);
+    });
+
+    document.addEventListener("visibilitychange", function() {
+        if (document.visibilityState === "hidden") {
+            send();
+        }
+    });
+    window.addEventListener("pagehide", send);
+
+    return {send: send};
+})();
@@ -0,0 +1,32 @@
+/*
+Checks whether the username typed on the sign up form is still free, once
+typing pauses for DELAY milliseconds, and shows the answer under the field.
+Only the answer for the latest username typed is shown.
+*/
+$(document).ready(function() {
+    var DELAY = 300;
+    var usernameInput = $('#signup-username');
+    var feedback = $('#username-feedback');
+    var timer = null;
+
+    usernameInput.on('input', function() {
+        clearTimeout(timer);
+        feedback.text('').removeClass('text-success text-danger');
+        var username = usernameInput.val();
+        if (!username) {
+            return;
+        }
+        timer = setTimeout(function() {
+            $.getJSON('/username-available', {username: username}, function(response) {
+                if (usernameInput.val() !== username || !response.success) {
+                    return;
+                }
+                if (response.available) {
+                    feedback.text(username + ' is available').addClass('text-success');
+                } else {
+                    feedback.text(username + ' is already taken').addClass('text-danger');
+                }
+            });
+        }, DELAY);
+    });
+});
@@ -0,0 +1,58 @@
+"""
+Static files storage that bundles, content hashes and precompresses static files when collectstatic runs.
+
+Every file gets a copy named after the hash of its contents, so the collected files can be served with far future,
+immutable caching. Bundles from STATIC_BUNDLES are built before hashing, see base/bundles.py, and gzip and brotli
+copies of text files are written next to the hashed files for the web server to serve as they are.
+"""
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from . import bundles
+
+
+class BundlingStaticFilesStorage(ManifestStaticFilesStorage):
+    def replace(self, name, content):
+        """
+        Save a file, overwriting any existing file with the same name
+
+        :param name: The path of the file
+        :param content: The bytes to save
+        """
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(content))
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = paths.copy()
+            for bundle in settings.STATIC_BUNDLES:
+                self.replace(bundle, bundles.build_bundle(bundle).encode('utf-8'))
+                paths[bundle] = (self, bundle)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        if not dry_run:
+            for name in set(self.hashed_files.values()):
+                if name.endswith(bundles.PRECOMPRESSED_EXTENSIONS):
+                    with self.open(name) as hashed_file:
+                        content = hashed_file.read()
+                    for extension, compressed in bundles.precompress(content).items():
+                        if len(compressed) < len(content):
+                            self.replace(name + extension, compressed)
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            # CSS can refer to files that do not exist, such as the woff2 font bootstrap 3 lists. Keep those references
+            # as they are rather than failing collectstatic
+            return name
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            # Nothing has been collected, such as when running the tests, so use the files under their own names
+            return name
+        return super().stored_name(name)
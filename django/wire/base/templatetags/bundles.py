@@ -0,0 +1,33 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+SCRIPT_TAG = '<script type="text/javascript" src="{}"></script>'
+STYLESHEET_TAG = '<link rel="stylesheet" type="text/css" href="{}" />'
+
+
+def is_built(bundle):
+    """
+    :param bundle: The path of a bundle in STATIC_BUNDLES
+    :return: True if collectstatic has built the bundle
+    """
+    return staticfiles_storage.hash_key(bundle) in getattr(staticfiles_storage, 'hashed_files', {})
+
+
+@register.simple_tag
+def bundle(name):
+    """
+    Include a bundle from STATIC_BUNDLES. Before collectstatic has built it, such as on the development server, the
+    files it is made of are included one by one instead
+
+    :param name: The path of the bundle
+    :return: The script or stylesheet tags
+    """
+    paths = [name] if is_built(name) else settings.STATIC_BUNDLES[name]
+    tag = SCRIPT_TAG if name.endswith('.js') else STYLESHEET_TAG
+    return mark_safe('\n'.join(format_html(tag, static(path)) for path in paths))
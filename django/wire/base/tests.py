@@ -1,9 +1,28 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.test import Client, SimpleTestCase, TestCase
 from django.test import TransactionTestCase
+from django.test import RequestFactory, override_settings
+from django.test.client import ClientHandler
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.cache import cache as django_cache
+from django.db import DatabaseError
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
 from wire_profile.models import Follow, Message
+from wire_profile.views import get_user_by_username
+from wire import routers
+from base import bloom, bundles, cache, compression, invalidation, timing
+from base.middleware import get_cached_user
+from base.models import InvalidationEvent
 
 
 class RegisterViewTests(TransactionTestCase):
@@ -539,3 +558,644 @@ class HomeViewTest(TestCase):
         self.assertIn('hello #fam', l_t_messages)
         self.assertIn('hello #tam', l_t_messages)
         self.assertIn('hello #lam', l_t_messages)
+
+
+class ReplicaRouterTest(TestCase):
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_reads_go_to_replicas_unless_pinned(self):
+        router = routers.ReplicaRouter()
+
+        self.assertEqual(router.db_for_read(Message), 'replica')
+        self.assertEqual(router.db_for_write(Message), 'default')
+        with routers.pinned_to_primary():
+            self.assertEqual(router.db_for_read(Message), 'default')
+        self.assertEqual(router.db_for_read(Message), 'replica')
+
+    def test_reads_go_to_primary_without_replicas(self):
+        self.assertEqual(routers.ReplicaRouter().db_for_read(Message), 'default')
+
+    @override_settings(REPLICA_DATABASES=['default'])
+    def test_client_pinned_after_write(self):
+        User.objects.create_user('testfoo', 'test@test.com', 'test')
+        User.objects.create_user('test2', 'test2@test.com', 'test')
+
+        response = self.client.get(reverse('base:home'))
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+        self.client.post(reverse('base:verify'), {'username': 'testfoo', 'password': 'test'})
+        response = self.client.get(reverse('wire_profile:follow_user', kwargs={'username': 'test2'}))
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_DATABASES=['default'])
+    def test_beacons_do_not_pin_client(self):
+        response = self.client.post(reverse('base:timings'), '{}', content_type='text/plain')
+
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_cache_filled_from_primary_after_change(self):
+        django_cache.clear()
+        databases = []
+
+        def compute():
+            databases.append(routers.ReplicaRouter().db_for_read(Message))
+            return databases[-1]
+
+        cache.cached_query('replica_test', ['test:replica'], compute)
+        cache.bump('test:replica')
+        cache.cached_query('replica_test', ['test:replica'], compute)
+
+        self.assertEqual(databases, ['replica', 'default'])
+
+
+class VersionedCacheTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+    def test_cached_query_recomputed_after_bump(self):
+        results = iter(['first', 'second'])
+
+        self.assertEqual(cache.cached_query('test_query', ['test'], lambda: next(results)), 'first')
+        self.assertEqual(cache.cached_query('test_query', ['test'], lambda: next(results)), 'first')
+        cache.bump('test')
+        self.assertEqual(cache.cached_query('test_query', ['test'], lambda: next(results)), 'second')
+
+    def test_bump_only_affects_its_namespace(self):
+        before = cache.generations(['test:a', 'test:b'])
+        cache.bump('test:a')
+        after = cache.generations(['test:a', 'test:b'])
+
+        self.assertEqual(after['test:a'], before['test:a'] + 1)
+        self.assertEqual(after['test:b'], before['test:b'])
+
+    def test_cached_followers_invalidated_by_follow(self):
+        user = User.objects.create_user('testfoo', 'test@test.com', 'test')
+        user2 = User.objects.create_user('test2', 'test2@test.com', 'test')
+        url = reverse('wire_profile:get_followers', kwargs={'username': user2.username})
+
+        self.assertEqual(self.client.get(url).json(), [])
+        Follow.objects.create(follower_id=user, following_id=user2)
+        self.assertEqual(self.client.get(url).json(), [{'follower_id': user.id, 'following_id': user2.id}])
+        Follow.objects.all().delete()
+        self.assertEqual(self.client.get(url).json(), [])
+
+    def test_cached_home_page_invalidated_by_bulk_create(self):
+        user = User.objects.create_user('testfoo', 'test@test.com', 'test')
+        self.client.post(reverse('base:verify'), {'username': user.username, 'password': 'test'})
+
+        self.client.get(reverse('base:home'))
+        self.client.post(reverse('wire_profile:bulk_create_messages'), '{"messages": ["hello #bulk"]}',
+                         content_type='application/json')
+        response = self.client.get(reverse('base:home'))
+
+        self.assertIn('hello #bulk', [message.message_text for message in response.context['latest_tagged_messages']])
+
+
+class CacheStampedeTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+    def test_hits_and_misses_counted(self):
+        cache.cached_query('test_query', ['test'], lambda: 'value')
+        cache.cached_query('test_query', ['test'], lambda: 'value')
+
+        self.assertEqual(cache.cache_stats()['misses'], 1)
+        self.assertEqual(cache.cache_stats()['hits'], 1)
+
+    def test_stale_value_served_while_another_process_recomputes(self):
+        key = cache.versioned_key('test_query', ['test'])
+        django_cache.set(key, ('stale', time.time() - 1, 0.01), 60)
+        django_cache.add('lock:' + key, True, 10)
+
+        self.assertEqual(cache.cached_query('test_query', ['test'], lambda: 'fresh'), 'stale')
+        self.assertEqual(cache.cache_stats()['stale'], 1)
+
+        django_cache.delete('lock:' + key)
+        self.assertEqual(cache.cached_query('test_query', ['test'], lambda: 'fresh'), 'fresh')
+        self.assertEqual(cache.cached_query('test_query', ['test'], lambda: 'newer'), 'fresh')
+
+    @override_settings(QUERY_CACHE_EARLY_REFRESH_BETA=1000000)
+    def test_slow_queries_refreshed_before_they_expire(self):
+        key = cache.versioned_key('test_query', ['test'])
+        django_cache.set(key, ('old', time.time() + 30, 1), 60)
+
+        self.assertEqual(cache.cached_query('test_query', ['test'], lambda: 'refreshed'), 'refreshed')
+        self.assertEqual(cache.cache_stats()['refreshes'], 1)
+
+    def test_cache_stats_only_for_staff(self):
+        User.objects.create_user('testfoo', 'test@test.com', 'test')
+        User.objects.create_user('staff', 'staff@test.com', 'test', is_staff=True)
+
+        self.client.post(reverse('base:verify'), {'username': 'testfoo', 'password': 'test'})
+        self.assertEqual(self.client.get(reverse('base:cache_stats')).json()['success'], False)
+
+        self.client.post(reverse('base:verify'), {'username': 'staff', 'password': 'test'})
+        self.assertIn('hits', self.client.get(reverse('base:cache_stats')).json())
+
+
+class LocalCacheTest(SimpleTestCase):
+    def test_entries_dropped_when_namespace_invalidated(self):
+        local_cache = cache.LocalCache(60)
+        local_cache.set('foo', 'foo value', ['test:foo'])
+        local_cache.set('bar', 'bar value', ['test:bar'])
+
+        invalidation.deliver(['test:foo'])
+
+        self.assertIsNone(local_cache.get('foo'))
+        self.assertEqual(local_cache.get('bar'), 'bar value')
+
+    def test_entries_expire(self):
+        local_cache = cache.LocalCache(-1)
+        local_cache.set('foo', 'foo value', ['test:foo'])
+
+        self.assertIsNone(local_cache.get('foo'))
+
+
+class InvalidationBusTest(TestCase):
+    def setUp(self):
+        invalidation._recent_events.clear()
+
+    def test_publish_invalidates_this_process_straight_away(self):
+        before = cache.generations(['test'])['test']
+        invalidation.publish('test')
+
+        self.assertEqual(cache.generations(['test'])['test'], before + 1)
+
+    def test_shared_state_only_updated_by_publisher(self):
+        published = []
+        invalidation.subscribe(published.append, remote=False)
+        self.addCleanup(invalidation._publish_handlers.remove, published.append)
+
+        invalidation.publish('test:published')
+        invalidation.deliver(['test:remote'])
+
+        self.assertEqual(published, [('test:published',)])
+        self.assertFalse(cache.is_shared())
+
+    def test_polled_events_delivered(self):
+        delivered = []
+        invalidation.subscribe(delivered.append)
+        self.addCleanup(invalidation._handlers.remove, delivered.append)
+
+        last_id = invalidation.poll_events(0)
+        invalidation.broadcast(['test:foo', 'test:bar'])
+        last_id = invalidation.poll_events(last_id)
+        invalidation.poll_events(last_id)
+
+        self.assertEqual(delivered, [['test:foo', 'test:bar']])
+        self.assertEqual(InvalidationEvent.objects.count(), 1)
+
+    def test_events_larger_than_a_notify_payload_delivered(self):
+        delivered = []
+        invalidation.subscribe(delivered.append)
+        self.addCleanup(invalidation._handlers.remove, delivered.append)
+        namespaces = ['follows:user:{}'.format(user_id) for user_id in range(10000)]
+
+        last_id = invalidation.poll_events(0)
+        invalidation.broadcast(namespaces)
+        invalidation.poll_events(last_id)
+
+        self.assertEqual(delivered, [namespaces])
+
+    def test_events_committed_out_of_order_delivered(self):
+        delivered = []
+        invalidation.subscribe(delivered.append)
+        self.addCleanup(invalidation._handlers.remove, delivered.append)
+
+        invalidation.broadcast(['test:later'])
+        # An event with a smaller id that only becomes visible after the later one was read
+        earlier = InvalidationEvent.objects.get()
+        last_id = invalidation.poll_events(earlier.id - 1)
+        InvalidationEvent.objects.create(id=earlier.id - 1, namespaces='["test:earlier"]', created=earlier.created)
+        invalidation.poll_events(last_id)
+
+        self.assertEqual(delivered, [['test:later'], ['test:earlier']])
+
+    def test_failed_broadcast_logged(self):
+        with mock.patch.object(invalidation, 'broadcast', side_effect=DatabaseError), \
+                self.assertLogs('base.invalidation', 'ERROR'):
+            invalidation.broadcast_committed(['test'])
+
+    def test_listener_started_by_web_servers_only(self):
+        with mock.patch.object(invalidation, 'start_listener') as start_listener:
+            invalidation.start_listener_for_server(ClientHandler)
+            start_listener.assert_not_called()
+            invalidation.start_listener_for_server(WSGIHandler)
+            start_listener.assert_called_once_with()
+
+
+class PublicReadTest(TestCase):
+    def setUp(self):
+        User.objects.create_user('foo', 'test@test.com', 'test')
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+
+    def test_public_read_skips_session_and_user(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('wire_profile:get_user_id', kwargs={'user_id': 1}))
+
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_other_views_load_session_and_user(self):
+        response = self.client.get(reverse('wire_profile:get_profile_data', kwargs={'username': 'foo'}))
+
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    def test_only_safe_methods_take_lean_path(self):
+        response = self.client.post(reverse('wire_profile:get_user_id', kwargs={'user_id': 1}))
+
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    def test_csrf_checked_for_unsafe_methods(self):
+        client = Client(enforce_csrf_checks=True)
+        url = reverse('wire_profile:get_user_id', kwargs={'user_id': 1})
+
+        self.assertEqual(client.get(url).status_code, 200)
+        self.assertEqual(client.post(url).status_code, 403)
+
+
+class CachedUserTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = User.objects.create_user('foo', 'test@test.com', 'test')
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+
+    def get_request(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        return request
+
+    def test_user_cached_after_first_request(self):
+        request = self.get_request()
+        with self.assertNumQueries(1):
+            get_cached_user(request)
+        request = self.get_request()
+        with self.assertNumQueries(0):
+            user = get_cached_user(request)
+
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(user.username, 'foo')
+        self.assertTrue(user.is_authenticated)
+
+    def test_profile_change_invalidates_user(self):
+        get_cached_user(self.get_request())
+        self.user.email = 'changed@test.com'
+        self.user.save()
+
+        self.assertEqual(get_cached_user(self.get_request()).email, 'changed@test.com')
+
+    def test_password_change_logs_out(self):
+        get_cached_user(self.get_request())
+        self.user.set_password('changed')
+        self.user.save()
+
+        self.assertFalse(get_cached_user(self.get_request()).is_authenticated)
+        self.assertFalse(get_cached_user(self.get_request()).is_authenticated)
+
+    def test_only_public_changes_invalidate_every_user(self):
+        user_namespace = 'user:{}'.format(self.user.id)
+        namespaces = ['users', user_namespace]
+        before = cache.generations(namespaces)
+        self.client.login(username='foo', password='test')
+        after_login = cache.generations(namespaces)
+        self.user.email = 'changed@test.com'
+        self.user.save()
+        after_email = cache.generations(namespaces)
+        self.user.username = 'renamed'
+        self.user.save()
+        after_rename = cache.generations(namespaces)
+
+        self.assertEqual(after_login, before)
+        self.assertEqual(after_email, {'users': before['users'], user_namespace: before[user_namespace] + 1})
+        self.assertEqual(after_rename['users'], before['users'] + 1)
+
+    def test_anonymous_session(self):
+        self.client.logout()
+        request = self.get_request()
+
+        with self.assertNumQueries(0):
+            self.assertFalse(get_cached_user(request).is_authenticated)
+
+
+purged_keys = []
+
+
+def record_purge(surrogate_keys):
+    purged_keys.append(surrogate_keys)
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = User.objects.create_user('foo', 'test@test.com', 'test')
+
+    def test_anonymous_home_page_cached(self):
+        response = self.client.get(reverse('base:home'))
+        self.assertEqual(response['Surrogate-Key'], 'page:home')
+        self.assertIn('s-maxage=60', response['Cache-Control'])
+
+        response = self.client.get(reverse('base:home'))
+        self.assertIsNone(response.context)
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_message_purges_pages(self):
+        self.client.get(reverse('base:home'))
+        self.client.get(reverse('wire_profile:profile', kwargs={'username': 'foo'}))
+        Message.objects.create(message_text='barbar', created=timezone.now(), user=self.user)
+
+        self.assertIn('barbar', self.client.get(reverse('base:home')).content.decode())
+        response = self.client.get(reverse('wire_profile:profile', kwargs={'username': 'foo'}))
+        self.assertIn('barbar', response.content.decode())
+
+    def test_follow_purges_only_affected_profiles(self):
+        User.objects.create_user('bar', 'bar@test.com', 'test')
+        User.objects.create_user('baz', 'baz@test.com', 'test')
+        for username in ['foo', 'bar', 'baz']:
+            self.client.get(reverse('wire_profile:profile', kwargs={'username': username}))
+        Follow.objects.create(follower_id=self.user, following_id=User.objects.get(username='bar'))
+
+        for username, purged in [('foo', True), ('bar', True), ('baz', False)]:
+            response = self.client.get(reverse('wire_profile:profile', kwargs={'username': username}))
+            self.assertEqual(response.context is not None, purged)
+
+    def test_logged_in_users_not_cached(self):
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+        response = self.client.get(reverse('base:home'))
+
+        self.assertNotIn('Surrogate-Key', response)
+        self.assertIsNotNone(self.client.get(reverse('base:home')).context)
+
+    def test_missing_profile_not_cached(self):
+        response = self.client.get(reverse('wire_profile:profile', kwargs={'username': 'missing'}))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('Surrogate-Key', response)
+
+
+class SurrogatePurgeTest(TransactionTestCase):
+    @override_settings(SURROGATE_PURGE_HANDLER='base.tests.record_purge')
+    def test_purge_handler_called_after_commit(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        del purged_keys[:]
+        Message.objects.create(message_text='barbar', created=timezone.now(), user=user)
+
+        self.assertEqual(purged_keys, [['page:home', 'page:user:{}'.format(user.id)]])
+
+
+class StaticBundleTest(SimpleTestCase):
+    def test_css_urls_rewritten_for_bundle_directory(self):
+        css = 'a{background:url(../fonts/a.woff)} b{background:url("/abs.png")} c{background:url(data:image/png;x)}'
+
+        self.assertEqual(bundles.rewrite_css_urls(css, 'base/bootstrap/css/bootstrap.css', 'bundles/global.css'),
+                         'a{background:url(../base/bootstrap/fonts/a.woff)} b{background:url("/abs.png")} '
+                         'c{background:url(data:image/png;x)}')
+
+    def test_bundle_concatenates_sources(self):
+        contents = {'a.js': 'var a = 1\n//# sourceMappingURL=a.js.map', 'b.js': 'var b = 2;'}
+        with override_settings(STATIC_BUNDLES={'bundles/test.js': ['a.js', 'b.js']}):
+            self.assertEqual(bundles.build_bundle('bundles/test.js', read=contents.get), 'var a = 1;\nvar b = 2;\n')
+
+    def test_sources_included_until_collected(self):
+        response = self.client.get(reverse('base:login'))
+
+        self.assertContains(response, '/static/base/global/js/global.js')
+        self.assertNotContains(response, '/static/bundles/global.js')
+
+    def test_collectstatic_builds_hashed_and_compressed_bundles(self):
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        with override_settings(STATIC_ROOT=static_root.name):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            response = self.client.get(reverse('base:login'))
+
+        self.assertNotContains(response, '/static/base/global/js/global.js')
+        bundle = [name for name in os.listdir(os.path.join(static_root.name, 'bundles'))
+                  if name.startswith('global.') and name.endswith('.js')]
+        self.assertIn('global.js', bundle)
+        self.assertEqual(len(bundle), 2)
+        hashed = [name for name in bundle if name != 'global.js'][0]
+        self.assertContains(response, '/static/bundles/' + hashed)
+        self.assertTrue(os.path.exists(os.path.join(static_root.name, 'bundles', hashed + '.gz')))
+
+    def test_report_warns_without_minifier(self):
+        stdout = StringIO()
+        stderr = StringIO()
+        with mock.patch.object(bundles, 'rjsmin', None):
+            call_command('static_bundle_report', stdout=stdout, stderr=stderr)
+
+        self.assertIn('rjsmin, JavaScript is not minified', stderr.getvalue())
+
+
+class CompressionTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.payload = [{'id': message_id, 'message_text': 'message number {}'.format(message_id)}
+                        for message_id in range(100)]
+
+    def respond(self, response, accept_encoding='gzip, deflate', **options):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        if options:
+            request.compression_options = options
+        return compression.CompressionMiddleware(lambda request: response)(request)
+
+    def test_negotiates_encoding(self):
+        self.assertEqual(compression.choose_encoding('gzip;q=0.5, deflate'), 'gzip')
+        self.assertIsNone(compression.choose_encoding('gzip;q=0, identity'))
+        self.assertIsNone(compression.choose_encoding(''))
+        self.assertEqual(compression.choose_encoding('br, gzip'), 'br' if compression.brotli else 'gzip')
+
+    def test_large_json_compressed(self):
+        response = self.respond(JsonResponse(self.payload, safe=False))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(json.loads(gzip.decompress(response.content).decode()), self.payload)
+
+    def test_small_and_html_responses_left_alone(self):
+        small = self.respond(JsonResponse({'success': True}))
+        html = self.respond(HttpResponse('<p>hello</p>' * 200))
+
+        self.assertFalse(small.has_header('Content-Encoding'))
+        self.assertFalse(html.has_header('Content-Encoding'))
+
+    def test_not_compressed_without_accept_encoding(self):
+        response = self.respond(JsonResponse(self.payload, safe=False), accept_encoding='identity')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_streaming_compressed_chunk_by_chunk(self):
+        lines = (json.dumps(message).encode() + b'\n' for message in self.payload)
+        response = self.respond(StreamingHttpResponse(lines, content_type='application/x-ndjson'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        decompressed = gzip.decompress(b''.join(chunks)).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in decompressed], self.payload)
+
+    def test_per_route_options(self):
+        small = self.respond(JsonResponse({'message': 'hello ' * 50}), min_size=0)
+        disabled = self.respond(JsonResponse(self.payload, safe=False), enabled=False)
+
+        self.assertEqual(small['Content-Encoding'], 'gzip')
+        self.assertFalse(disabled.has_header('Content-Encoding'))
+
+    def test_feed_endpoint_compressed(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        Message.objects.bulk_create(Message(user=user, message_text='message number {}'.format(number),
+                                            created=timezone.now()) for number in range(50))
+
+        response = self.client.get(reverse('wire_profile:get_message', kwargs={'username': 'foo'}),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content).decode())), 50)
+
+
+class TimingTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        timing.known_series.clear()
+
+    def send_beacon(self, beacon):
+        return self.client.post(reverse('base:timings'), json.dumps(beacon), content_type='text/plain').json()
+
+    def test_server_timing_header_and_view_histogram(self):
+        response = self.client.get(reverse('base:login'))
+        stats = timing.timing_stats()
+
+        self.assertRegex(response['Server-Timing'], r'^app;dur=\d+\.\d$')
+        self.assertEqual(stats['view']['base:login']['count'], 1)
+        self.assertEqual(sum(stats['view']['base:login']['histogram'].values()), 1)
+
+    def test_beacon_counted_by_endpoint(self):
+        profile_data = reverse('wire_profile:get_profile_data', kwargs={'username': 'foo'})
+        response = self.send_beacon({
+            'navigation': {'page': reverse('wire_profile:profile', kwargs={'username': 'foo'}), 'ttfb': 40,
+                           'dom_ready': 300, 'load': 900},
+            'ajax': [{'url': profile_data + '?feed=following', 'duration': 200, 'server': 30},
+                     {'url': profile_data, 'duration': 600, 'server': None}],
+        })
+        stats = timing.timing_stats()
+
+        self.assertEqual(response, {'success': True, 'recorded': 5})
+        self.assertEqual(stats['ttfb']['wire_profile:profile']['histogram']['50'], 1)
+        self.assertEqual(stats['load']['wire_profile:profile']['p50'], '1000')
+        ajax = stats['ajax']['wire_profile:get_profile_data']
+        self.assertEqual((ajax['count'], ajax['mean'], ajax['p50'], ajax['p95']), (2, 400, '250', '1000'))
+        self.assertEqual(stats['ajax_server']['wire_profile:get_profile_data']['count'], 1)
+        self.assertEqual(stats['ajax_network']['wire_profile:get_profile_data']['mean'], 170)
+        self.assertNotIn('base:timings', stats.get('view', {}))
+
+    def test_invalid_timings_ignored(self):
+        invalid = self.send_beacon({'navigation': {'page': 5, 'load': 10},
+                                    'ajax': [{'url': '/nowhere', 'duration': -1}, 'foo', {'duration': 10}]})
+        other = self.send_beacon({'ajax': [{'url': '/does/not/exist', 'duration': 10}]})
+        malformed = self.client.post(reverse('base:timings'), 'foo', content_type='text/plain').json()
+        get = self.client.get(reverse('base:timings')).json()
+
+        self.assertEqual(invalid['recorded'], 0)
+        self.assertEqual(other['recorded'], 1)
+        self.assertIn('other', timing.timing_stats()['ajax'])
+        self.assertFalse(malformed['success'])
+        self.assertFalse(get['success'])
+
+    def test_timing_stats_staff_only(self):
+        User.objects.create_user('foo', 'test@test.com', 'test')
+        User.objects.create_user('admin', 'admin@test.com', 'test', is_staff=True)
+
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+        denied = self.client.get(reverse('base:timing_stats')).json()
+        self.client.post(reverse('base:verify'), {'username': 'admin', 'password': 'test'})
+        allowed = self.client.get(reverse('base:timing_stats')).json()
+
+        self.assertFalse(denied['success'])
+        self.assertIn('base:verify', allowed['view'])
+
+    def test_series_added_by_other_processes_kept(self):
+        timing.record('view', 'foo', 10)
+        # Another process, which has not seen either series, adds one
+        timing.known_series.clear()
+        timing.record('view', 'bar', 10)
+        timing.record('view', 'foo', 10)
+
+        self.assertEqual(timing.series_index(), ['view:bar', 'view:foo'])
+        self.assertEqual(timing.timing_stats()['view']['foo']['count'], 2)
+
+
+class UsernameFilterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('foo', 'foo@test.com', 'test')
+
+    def unknown_username(self):
+        # Any username may be a false positive, so pick one the filter rules out
+        return next(username for username in ('missing{}'.format(number) for number in range(100))
+                    if not bloom.usernames.may_exist(username))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom_filter = bloom.BloomFilter(1000, 0.01)
+        for number in range(1000):
+            bloom_filter.add('user{}'.format(number))
+
+        self.assertTrue(all('user{}'.format(number) in bloom_filter for number in range(1000)))
+        false_positives = sum('other{}'.format(number) in bloom_filter for number in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_filter_built_from_users_and_updated_on_save(self):
+        username_filter = bloom.UsernameFilter()
+        self.addCleanup(invalidation._handlers.remove, username_filter.namespaces_changed)
+
+        self.assertTrue(username_filter.may_exist('foo'))
+        self.assertFalse(username_filter.may_exist('bar'))
+        User.objects.create_user('bar', 'bar@test.com', 'test')
+        self.assertTrue(username_filter.may_exist('bar'))
+
+    def test_stale_filter_rebuilt_in_background(self):
+        username_filter = bloom.UsernameFilter()
+        self.addCleanup(invalidation._handlers.remove, username_filter.namespaces_changed)
+        username_filter.build()
+        username_filter.built = 0
+
+        with mock.patch.object(username_filter, 'rebuild') as rebuild, self.assertNumQueries(0):
+            self.assertTrue(username_filter.may_exist('foo'))
+        rebuild.assert_called_once_with()
+
+    @override_settings(REPLICA_DATABASES=['missing'])
+    def test_filter_built_from_primary(self):
+        username_filter = bloom.UsernameFilter()
+        self.addCleanup(invalidation._handlers.remove, username_filter.namespaces_changed)
+
+        self.assertIn('foo', username_filter.build())
+
+    def test_unknown_user_found_missing_without_query(self):
+        username = self.unknown_username()
+
+        with self.assertNumQueries(0):
+            with self.assertRaises(User.DoesNotExist):
+                get_user_by_username(username)
+
+    def test_register_taken_username(self):
+        response = self.client.post(reverse('base:register'),
+                                    {'username': 'foo', 'password': 'test', 'email': 'foo2@test.com'}, follow=True)
+
+        self.assertRedirects(response, reverse('base:signup'))
+        self.assertEqual(str(list(response.context.get('messages'))[0]), 'That username already exists')
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_username_available(self):
+        url = reverse('base:username_available')
+        username = self.unknown_username()
+
+        with self.assertNumQueries(0):
+            free = self.client.get(url, {'username': username}).json()
+        taken = self.client.get(url, {'username': 'foo'}).json()
+        empty = self.client.get(url).json()
+
+        self.assertEqual(free, {'success': True, 'available': True})
+        self.assertEqual(taken, {'success': True, 'available': False})
+        self.assertFalse(empty['success'])
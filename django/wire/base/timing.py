@@ -0,0 +1,193 @@
+"""
+Real user timings alongside server timings.
+
+Browsers send how long pages took to load and how long each AJAX call took, see the timing module in global.js. Every
+response carries a Server-Timing header with the time spent producing it, so the browser can also send the server's
+share of each AJAX call, and the rest is counted as network time. A slow view shows up in the view and ajax_server
+histograms, a slow network only in ajax_network and the page load timings.
+
+Timings are counted in histograms per metric and endpoint, with the bucket upper bounds in TIMING_BUCKETS. Endpoints
+are URL pattern names, so a profile page for any user is counted as wire_profile:profile. Counts are kept in the cache
+like the cache statistics, so use a shared cache backend to see the timings of every process. The index of series is
+kept with one key per series, numbered with an atomic counter, so processes adding series at the same time never
+overwrite each other's.
+"""
+import math
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+
+# Series this process has already added to the index in the cache
+known_series = set()
+
+
+def endpoint_name(path):
+    """
+    :param path: The path of a URL on this site
+    :return: The name of the URL pattern matching the path, or 'other'
+    """
+    try:
+        return resolve(path.split('?')[0]).view_name or 'other'
+    except Resolver404:
+        return 'other'
+
+
+def increment(key, amount=1):
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key, amount)
+
+
+def add_series(series):
+    """
+    Add a series to the index in the cache, if no process has added it yet
+
+    :param series: The metric and endpoint of the series, separated by a colon
+    """
+    if series not in known_series:
+        if cache.add('timing_series:' + series, True, None):
+            cache.set('timing_slot:{}'.format(increment('timing_slots')), series, None)
+        known_series.add(series)
+
+
+def series_index():
+    """
+    :return: sorted list of every series in the index
+    """
+    slots = cache.get('timing_slots', 0)
+    stored = cache.get_many(['timing_slot:{}'.format(slot) for slot in range(1, slots + 1)])
+    return sorted(set(stored.values()))
+
+
+def bucket_of(milliseconds):
+    """
+    :param milliseconds: A timing
+    :return: The upper bound of the histogram bucket the timing falls in, or 'inf'
+    """
+    for bound in settings.TIMING_BUCKETS:
+        if milliseconds <= bound:
+            return str(bound)
+    return 'inf'
+
+
+def record(metric, endpoint, milliseconds):
+    """
+    Count a timing in the histogram of the given metric and endpoint
+
+    :param metric: 'view' for server timings, or ttfb, dom_ready, load, ajax, ajax_server or ajax_network
+    :param endpoint: The URL pattern name the timing is for
+    :param milliseconds: The timing
+    """
+    series = '{}:{}'.format(metric, endpoint)
+    add_series(series)
+    increment('timing:{}:{}'.format(series, bucket_of(milliseconds)))
+    increment('timing:{}:count'.format(series))
+    increment('timing:{}:sum'.format(series), int(round(milliseconds)))
+
+
+def percentile(buckets, count, fraction):
+    """
+    :param buckets: list of (upper bound, count) pairs, in order
+    :param count: The total count
+    :param fraction: The fraction of timings that should be at or below the result, e.g. 0.95
+    :return: The upper bound of the bucket holding that percentile
+    """
+    seen = 0
+    for bound, bucket_count in buckets:
+        seen += bucket_count
+        if seen >= math.ceil(count * fraction):
+            return bound
+    return None
+
+
+def timing_stats():
+    """
+    :return: dictionary of metrics to dictionaries of endpoints to their count, mean, p50, p95 and histogram
+    """
+    index = series_index()
+    bounds = [str(bound) for bound in settings.TIMING_BUCKETS] + ['inf']
+    keys = ['timing:{}:{}'.format(series, name) for series in index for name in bounds + ['count', 'sum']]
+    stored = cache.get_many(keys)
+
+    stats = {}
+    for series in index:
+        metric, endpoint = series.split(':', 1)
+        count = stored.get('timing:{}:count'.format(series), 0)
+        if not count:
+            continue
+        buckets = [(bound, stored.get('timing:{}:{}'.format(series, bound), 0)) for bound in bounds]
+        stats.setdefault(metric, {})[endpoint] = {
+            'count': count,
+            'mean': stored.get('timing:{}:sum'.format(series), 0) / count,
+            'p50': percentile(buckets, count, 0.5),
+            'p95': percentile(buckets, count, 0.95),
+            'histogram': dict(buckets),
+        }
+    return stats
+
+
+def valid_timing(value):
+    """
+    :param value: A timing sent by a browser
+    :return: True if the value is a number of milliseconds that could be a real timing
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value < 3600000
+
+
+def record_beacon(beacon):
+    """
+    Count the timings sent by a browser
+
+    :param beacon: dictionary with an optional navigation dictionary, holding the page path and its ttfb, dom_ready
+        and load timings, and an optional ajax list of dictionaries, each holding the url, duration and server timing
+        of a call
+    :return: The number of timings counted
+    """
+    if not isinstance(beacon, dict):
+        return 0
+    recorded = 0
+    navigation = beacon.get('navigation')
+    if isinstance(navigation, dict) and isinstance(navigation.get('page'), str):
+        page = endpoint_name(navigation['page'])
+        for metric in ('ttfb', 'dom_ready', 'load'):
+            if valid_timing(navigation.get(metric)):
+                record(metric, page, navigation[metric])
+                recorded += 1
+
+    entries = beacon.get('ajax')
+    if not isinstance(entries, list):
+        entries = []
+    for entry in entries[:settings.TIMING_MAX_BEACON_ENTRIES]:
+        if not isinstance(entry, dict) or not isinstance(entry.get('url'), str) or not valid_timing(
+                entry.get('duration')):
+            continue
+        endpoint = endpoint_name(entry['url'])
+        record('ajax', endpoint, entry['duration'])
+        recorded += 1
+        if valid_timing(entry.get('server')) and entry['server'] <= entry['duration']:
+            record('ajax_server', endpoint, entry['server'])
+            record('ajax_network', endpoint, entry['duration'] - entry['server'])
+    return recorded
+
+
+class ServerTimingMiddleware:
+    """
+    Time every response, count it in the view histogram of its endpoint and send it in a Server-Timing header
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        milliseconds = (time.perf_counter() - start) * 1000
+
+        response['Server-Timing'] = 'app;dur={:.1f}'.format(milliseconds)
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match and resolver_match.view_name != 'base:timings':
+            record('view', resolver_match.view_name, milliseconds)
+        return response
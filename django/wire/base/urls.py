@@ -10,7 +10,12 @@ urlpatterns = [
     path('login', TemplateView.as_view(template_name='base/login.html'), name='login'),
     path('signup', TemplateView.as_view(template_name='base/signup.html'), name='signup'),
     path('register', views.register, name='register'),
+    path('username-available', views.username_available, name='username_available'),
     path('verify', views.verify_user, name='verify'),
     path('logout', views.log_out, name='logout'),
-    path('get-recommended-users/<path:excluded_username>', views.recommended_users, name='recommended_users')
+    path('delete-account', views.delete_account, name='delete_account'),
+    path('get-recommended-users/<path:excluded_username>', views.recommended_users, name='recommended_users'),
+    path('cache-stats', views.get_cache_stats, name='cache_stats'),
+    path('timings', views.collect_timings, name='timings'),
+    path('timing-stats', views.get_timing_stats, name='timing_stats'),
 ]
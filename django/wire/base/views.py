@@ -1,3 +1,4 @@
+import json
 from django.shortcuts import render, get_object_or_404
 from django.http import HttpResponseRedirect, HttpResponse, Http404, JsonResponse
 from django.urls import reverse
@@ -9,9 +10,20 @@ from django.db import IntegrityError, DatabaseError
 from django.db.models import ObjectDoesNotExist, FieldDoesNotExist
 from django.core.validators import validate_email
 from django.core.exceptions import  ValidationError
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from wire_profile.models import Follow, Message
+from wire_profile import deletion, leaderboard, trending
+from wire.routers import not_a_write, writes_to_primary
+from . import timing
+from .bloom import usernames
+from .cache import cache_stats, cached_query
+from .middleware import public_read
+from .pagecache import cache_anonymous_page
 
 
+@method_decorator(cache_anonymous_page(lambda request: ['page:home']), name='get')
 class HomeView(TemplateView):
     template_name = 'base/index.html'
 
@@ -25,15 +37,19 @@ class HomeView(TemplateView):
         :return: Render the search message results page
         """
 
-        latest_messages = Message.objects.order_by('-created').all()[:5]
-        latest_tagged_messages = Message.objects.filter(message_text__icontains=' #').order_by('-created').all()[:5]
+        latest_messages = cached_query('home_latest_messages', ['messages'], lambda: (
+            Message.objects.select_related('user').newest(5)))
+        latest_tagged_messages = cached_query('home_latest_tagged_messages', ['messages'], lambda: (
+            Message.objects.filter(message_text__icontains=' #').select_related('user').newest(5)))
 
         context = self.get_context_data(**kwargs)
         context['latest_messages'] = latest_messages
         context['latest_tagged_messages'] = latest_tagged_messages
+        context['trending_tags'] = trending.top_tags('hour')
         return self.render_to_response(context)
 
 
+@writes_to_primary
 def register(request):
     """
     Create a user using the information sent by a POST request. Perform backend validation on the email.
@@ -73,6 +89,12 @@ def register(request):
         messages.error(request, 'Please enter a valid email address', extra_tags='danger')
         return HttpResponseRedirect(reverse('base:signup'))
 
+    # Turn away taken usernames before paying for hashing the password, only querying when the username filter
+    # cannot rule the username out
+    if usernames.may_exist(username) and User.objects.filter(username=username).exists():
+        messages.error(request, 'That username already exists', extra_tags='danger')
+        return HttpResponseRedirect(reverse('base:signup'))
+
     try:
         user = User.objects.create_user(username, email, password)
     except IntegrityError:
@@ -90,6 +112,7 @@ def register(request):
     return HttpResponseRedirect(reverse('base:home'))
 
 
+@writes_to_primary
 def verify_user(request):
     """
     Validate the username and password provided by the request
@@ -121,6 +144,7 @@ def verify_user(request):
         return HttpResponseRedirect(reverse('base:login'))
 
 
+@writes_to_primary
 def log_out(request):
     """
     Log the user out of the current session
@@ -133,6 +157,52 @@ def log_out(request):
     return HttpResponseRedirect(reverse('base:home'))
 
 
+@writes_to_primary
+def delete_account(request):
+    """
+    Close the logged in user's account once they confirm their password. The account is deactivated straight away and
+    its data is deleted in batches by the delete_accounts command
+
+    :param request: The request that called this function
+    :return: Log the user out and return to the home page, or back to the profile page if the password is wrong
+    """
+    if request.method != 'POST' or not request.user.is_authenticated:
+        return HttpResponseRedirect(reverse('base:home'))
+    if not request.user.check_password(request.POST.get('password', '')):
+        messages.error(request, 'Please enter your password to delete your account', extra_tags='danger')
+        return HttpResponseRedirect(reverse('wire_profile:current_profile'))
+
+    deletion.request_deletion(User.objects.get(pk=request.user.pk))
+    logout(request)
+    messages.success(request, 'Your account has been deleted')
+    return HttpResponseRedirect(reverse('base:home'))
+
+
+def get_recommended_users(user, excluded_username):
+    """
+    Build the query for five users that are not the given user, anyone followed by the given user, or the specified
+    excluded user
+
+    :param user: The user to recommend others to, may be anonymous
+    :param excluded_username: A user not to include in the list
+    :return: Query or list of usernames
+    """
+    # Leave out the exclusion when the username filter shows there is no such user
+    excluded = [excluded_username] if usernames.may_exist(excluded_username) else []
+    if user.is_authenticated:
+        follow_query = Follow.objects.filter(follower_id=user)
+        return User.objects.filter(is_active=True).exclude(id=user.id).exclude(username__in=excluded)\
+            .exclude(followed_user__in=follow_query).values('username')[:5]
+
+    # Recommend the most followed users to anonymous visitors, only querying for more if there are not enough of them
+    popular = [{'username': username} for username in leaderboard.follower_ranks() if username != excluded_username]
+    if len(popular) >= 5:
+        return popular[:5]
+    return popular + list(User.objects.filter(is_active=True)
+                          .exclude(username__in=excluded + [u['username'] for u in popular])
+                          .values('username')[:5 - len(popular)])
+
+
 def recommended_users(request, excluded_username):
     """
     Return five users that is not the logged in user, anyone followed by the logged in user, or the specified excluded
@@ -143,15 +213,78 @@ def recommended_users(request, excluded_username):
     :return: JSON list of users
     """
     try:
-        if request.user.is_authenticated:
-            follow_query = Follow.objects.filter(follower_id=request.user)
-            users = User.objects.filter().exclude(id=request.user.id).exclude(username=excluded_username)\
-                .exclude(followed_user__in=follow_query).values('username')[:5]
-            return JsonResponse(list(users), safe=False)
-
-        users = User.objects.filter().exclude(username=excluded_username).values('username')[:5]
-        return JsonResponse(list(users), safe=False)
+        viewer_id = request.user.id if request.user.is_authenticated else None
+        namespaces = ['users'] + (['follows:user:{}'.format(viewer_id)] if viewer_id else [])
+        # Every username that certainly does not exist excludes nobody, so they share one cache entry
+        cache_username = excluded_username if usernames.may_exist(excluded_username) else ''
+        users = cached_query('recommended_users:{}:{}'.format(viewer_id, cache_username), namespaces,
+                             lambda: list(get_recommended_users(request.user, excluded_username)))
+        return JsonResponse(users, safe=False)
 
     except (ObjectDoesNotExist, FieldDoesNotExist):
         messages.error(request, 'Error retrieving recommended users. Please Contact IT', extra_tags='danger')
         return HttpResponseRedirect(reverse('base:home'))
+
+
+@public_read
+def username_available(request):
+    """
+    Check whether a username can still be registered, for the live check on the sign up form. Most unused usernames are
+    answered by the username filter without a query
+
+    :param request: The request that called this function, with the username in its query string
+    :return: availability or failure message in JSON format
+    """
+    username = request.GET.get('username', '')
+    if not username:
+        return JsonResponse({'success': False, 'message': 'Please enter a username'})
+    if len(username) > 150:
+        return JsonResponse({'success': False,
+                             'message': 'The maximum number of characters for a username is 150'})
+    available = not usernames.may_exist(username) or not User.objects.filter(username=username).exists()
+    return JsonResponse({'success': True, 'available': available})
+
+
+def get_cache_stats(request):
+    """
+    Get the number of cache hits, misses, stale results served and early refreshes
+
+    :param request: The request that called this function
+    :return: cache statistics or failure message in JSON format
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'message': 'Only staff can view cache statistics'})
+    return JsonResponse(cache_stats())
+
+
+@csrf_exempt
+@not_a_write
+def collect_timings(request):
+    """
+    Count the page load and AJAX timings a browser sends with navigator.sendBeacon. Beacons cannot send a CSRF token,
+    and only add to the timing histograms
+
+    :param request: The request that called this function, with the timings in its JSON body, see timing.record_beacon
+    :return: success or failure message in JSON format
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Timings must be sent in a POST request'})
+    if len(request.body) > settings.TIMING_MAX_BEACON_BYTES:
+        return JsonResponse({'success': False, 'message': 'Too many timings were sent at once'})
+    try:
+        beacon = json.loads(request.body.decode())
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Please send the timings as a JSON object'})
+    return JsonResponse({'success': True, 'recorded': timing.record_beacon(beacon)})
+
+
+def get_timing_stats(request):
+    """
+    Get the histograms of the timings sent by browsers and of the time spent in each view
+
+    :param request: The request that called this function
+    :return: timing statistics or failure message in JSON format
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'message': 'Only staff can view timing statistics'})
+    return JsonResponse(timing.timing_stats())
@@ -0,0 +1,134 @@
+"""
+Send reads to read replicas and writes to the primary database.
+
+The databases listed in REPLICA_DATABASES serve reads. Requests that write, either with an unsafe HTTP method or
+through a view decorated with writes_to_primary, use the primary for everything. They also pin the client to the
+primary for REPLICA_PIN_SECONDS, so users always see their own new wires and follows even if the replicas lag behind.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+PIN_COOKIE = 'wire_primary_until'
+
+_state = threading.local()
+
+
+def is_pinned():
+    """
+    :return: True if the current thread must read from the primary database
+    """
+    return getattr(_state, 'pinned', False)
+
+
+@contextmanager
+def pinned_to_primary(pinned=True):
+    """
+    Read from the primary database, or not, while in this context
+
+    :param pinned: Whether reads should go to the primary database
+    """
+    previous = is_pinned()
+    _state.pinned = pinned
+    try:
+        yield
+    finally:
+        _state.pinned = previous
+
+
+@contextmanager
+def reading_from(alias):
+    """
+    Send every read to the given database while in this context, so several connections can share one snapshot of it
+
+    :param alias: The alias of the database to read from
+    """
+    previous = getattr(_state, 'read_alias', None)
+    _state.read_alias = alias
+    try:
+        yield
+    finally:
+        _state.read_alias = previous
+
+
+def not_a_write(view):
+    """
+    Mark a view that accepts unsafe HTTP methods without writing application data, such as beacons, so requests to it do
+    not pin the client to the primary
+
+    :param view: The view function to decorate
+    :return: The view
+    """
+    view.pins_primary = False
+    return view
+
+
+def writes_to_primary(view):
+    """
+    Mark a view as writing to the database, so the request and the client's next requests use the primary
+
+    :param view: The view function to decorate
+    :return: The decorated view
+    """
+    @wraps(view)
+    def wrapped_view(request, *args, **kwargs):
+        request.wrote_to_primary = True
+        with pinned_to_primary():
+            return view(request, *args, **kwargs)
+    return wrapped_view
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'read_alias', None):
+            return _state.read_alias
+        if settings.REPLICA_DATABASES and not is_pinned():
+            return random.choice(settings.REPLICA_DATABASES)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+def pins_primary(request):
+    """
+    :param request: The current request
+    :return: False if the request is for a view marked with not_a_write
+    """
+    try:
+        view = resolve(request.path_info).func
+    except Resolver404:
+        return True
+    return getattr(view, 'pins_primary', True)
+
+
+class PrimaryPinningMiddleware:
+    """
+    Pin requests to the primary database when they write, or when the client wrote recently
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        writes = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and pins_primary(request)
+
+        with pinned_to_primary(writes or pinned_until > time.time()):
+            response = self.get_response(request)
+
+        if settings.REPLICA_DATABASES and (writes or getattr(request, 'wrote_to_primary', False)):
+            response.set_cookie(PIN_COOKIE, str(time.time() + settings.REPLICA_PIN_SECONDS),
+                                max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+        return response
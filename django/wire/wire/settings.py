@@ -48,12 +48,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'base.compression.CompressionMiddleware',
+    'wire.routers.PrimaryPinningMiddleware',
+    'base.middleware.LeanSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'base.middleware.CachedAuthenticationMiddleware',
+    'base.middleware.LeanMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -93,6 +96,65 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+# Each process has its own local memory cache, use a shared backend such as memcached when running several workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds to keep cached query results, see base/cache.py. Results are invalidated as soon as the data changes
+QUERY_CACHE_TIMEOUT = 300
+
+# Seconds a result can still be served after it expires, while one process recomputes it
+QUERY_CACHE_STALE_TIMEOUT = 60
+
+# Seconds other processes wait for the process recomputing a result before computing it themselves
+QUERY_CACHE_LOCK_TIMEOUT = 10
+
+# How eagerly results are recomputed before they expire, 0 turns early refreshes off
+QUERY_CACHE_EARLY_REFRESH_BETA = 1.0
+
+# Seconds to keep entries in caches local to each process. The invalidation bus drops them as soon as the data changes
+LOCAL_CACHE_TIMEOUT = 3600
+
+# Invalidation bus, see base/invalidation.py
+# Without PostgreSQL's LISTEN/NOTIFY, each process checks for events every INVALIDATION_POLL_INTERVAL seconds. Events
+# are kept for INVALIDATION_EVENT_RETENTION seconds
+INVALIDATION_POLL_INTERVAL = 1.0
+INVALIDATION_EVENT_RETENTION = 3600
+
+# Seconds to keep the home and profile pages shown to anonymous visitors, see base/pagecache.py. Pages are purged when
+# the messages, follows or user they show change. The recommended users on them can be this many seconds out of date
+PAGE_CACHE_TIMEOUT = 60
+
+# Dotted path to a function called with a list of surrogate keys once their pages are purged, to purge them from a CDN
+# or reverse proxy in front of the site
+SURROGATE_PURGE_HANDLER = None
+
+
+# Sessions and messages
+# Sessions are read from the cache and only fall back to the database on a miss. Flash messages are kept in a signed
+# cookie, so showing one never writes to the session. Public read endpoints skip both, see base/middleware.py
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+
+# Read replicas
+# Reads are sent to the database aliases listed in REPLICA_DATABASES and writes to 'default', see wire/routers.py.
+# After writing, a client reads from 'default' for REPLICA_PIN_SECONDS so it sees its own changes. To try it locally,
+# add a copy of the database, e.g.
+# DATABASES['replica'] = dict(DATABASES['default'], NAME='django_wire_replica', TEST={'MIRROR': 'default'})
+# or with SQLite files, {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(BASE_DIR, 'replica.sqlite3')}
+REPLICA_DATABASES = []
+REPLICA_PIN_SECONDS = 5
+DATABASE_ROUTERS = ['wire.routers.ReplicaRouter']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -131,3 +193,168 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = '/home/ubuntu/wire/collectstatic'
+
+# collectstatic builds the bundles below, names every file after a hash of its contents and writes .gz and .br copies
+# next to them, see base/storage.py. Serve STATIC_ROOT with "Cache-Control: public, max-age=31536000, immutable" and
+# let the web server send the precompressed copies, e.g. nginx's gzip_static and brotli_static
+STATICFILES_STORAGE = 'base.storage.BundlingStaticFilesStorage'
+
+# Bundles of static files, each included in templates with {% bundle %} from base/templatetags/bundles.py
+STATIC_BUNDLES = {
+    'bundles/global.css': ['base/bootstrap/css/bootstrap.min.css', 'base/global/css/custom.css'],
+    'bundles/global.js': ['base/jquery/jquery-3.2.1.min.js', 'base/bootstrap/js/bootstrap.min.js',
+                          'base/global/js/global.js'],
+    'bundles/home.js': ['base/home.js'],
+    'bundles/signup.js': ['base/signup.js'],
+    'bundles/profile.css': ['profile/profile.css'],
+    'bundles/profile.js': ['profile/feed.js', 'profile/profile.js'],
+    'bundles/current_profile.js': ['profile/feed.js', 'profile/current_profile.js'],
+    'bundles/search.js': ['profile/search.js'],
+}
+
+
+# Profile pages
+# Embed the profile data in the rendered page so no extra requests are needed on load
+PROFILE_DATA_INLINE = True
+
+# Run the independent profile data queries on separate connections (PostgreSQL only)
+PROFILE_DATA_CONCURRENT = False
+
+# The number of messages shown when a profile page loads, and loaded each time it is scrolled to the end
+FEED_PAGE_SIZE = 20
+
+
+# Message ingestion
+# 'direct' saves each new message straight away. 'batched' appends new messages to QUEUE_PATH, they are then saved in
+# bulk by the flush_message_queue management command after at most MAX_FLUSH_LATENCY seconds. Queue files that fail to
+# save MAX_FLUSH_ATTEMPTS times are moved aside with a .failed suffix
+MESSAGE_INGESTION = {
+    'MODE': 'direct',
+    'QUEUE_PATH': os.path.join(BASE_DIR, 'message_queue.ndjson'),
+    'MAX_BATCH_SIZE': 500,
+    'MAX_FLUSH_LATENCY': 1.0,
+    'MAX_FLUSH_ATTEMPTS': 5,
+}
+
+
+# The maximum number of messages or usernames accepted by a bulk request
+BULK_MAX_ITEMS = 1000
+
+# The number of messages in each page of a user's mentions
+MENTIONS_PAGE_SIZE = 20
+
+
+# Message ids
+# Give new messages time ordered 64 bit ids made in process, see wire_profile/snowflake.py. Messages saved before this
+# is enabled keep their ids, which are all smaller than the new ones. Do not disable it again once messages have been
+# created with it, the database sequence would start handing out ids older than existing messages
+MESSAGE_SNOWFLAKE_IDS = False
+
+# Every process creating messages needs a different worker id between 0 and 1023. When None, each process claims a free
+# one from PostgreSQL with an advisory lock. Other databases need it set
+SNOWFLAKE_WORKER_ID = None
+
+# Messages from the last MESSAGE_RECENT_DAYS days are looked at first when showing the latest messages. When the
+# message table is partitioned by month, this lets PostgreSQL skip older partitions
+MESSAGE_RECENT_DAYS = 7
+
+
+# Account deletion, see wire_profile/deletion.py
+# Deleted accounts are deactivated straight away. Their mentions, messages and follows are then deleted by the
+# delete_accounts management command, in transactions of at most ACCOUNT_DELETION_BATCH_SIZE rows with a pause of
+# ACCOUNT_DELETION_BATCH_PAUSE seconds between them
+ACCOUNT_DELETION_BATCH_SIZE = 1000
+ACCOUNT_DELETION_BATCH_PAUSE = 0.1
+
+
+# Message retention, see wire_profile/retention.py
+# The prune_messages command deletes messages older than MAX_AGE_DAYS days and each user's messages beyond their newest
+# MAX_PER_USER, None keeps them all. Messages are deleted in transactions of at most BATCH_SIZE messages with a pause of
+# BATCH_PAUSE seconds after each. When ARCHIVE_DIR is set, they are first written there as gzipped NDJSON
+MESSAGE_RETENTION = {
+    'MAX_AGE_DAYS': None,
+    'MAX_PER_USER': None,
+    'BATCH_SIZE': 1000,
+    'BATCH_PAUSE': 0.5,
+    'ARCHIVE_DIR': None,
+}
+
+
+# Data exports, see wire_profile/export.py
+# Rows are read from the database EXPORT_QUERY_CHUNK_SIZE at a time and sent in chunks of about EXPORT_CHUNK_BYTES.
+# Accounts with more than EXPORT_MAX_WEB_ROWS rows are exported with the export_user_data command instead of the web
+EXPORT_QUERY_CHUNK_SIZE = 2000
+EXPORT_CHUNK_BYTES = 65536
+EXPORT_MAX_WEB_ROWS = 50000
+
+
+# Bulk imports, see wire_profile/importer.py
+# The import_data command loads messages and follows IMPORT_BATCH_SIZE records at a time, each batch in one transaction
+IMPORT_BATCH_SIZE = 5000
+
+
+# Trending hashtags, see wire_profile/trending.py
+# Each window maps to the length of its buckets and its own length, in seconds. The top TRENDING_TAG_COUNT tags of each
+# window are recomputed every TRENDING_TAG_TIMEOUT seconds, by the refresh_trending_tags command or on demand
+TRENDING_TAG_WINDOWS = {
+    'hour': (60, 3600),
+    'day': (3600, 86400),
+}
+TRENDING_TAG_COUNT = 10
+TRENDING_TAG_TIMEOUT = 60
+
+
+# Leaderboards, see wire_profile/leaderboard.py
+# The LEADERBOARD_SIZE most followed users, and the most active posters over the last LEADERBOARD_ACTIVITY_DAYS days,
+# are recomputed every LEADERBOARD_TIMEOUT seconds, by the refresh_leaderboards command or on demand
+LEADERBOARD_SIZE = 10
+LEADERBOARD_ACTIVITY_DAYS = 7
+LEADERBOARD_TIMEOUT = 60
+
+
+# Response compression, see base/compression.py
+# Responses of the CONTENT_TYPES below are compressed with brotli, when installed, or gzip unless they are smaller than
+# MIN_SIZE bytes. Views can change these with the compression decorator. HTML is not compressed here, as pages holding
+# CSRF tokens next to user input would be open to the BREACH attack; leave it to the web server if needed
+COMPRESSION = {
+    'ENABLED': True,
+    'MIN_SIZE': 860,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+    'CONTENT_TYPES': [
+        'application/json',
+        'application/x-ndjson',
+        'application/javascript',
+        'text/css',
+        'text/csv',
+        'text/plain',
+    ],
+}
+
+
+# Real user timings, see base/timing.py
+# Page load and AJAX timings sent by browsers, and the time spent producing each response, are counted in histograms
+# with these bucket upper bounds in milliseconds
+TIMING_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# The largest timing beacon accepted, and the most AJAX timings counted from one beacon
+TIMING_MAX_BEACON_BYTES = 16384
+TIMING_MAX_BEACON_ENTRIES = 50
+
+
+# Admin
+# Changelists of large tables take their row count from the database's statistics, see base/pagination.py, and only
+# count exactly when the estimate is below ESTIMATED_COUNT_THRESHOLD rows
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+# Username filter, see base/bloom.py
+# A Bloom filter of every username answers lookups of users that do not exist without a query. It is sized for twice the
+# number of users, and at least MIN_CAPACITY, with about ERROR_RATE false positives, and rebuilt every REBUILD_INTERVAL
+# seconds
+USERNAME_FILTER = {
+    'ENABLED': True,
+    'ERROR_RATE': 0.01,
+    'MIN_CAPACITY': 10000,
+    'REBUILD_INTERVAL': 3600,
+}
@@ -1,3 +1,94 @@
+import operator
+from datetime import timedelta
+from functools import reduce
 from django.contrib import admin
+from django.db.models import Q
+from django.utils import timezone
+from base.pagination import EstimatedCountPaginator
+from .models import AccountDeletion, Follow, Message
 
-# Register your models here.
+
+# The message and follow tables can hold tens of millions of rows, so their changelists avoid anything the database
+# cannot answer from an index: counts are estimated, rows are ordered by id, only id and created can be sorted on,
+# filters use the created index and searches look up exact ids and usernames
+
+
+class PostedFilter(admin.SimpleListFilter):
+    title = 'posted'
+    parameter_name = 'posted'
+    PERIODS = {'day': timedelta(days=1), 'week': timedelta(days=7), 'month': timedelta(days=30)}
+
+    def lookups(self, request, model_admin):
+        return [('day', 'In the last day'), ('week', 'In the last week'), ('month', 'In the last month')]
+
+    def queryset(self, request, queryset):
+        if self.value() in self.PERIODS:
+            return queryset.filter(created__gte=timezone.now() - self.PERIODS[self.value()])
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+    # The lookups that find the rows related to a user by their exact username
+    username_lookups = ('user__username',)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search for a single id or exact username, which both use an index, instead of scanning for substrings
+
+        :param request: The current request
+        :param queryset: The rows being listed
+        :param search_term: The text entered in the search box
+        :return: The matching rows, and False as the results never contain duplicates
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(id=int(search_term)), False
+        username_filter = reduce(operator.or_, (Q(**{lookup: search_term}) for lookup in self.username_lookups))
+        return queryset.filter(username_filter), False
+
+
+@admin.register(Message)
+class MessageAdmin(LargeTableAdmin):
+    list_display = ('id', 'excerpt', 'author', 'created')
+    list_select_related = ('user',)
+    list_filter = (PostedFilter,)
+    raw_id_fields = ('user',)
+    # Enables the search box, get_search_results does the searching
+    search_fields = ('user__username',)
+
+    def excerpt(self, message):
+        return message.message_text[:80]
+
+    def author(self, message):
+        return message.user.username
+
+
+@admin.register(Follow)
+class FollowAdmin(LargeTableAdmin):
+    list_display = ('id', 'follower', 'following')
+    list_select_related = ('follower_id', 'following_id')
+    raw_id_fields = ('follower_id', 'following_id')
+    search_fields = ('follower_id__username', 'following_id__username')
+    username_lookups = ('follower_id__username', 'following_id__username')
+
+    def follower(self, follow):
+        return follow.follower_id.username
+
+    def following(self, follow):
+        return follow.following_id.username
+
+
+@admin.register(AccountDeletion)
+class AccountDeletionAdmin(admin.ModelAdmin):
+    list_display = ('username', 'requested', 'stage', 'deleted_rows', 'finished')
+    readonly_fields = ('user', 'username', 'requested', 'stage', 'deleted_rows', 'finished')
+    ordering = ('-requested',)
+
+    def has_add_permission(self, request):
+        # Deletions are requested by users deleting their accounts, see deletion.request_deletion
+        return False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WireProfileConfig(AppConfig):
     name = 'wire_profile'
+
+    def ready(self):
+        from . import signals
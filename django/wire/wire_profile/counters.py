@@ -0,0 +1,50 @@
+"""
+Counters kept in database rows and updated incrementally, such as the hashtag counts in wire_profile/trending.py and the
+leaderboard counts in wire_profile/leaderboard.py.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+
+def add_to_counters(model, key_fields, field, counts, create=True):
+    """
+    Add amounts to counter rows, creating the rows that do not exist yet
+
+    :param model: The counter model, with a unique constraint over key_fields
+    :param key_fields: The names of the fields identifying a counter
+    :param field: The name of the field holding the count
+    :param counts: dictionary of tuples of key field values to the amount to add, which can be negative
+    :param create: Whether to create missing rows, set to False when taking counts off
+    """
+    counts = {key: amount for key, amount in counts.items() if amount}
+    if not counts:
+        return
+
+    if not create:
+        for key, amount in counts.items():
+            model.objects.filter(**dict(zip(key_fields, key))).update(**{field: F(field) + amount})
+        return
+
+    if connection.vendor == 'postgresql':
+        # Upsert every counter in one statement
+        columns = [model._meta.get_field(name).column for name in key_fields]
+        count_column = model._meta.get_field(field).column
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {table} ({columns}, {count}) VALUES {values} '
+                'ON CONFLICT ({columns}) DO UPDATE SET {count} = {table}.{count} + EXCLUDED.{count}'.format(
+                    table=model._meta.db_table, columns=', '.join(columns), count=count_column,
+                    values=', '.join(['({})'.format(', '.join(['%s'] * (len(columns) + 1)))] * len(counts))),
+                [value for key, amount in counts.items() for value in tuple(key) + (amount,)]
+            )
+        return
+
+    for key, amount in counts.items():
+        counters = model.objects.filter(**dict(zip(key_fields, key)))
+        if not counters.update(**{field: F(field) + amount}):
+            try:
+                with transaction.atomic():
+                    model.objects.create(**dict(zip(key_fields, key)), **{field: amount})
+            except IntegrityError:
+                # Another process created the counter first
+                counters.update(**{field: F(field) + amount})
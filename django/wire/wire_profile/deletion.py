@@ -0,0 +1,168 @@
+"""
+Deleting accounts in batches.
+
+Deleting a user cascades to every one of their messages, follows and mentions in a single transaction, which for a
+prolific account holds locks for a long time and writes a burst of WAL. Instead, request_deletion deactivates the
+account straight away, so it can no longer log in and its profile, messages, search results and leaderboard places are
+no longer shown, and records an AccountDeletion. The delete_accounts command then deletes the dependent rows in
+transactions of at most ACCOUNT_DELETION_BATCH_SIZE rows, and the user last of all.
+
+Each batch is committed with the progress of the deletion, so an interrupted deletion resumes where it stopped. Rows are
+deleted without loading them through the ORM one by one, and the signals they would have sent are replayed once per
+batch instead.
+"""
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from . import leaderboard, mentions
+from .models import AccountDeletion, Follow, Mention, Message
+from .signals import follows_changed, messages_changed
+
+
+def request_deletion(user):
+    """
+    Deactivate an account and record that its data needs deleting
+
+    :param user: The user to delete
+    :return: The AccountDeletion tracking the progress
+    """
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        deletion, created = AccountDeletion.objects.get_or_create(
+            user=user, defaults={'username': user.username, 'requested': timezone.now()})
+    leaderboard.refresh_leaderboards()
+    return deletion
+
+
+def delete_rows(model, field, values):
+    """
+    Delete rows in one statement, without the cascades and signals of QuerySet.delete, whose effects the callers
+    replay for the whole batch
+
+    :param model: The model of the table
+    :param field: The name of the field to match
+    :param values: list of the values of the field to delete
+    """
+    if values:
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE {} IN ({})'.format(
+                connection.ops.quote_name(model._meta.db_table),
+                connection.ops.quote_name(model._meta.get_field(field).column),
+                ', '.join(['%s'] * len(values))), values)
+
+
+def delete_mentions(user, batch_size):
+    """
+    Delete a batch of the mentions of the user
+
+    :param user: The user being deleted
+    :param batch_size: The most rows to delete
+    :return: The number of rows deleted
+    """
+    ids = list(Mention.objects.filter(user=user).values_list('id', flat=True)[:batch_size])
+    delete_rows(Mention, 'id', ids)
+    if ids:
+        mentions.mentions_changed([user.id])
+    return len(ids)
+
+
+def delete_message_batch(batch):
+    """
+    Delete messages along with the mentions in them, in one statement each
+
+    :param batch: The messages to delete, with at least their id, user and created loaded
+    :return: The number of rows deleted
+    """
+    ids = [message.id for message in batch]
+    mentioned = list(Mention.objects.filter(message_id__in=ids).values_list('user_id', flat=True))
+    delete_rows(Mention, 'message', ids)
+    delete_rows(Message, 'id', ids)
+    if batch:
+        mentions.mentions_changed(mentioned)
+        leaderboard.count_messages(batch, -1)
+        messages_changed([message.user_id for message in batch])
+    return len(batch) + len(mentioned)
+
+
+def delete_messages(user, batch_size):
+    """
+    Delete a batch of the messages of the user, along with the mentions in them
+
+    :param user: The user being deleted
+    :param batch_size: The most messages to delete
+    :return: The number of rows deleted
+    """
+    return delete_message_batch(
+        list(Message.objects.filter(user=user).only('id', 'user', 'created').order_by('id')[:batch_size]))
+
+
+def delete_follows(user, batch_size):
+    """
+    Delete a batch of the follows to or from the user
+
+    :param user: The user being deleted
+    :param batch_size: The most follows to delete
+    :return: The number of rows deleted
+    """
+    batch = list(Follow.objects.filter(follower_id=user)[:batch_size])
+    batch += list(Follow.objects.filter(following_id=user)[:batch_size - len(batch)])
+    delete_rows(Follow, 'id', [follow.id for follow in batch])
+    if batch:
+        leaderboard.count_follows(batch, -1)
+        follows_changed([user_id for follow in batch for user_id in (follow.follower_id_id, follow.following_id_id)])
+    return len(batch)
+
+
+STAGES = [
+    ('mentions', delete_mentions),
+    ('messages', delete_messages),
+    ('follows', delete_follows),
+]
+
+
+def run_deletion(deletion, batch_size=None, pause=None, progress=None):
+    """
+    Delete the data of an account batch by batch, then the user, resuming from the recorded stage
+
+    :param deletion: The AccountDeletion to carry out
+    :param batch_size: The most rows to delete in one transaction, defaults to ACCOUNT_DELETION_BATCH_SIZE
+    :param pause: Seconds to wait between batches, defaults to ACCOUNT_DELETION_BATCH_PAUSE
+    :param progress: Optional function called with the deletion after every batch
+    """
+    batch_size = batch_size or settings.ACCOUNT_DELETION_BATCH_SIZE
+    pause = settings.ACCOUNT_DELETION_BATCH_PAUSE if pause is None else pause
+    stage_names = [name for name, delete in STAGES]
+
+    while deletion.finished is None:
+        if deletion.user is None or deletion.stage not in stage_names:
+            # Every dependent row is gone, so deleting the user is a small transaction
+            with transaction.atomic():
+                if deletion.user is not None:
+                    deletion.user.delete()
+                    deletion.user = None
+                deletion.stage = 'done'
+                deletion.finished = timezone.now()
+                deletion.save()
+        else:
+            delete = dict(STAGES)[deletion.stage]
+            with transaction.atomic():
+                deleted = delete(deletion.user, batch_size)
+                if deleted:
+                    deletion.deleted_rows += deleted
+                else:
+                    next_stage = stage_names.index(deletion.stage) + 1
+                    deletion.stage = stage_names[next_stage] if next_stage < len(stage_names) else 'user'
+                deletion.save(update_fields=['stage', 'deleted_rows'])
+            if deleted and pause:
+                time.sleep(pause)
+        if progress:
+            progress(deletion)
+
+
+def pending_deletions():
+    """
+    :return: The deletions that have not finished, oldest first
+    """
+    return AccountDeletion.objects.filter(finished__isnull=True).select_related('user').order_by('requested')
@@ -0,0 +1,113 @@
+"""
+Streaming exports of a user's data.
+
+A user's account, messages, followers and following are read with iterator(), which uses a server-side cursor on
+PostgreSQL, and turned into NDJSON or CSV lines as they are read. Only one chunk of rows is in memory at a time, so an
+export costs the same memory however many messages the user has. Lines are grouped into chunks of about
+EXPORT_CHUNK_BYTES, so compressing the stream, see base/compression.py, works on sizeable pieces.
+
+Streaming a large account still keeps a web worker busy for as long as the download takes, so the web endpoint only
+exports accounts with up to EXPORT_MAX_WEB_ROWS rows. Larger accounts are exported by staff with the export_user_data
+command.
+"""
+import csv
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Follow, Message
+
+CSV_COLUMNS = ('type', 'id', 'username', 'created', 'message_text')
+
+
+def export_records(user):
+    """
+    :param user: The user to export
+    :return: Generator of dictionaries, the user first, then their messages oldest first, their followers and the users
+        they follow, each with a type
+    """
+    yield {'type': 'user', 'id': user.id, 'username': user.username, 'created': user.date_joined}
+
+    chunk_size = settings.EXPORT_QUERY_CHUNK_SIZE
+    for message in Message.objects.filter(user=user).order_by('id').values(
+            'id', 'created', 'message_text').iterator(chunk_size=chunk_size):
+        yield dict(message, type='message')
+    for follow in Follow.objects.filter(following_id=user).order_by('id').values(
+            'follower_id', 'follower_id__username').iterator(chunk_size=chunk_size):
+        yield {'type': 'follower', 'id': follow['follower_id'], 'username': follow['follower_id__username']}
+    for follow in Follow.objects.filter(follower_id=user).order_by('id').values(
+            'following_id', 'following_id__username').iterator(chunk_size=chunk_size):
+        yield {'type': 'following', 'id': follow['following_id'], 'username': follow['following_id__username']}
+
+
+def too_large_for_web(user):
+    """
+    Count the user's rows, stopping once there are more than EXPORT_MAX_WEB_ROWS, so the check stays cheap for the
+    largest accounts
+
+    :param user: The user to export
+    :return: True if the export has more rows than the web endpoint serves
+    """
+    remaining = settings.EXPORT_MAX_WEB_ROWS
+    for rows in (Message.objects.filter(user=user), Follow.objects.filter(following_id=user),
+                 Follow.objects.filter(follower_id=user)):
+        remaining -= rows.values('id')[:remaining + 1].count()
+        if remaining < 0:
+            return True
+    return False
+
+
+def ndjson_lines(records):
+    """
+    :param records: Iterable of dictionaries
+    :return: Generator of one line of JSON for each record
+    """
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+class Line:
+    """
+    A file-like object whose write returns what was written, so csv.writer can produce one line at a time
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(records):
+    """
+    :param records: Iterable of dictionaries
+    :return: Generator of a CSV header line, then one line for each record
+    """
+    writer = csv.writer(Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for record in records:
+        created = record.get('created')
+        yield writer.writerow([record['type'], record['id'], record.get('username', ''),
+                               created.isoformat() if created else '', record.get('message_text', '')])
+
+
+FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
+
+
+def export_chunks(user, export_format):
+    """
+    :param user: The user to export
+    :param export_format: 'ndjson' or 'csv'
+    :return: Generator of encoded chunks of about EXPORT_CHUNK_BYTES
+    """
+    lines, content_type = FORMATS[export_format]
+    chunk = []
+    size = 0
+    for line in lines(export_records(user)):
+        chunk.append(line)
+        size += len(line)
+        if size >= settings.EXPORT_CHUNK_BYTES:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
@@ -0,0 +1,288 @@
+"""
+Bulk imports of messages and follows from another platform.
+
+Records are read one at a time from NDJSON or CSV dumps and loaded IMPORT_BATCH_SIZE at a time. The usernames of each
+batch are resolved to ids in one query, and remembered for later batches. On PostgreSQL each batch is loaded with COPY,
+otherwise with bulk_create. The foreign keys Django creates are deferrable and checked once at the end of each batch's
+transaction.
+
+Derived data is updated for each batch as a whole: messages_created and follows_created are sent once per batch, so
+hashtags, mentions and counters are updated with one query per kind rather than per row. Once everything is loaded,
+the cached timelines of the users involved are invalidated, the counters can be recounted and the leaderboards and
+trending tags are recomputed.
+
+With MESSAGE_SNOWFLAKE_IDS, imported messages get ids made from their created times rather than the time of the
+import, so feeds ordered by id show them where they belong and ids keep growing with created times. Ids for
+messages created before snowflake.EPOCH are negative.
+"""
+import csv
+import io
+import json
+import operator
+from functools import reduce
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import dateparse, timezone
+from . import partitions, snowflake
+from .models import Follow, Message, follows_created, messages_created
+
+# The fields of each kind of record, which are also the columns of CSV dumps
+FIELDS = {
+    'message': ('username', 'created', 'message_text'),
+    'follow': ('follower', 'following'),
+}
+
+
+def read_ndjson(lines):
+    """
+    :param lines: Iterable of lines, each a JSON object with a type of message or follow and the fields in FIELDS
+    :return: Generator of the records
+    """
+    for line in lines:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def read_csv(lines, record_type):
+    """
+    :param lines: Iterable of lines of CSV with a header row naming the fields in FIELDS
+    :param record_type: The type of every record in the file, message or follow
+    :return: Generator of the records
+    """
+    for row in csv.DictReader(lines):
+        yield dict(row, type=record_type)
+
+
+class UsernameCache:
+    """
+    Usernames resolved to user ids, looked up in batches and kept for later batches
+    """
+
+    def __init__(self, max_entries=100000):
+        self.ids = {}
+        self.max_entries = max_entries
+
+    def resolve(self, usernames):
+        """
+        :param usernames: Iterable of usernames
+        :return: dictionary of the usernames that exist to their user ids
+        """
+        usernames = set(usernames)
+        missing = [username for username in usernames if username not in self.ids]
+        if missing:
+            if len(self.ids) + len(missing) > self.max_entries:
+                self.ids = {}
+            found = dict(User.objects.filter(username__in=missing).values_list('username', 'id'))
+            self.ids.update({username: found.get(username) for username in missing})
+        return {username: self.ids[username] for username in usernames if self.ids.get(username) is not None}
+
+
+def parse_created(value):
+    """
+    :param value: An ISO 8601 date and time, taken to be UTC when it has no offset
+    :return: An aware datetime, or None if the value is not valid
+    """
+    try:
+        created = dateparse.parse_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if created is not None and timezone.is_naive(created):
+        created = timezone.make_aware(created, timezone.utc)
+    return created
+
+
+def copy_rows(model, columns, rows):
+    """
+    Load rows into a table with PostgreSQL's COPY
+
+    :param model: The model of the table
+    :param columns: The names of the columns
+    :param rows: list of rows, each a list of values for the columns
+    """
+    data = io.StringIO()
+    csv.writer(data).writerows(rows)
+    data.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in columns)), data)
+
+
+def historical_message_ids(messages):
+    """
+    Make snowflake ids from the created times of messages. The worker and sequence bits together number the messages
+    of each millisecond, after any id already used for it, so imports never reuse an id
+
+    :param messages: The unsaved messages
+    :return: list of ids for the messages, in the same order
+    """
+    shift = snowflake.WORKER_ID_BITS + snowflake.SEQUENCE_BITS
+    starts = [(snowflake.timestamp_ms(message.created) - snowflake.EPOCH) << shift for message in messages]
+    next_ids = {start: start for start in starts}
+    distinct = sorted(next_ids)
+    # Keep each query's expression small enough for SQLite
+    for index in range(0, len(distinct), 100):
+        ranges = [Q(id__gte=start, id__lt=start + (1 << shift)) for start in distinct[index:index + 100]]
+        for message_id in Message.objects.filter(reduce(operator.or_, ranges)).values_list('id', flat=True):
+            start = message_id >> shift << shift
+            next_ids[start] = max(next_ids[start], message_id + 1)
+
+    ids = []
+    for start in starts:
+        ids.append(next_ids[start])
+        next_ids[start] += 1
+    return ids
+
+
+def new_message_ids(count):
+    """
+    :param count: The number of ids needed
+    :return: list of ids for new messages from the table's sequence
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                       [Message._meta.db_table, count])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def load_messages(messages):
+    """
+    Save new messages in one COPY or bulk insert and update the data derived from them
+
+    :param messages: The unsaved messages
+    """
+    with transaction.atomic():
+        if settings.MESSAGE_SNOWFLAKE_IDS:
+            for message, message_id in zip(messages, historical_message_ids(messages)):
+                message.id = message_id
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                partitions.ensure_partitions(cursor, [message.created for message in messages])
+            if not settings.MESSAGE_SNOWFLAKE_IDS:
+                for message, message_id in zip(messages, new_message_ids(len(messages))):
+                    message.id = message_id
+            copy_rows(Message, ['id', 'message_text', 'created', 'user_id'],
+                      [[message.id, message.message_text, message.created.isoformat(), message.user_id]
+                       for message in messages])
+            messages_created.send(sender=Message, messages=messages)
+        else:
+            Message.objects.bulk_create(messages)
+
+
+def load_follows(follows):
+    """
+    Save new follows in one COPY or bulk insert, skipping any that already exist, and update the counters
+
+    :param follows: The unsaved follows
+    :return: The follows saved
+    """
+    followers = {follow.follower_id_id for follow in follows}
+    with transaction.atomic():
+        existing = set(Follow.objects.filter(follower_id__in=followers)
+                       .values_list('follower_id', 'following_id'))
+        new_follows = []
+        for follow in follows:
+            pair = (follow.follower_id_id, follow.following_id_id)
+            if pair not in existing and pair[0] != pair[1]:
+                existing.add(pair)
+                new_follows.append(follow)
+        if connection.vendor == 'postgresql':
+            copy_rows(Follow, [Follow._meta.get_field('follower_id').column,
+                               Follow._meta.get_field('following_id').column],
+                      [[follow.follower_id_id, follow.following_id_id] for follow in new_follows])
+            follows_created.send(sender=Follow, follows=new_follows)
+        else:
+            Follow.objects.bulk_create(new_follows)
+    return new_follows
+
+
+class Importer:
+    """
+    Loads records in batches, keeping count of what was imported and skipped
+    """
+
+    def __init__(self, batch_size=None, progress=None):
+        """
+        :param batch_size: The number of records per batch, defaults to IMPORT_BATCH_SIZE
+        :param progress: Optional function called with the importer after every batch
+        """
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.progress = progress
+        self.usernames = UsernameCache()
+        self.counts = {'message': 0, 'follow': 0, 'skipped': 0}
+        self.message_users = set()
+        self.follow_users = set()
+
+    def run(self, records):
+        """
+        :param records: Iterable of records, see read_ndjson and read_csv
+        """
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self.load_batch(batch)
+                batch = []
+        if batch:
+            self.load_batch(batch)
+
+    def load_batch(self, batch):
+        """
+        Load one batch of records, skipping those that are malformed or name users that do not exist
+
+        :param batch: list of records
+        """
+        valid = [record for record in batch if isinstance(record, dict) and record.get('type') in FIELDS
+                 and all(isinstance(record.get(field), str) for field in FIELDS[record['type']])]
+        self.counts['skipped'] += len(batch) - len(valid)
+        user_ids = self.usernames.resolve(record[field] for record in valid for field in FIELDS[record['type']]
+                                          if field in ('username', 'follower', 'following'))
+
+        messages = []
+        follows = []
+        for record in valid:
+            if record['type'] == 'message':
+                created = parse_created(record['created'])
+                if record['username'] in user_ids and created and len(record['message_text']) <= 280:
+                    messages.append(Message(message_text=record['message_text'], created=created,
+                                            user_id=user_ids[record['username']]))
+                    continue
+            elif record['follower'] in user_ids and record['following'] in user_ids:
+                follows.append(Follow(follower_id_id=user_ids[record['follower']],
+                                      following_id_id=user_ids[record['following']]))
+                continue
+            self.counts['skipped'] += 1
+
+        if messages:
+            load_messages(messages)
+            self.message_users.update(message.user_id for message in messages)
+        if follows:
+            saved = load_follows(follows)
+            self.counts['skipped'] += len(follows) - len(saved)
+            follows = saved
+            self.follow_users.update(user_id for follow in follows
+                                     for user_id in (follow.follower_id_id, follow.following_id_id))
+        self.counts['message'] += len(messages)
+        self.counts['follow'] += len(follows)
+        if self.progress:
+            self.progress(self)
+
+    def finish(self, rebuild_counters=True):
+        """
+        Update the data derived from everything imported: cached timelines, counters, leaderboards and trending tags
+
+        :param rebuild_counters: Recount the follower and activity counters from the tables
+        """
+        from . import leaderboard, trending
+        from .signals import follows_changed, messages_changed
+        messages_changed(self.message_users)
+        follows_changed(self.follow_users)
+        if rebuild_counters:
+            leaderboard.rebuild_counters()
+        leaderboard.refresh_leaderboards()
+        trending.refresh_top_tags()
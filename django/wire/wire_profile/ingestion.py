@@ -0,0 +1,199 @@
+"""
+Write-behind ingestion for new messages.
+
+When MESSAGE_INGESTION['MODE'] is 'batched', validated messages are appended to a local append-only queue file instead
+of being inserted one at a time. The flush_message_queue management command saves queued messages with bulk_create,
+so write throughput depends on the batch size rather than the commit rate.
+
+Flushing claims the queue by renaming it, writers then start a new file. A claimed file is only removed once its
+messages have been committed. If the worker stops between the commit and the removal, the next flush finds the messages
+already saved, matching them on their author, creation time and text, and does not insert them again. Messages whose
+author has since been deleted are dropped. A claimed file that still fails to save after MAX_FLUSH_ATTEMPTS flushes is
+renamed to end in .failed and left for an administrator, so it cannot hold up the rest of the queue.
+"""
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, transaction
+from django.utils.dateparse import parse_datetime
+from .models import Message
+from .signals import messages_changed
+
+logger = logging.getLogger(__name__)
+
+
+def is_batched():
+    """
+    :return: True if new messages should be queued rather than saved straight away
+    """
+    return settings.MESSAGE_INGESTION['MODE'] == 'batched'
+
+
+def queue_path():
+    """
+    :return: The path of the file new messages are appended to
+    """
+    return settings.MESSAGE_INGESTION['QUEUE_PATH']
+
+
+@contextmanager
+def queue_lock(name='lock'):
+    """
+    Hold an exclusive lock on the queue so appending and claiming never interleave
+
+    :param name: The lock to hold, 'lock' guards the queue file and 'flush' allows only one flush at a time
+    """
+    with open('{}.{}'.format(queue_path(), name), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def enqueue_message(user, message_text, created):
+    """
+    Durably append a message to the queue
+
+    :param user: The user creating the message
+    :param message_text: The contents of the message
+    :param created: When the message was created
+    """
+    record = json.dumps({'user': user.id, 'message_text': message_text, 'created': created.isoformat()})
+    with queue_lock():
+        with open(queue_path(), 'a') as queue:
+            queue.write(record + '\n')
+            queue.flush()
+            os.fsync(queue.fileno())
+
+
+def claimed_paths():
+    """
+    :return: Queue files claimed by a flush that have not been saved yet, oldest first
+    """
+    return sorted(glob.glob(queue_path() + '.*.flushing'))
+
+
+def read_queue_file(path):
+    """
+    Read the queued messages in a queue file
+
+    :param path: The queue file to read
+    :return: list of dictionaries with the message_text, created and user of each message
+    """
+    records = []
+    try:
+        with open(path) as queue:
+            for line in queue:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A write interrupted by a crash leaves a partial line, the request that made it was not completed
+                    continue
+                record['created'] = parse_datetime(record['created'])
+                records.append(record)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def pending_count():
+    """
+    :return: The number of messages waiting in the queue that has not been claimed
+    """
+    try:
+        with open(queue_path()) as queue:
+            return sum(1 for _ in queue)
+    except FileNotFoundError:
+        return 0
+
+
+def pending_messages(user_id):
+    """
+    Get messages from the given user that are queued but not saved yet, so authors can read their own writes
+
+    :param user_id: The id of the user to get queued messages for
+    :return: list of dictionaries with the message_text, created and user of each message, newest first
+    """
+    records = []
+    for path in claimed_paths() + [queue_path()]:
+        records += [record for record in read_queue_file(path) if record['user'] == user_id]
+    return sorted(records, key=lambda record: record['created'], reverse=True)
+
+
+def unsaved_records(records):
+    """
+    Leave out queued messages that are already saved, or whose author no longer exists
+
+    :param records: Queued messages, see read_queue_file
+    :return: list of the messages still to save
+    """
+    user_ids = {record['user'] for record in records}
+    existing_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    saved = set(Message.objects.filter(
+        user_id__in=existing_users, created__in={record['created'] for record in records}
+    ).values_list('user_id', 'created', 'message_text'))
+    return [record for record in records if record['user'] in existing_users
+            and (record['user'], record['created'], record['message_text']) not in saved]
+
+
+def count_failure(path):
+    """
+    Count a failed attempt to save a claimed file, and move it aside after MAX_FLUSH_ATTEMPTS failures
+
+    :param path: The claimed queue file
+    """
+    attempts_path = path + '.attempts'
+    try:
+        with open(attempts_path) as attempts_file:
+            attempts = int(attempts_file.read() or 0) + 1
+    except (FileNotFoundError, ValueError):
+        attempts = 1
+    if attempts < settings.MESSAGE_INGESTION['MAX_FLUSH_ATTEMPTS']:
+        with open(attempts_path, 'w') as attempts_file:
+            attempts_file.write(str(attempts))
+        return
+    failed_path = path[:-len('.flushing')] + '.failed'
+    os.rename(path, failed_path)
+    os.remove(attempts_path)
+    logger.error('Queued messages could not be saved after %s attempts, moved them to %s', attempts, failed_path)
+
+
+def flush_queue(batch_size=None):
+    """
+    Save every queued message using bulk inserts
+
+    :param batch_size: The number of messages to insert per query, defaults to MESSAGE_INGESTION['MAX_BATCH_SIZE']
+    :return: The number of messages saved
+    """
+    batch_size = batch_size or settings.MESSAGE_INGESTION['MAX_BATCH_SIZE']
+    saved = 0
+    with queue_lock('flush'):
+        with queue_lock():
+            if os.path.exists(queue_path()) and os.path.getsize(queue_path()) > 0:
+                os.rename(queue_path(), '{}.{:020d}.flushing'.format(queue_path(), int(time.time() * 1000000)))
+
+        for path in claimed_paths():
+            try:
+                with transaction.atomic():
+                    records = unsaved_records(read_queue_file(path))
+                    Message.objects.bulk_create([
+                        Message(message_text=record['message_text'], created=record['created'], user_id=record['user'])
+                        for record in records
+                    ], batch_size=batch_size)
+            except DatabaseError:
+                logger.exception('Failed to save the queued messages in %s', path)
+                count_failure(path)
+                continue
+            messages_changed([record['user'] for record in records])
+            os.remove(path)
+            if os.path.exists(path + '.attempts'):
+                os.remove(path + '.attempts')
+            saved += len(records)
+    return saved
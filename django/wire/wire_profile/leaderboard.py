@@ -0,0 +1,135 @@
+"""
+Leaderboards of the most followed users and the most active posters.
+
+Follower counts are kept in UserStats and daily message counts in UserActivity. Both are updated as follows and
+messages are created and deleted, so nothing has to group the whole follow or message tables. The top users are
+computed from those counters and cached, so serving a leaderboard, or ranking by it, costs a single cache read.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from base.cache import cached_query, compute_and_store, versioned_key
+from .counters import add_to_counters
+from .models import Follow, Message, UserActivity, UserStats
+
+
+def day_of(moment):
+    """
+    :param moment: An aware datetime
+    :return: The UTC date of the given time
+    """
+    return moment.astimezone(timezone.utc).date()
+
+
+def count_follows(follows, amount=1):
+    """
+    Add new follows to the follower counts, or take deleted ones off
+
+    :param follows: The follows
+    :param amount: 1 for new follows, -1 for deleted ones
+    """
+    counts = Counter()
+    for follow in follows:
+        counts[(follow.following_id_id,)] += amount
+    add_to_counters(UserStats, ('user_id',), 'followers', counts, create=amount > 0)
+
+
+def count_messages(messages, amount=1):
+    """
+    Add new messages to the daily activity counts, or take deleted ones off
+
+    :param messages: The messages
+    :param amount: 1 for new messages, -1 for deleted ones
+    """
+    counts = Counter()
+    for message in messages:
+        counts[(message.user_id, day_of(message.created))] += amount
+    add_to_counters(UserActivity, ('user_id', 'day'), 'messages', counts, create=amount > 0)
+
+
+def compute_top_followed():
+    """
+    :return: list of the most followed users and their follower counts, most followed first
+    """
+    return list(UserStats.objects.filter(followers__gt=0, user__is_active=True).order_by('-followers', 'user_id')
+                .values('user_id', 'user__username', 'followers')[:settings.LEADERBOARD_SIZE])
+
+
+def compute_top_active(now=None):
+    """
+    :param now: An aware datetime for the end of the window, defaults to now
+    :return: list of the users who created the most messages in the last LEADERBOARD_ACTIVITY_DAYS days and their
+        message counts, most active first
+    """
+    since = day_of(now or datetime.now(timezone.utc)) - timedelta(days=settings.LEADERBOARD_ACTIVITY_DAYS)
+    return list(UserActivity.objects.filter(day__gt=since, user__is_active=True).values('user_id', 'user__username')
+                .annotate(messages=Sum('messages')).filter(messages__gt=0)
+                .order_by('-messages', 'user_id')[:settings.LEADERBOARD_SIZE])
+
+
+LEADERBOARDS = {
+    'followers': compute_top_followed,
+    'active': compute_top_active,
+}
+
+
+def top_users(leaderboard):
+    """
+    Get a leaderboard, as last computed by refresh_leaderboards
+
+    :param leaderboard: The name of a leaderboard in LEADERBOARDS
+    :return: list of dictionaries with user_id, user__username and the count the leaderboard is ranked by
+    """
+    return cached_query('leaderboard:' + leaderboard, [], LEADERBOARDS[leaderboard],
+                        timeout=settings.LEADERBOARD_TIMEOUT)
+
+
+def refresh_leaderboards():
+    """
+    Compute every leaderboard and store it for top_users to serve
+    """
+    for leaderboard, compute in LEADERBOARDS.items():
+        compute_and_store(versioned_key('leaderboard:' + leaderboard, []), compute, settings.LEADERBOARD_TIMEOUT)
+
+
+def follower_ranks():
+    """
+    :return: dictionary of the usernames on the most followed leaderboard to their follower counts
+    """
+    return {entry['user__username']: entry['followers'] for entry in top_users('followers')}
+
+
+def prune_activity(now=None):
+    """
+    Delete daily counts that are no longer inside the activity window
+
+    :param now: An aware datetime, defaults to now
+    :return: The number of daily counts deleted
+    """
+    since = day_of(now or datetime.now(timezone.utc)) - timedelta(days=settings.LEADERBOARD_ACTIVITY_DAYS)
+    return UserActivity.objects.filter(day__lte=since).delete()[0]
+
+
+def rebuild_counters(now=None):
+    """
+    Recount the follower and activity counters from the follow and message tables, correcting any drift
+
+    :param now: An aware datetime, defaults to now
+    """
+    since = day_of(now or datetime.now(timezone.utc)) - timedelta(days=settings.LEADERBOARD_ACTIVITY_DAYS)
+    start = datetime.combine(since + timedelta(days=1), time.min, tzinfo=timezone.utc)
+    activity = Counter()
+    for user_id, created in Message.objects.filter(created__gte=start).values_list('user_id', 'created').iterator():
+        activity[(user_id, day_of(created))] += 1
+
+    with transaction.atomic():
+        UserStats.objects.all().delete()
+        UserStats.objects.bulk_create(
+            UserStats(user_id=row['following_id'], followers=row['followers'])
+            for row in Follow.objects.values('following_id').annotate(followers=Count('id')).order_by()
+        )
+        UserActivity.objects.all().delete()
+        UserActivity.objects.bulk_create(UserActivity(user_id=user_id, day=day, messages=messages)
+                                         for (user_id, day), messages in activity.items())
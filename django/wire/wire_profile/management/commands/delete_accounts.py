@@ -0,0 +1,43 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from base import invalidation
+from wire_profile import deletion
+
+
+class Command(BaseCommand):
+    help = 'Delete the data of deleted accounts in batches, resuming any deletion that was interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Finish the pending deletions and exit')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Number of seconds between checks for new deletions')
+        parser.add_argument('--batch-size', type=int, default=settings.ACCOUNT_DELETION_BATCH_SIZE,
+                            help='The most rows to delete in one transaction')
+        parser.add_argument('--pause', type=float, default=settings.ACCOUNT_DELETION_BATCH_PAUSE,
+                            help='Number of seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        """
+        Carry out every pending account deletion, oldest first
+
+        :param args: unused
+        :param options: command line options
+        """
+        self.verbosity = options['verbosity']
+        if not options['once']:
+            # Hear about data changed by other processes while this one runs, see base/invalidation.py
+            invalidation.start_listener()
+        while True:
+            for account_deletion in deletion.pending_deletions():
+                self.stdout.write('Deleting {}'.format(account_deletion.username))
+                deletion.run_deletion(account_deletion, options['batch_size'], options['pause'], self.report)
+                self.stdout.write('Deleted {} and {} rows of their data'.format(
+                    account_deletion.username, account_deletion.deleted_rows))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def report(self, account_deletion):
+        if self.verbosity > 1:
+            self.stdout.write('  {}: {} rows deleted'.format(account_deletion.stage, account_deletion.deleted_rows))
@@ -0,0 +1,41 @@
+import gzip
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from wire_profile import export
+
+
+class Command(BaseCommand):
+    help = "Export a user's account, messages, followers and following as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='The user to export')
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='ndjson', help='The export format')
+        parser.add_argument('--output', default='-', help='The file to write to, - for standard output')
+        parser.add_argument('--gzip', action='store_true', help='Compress the export with gzip')
+
+    def handle(self, *args, **options):
+        """
+        Stream the export to a file, reading a chunk of rows at a time so memory use stays constant
+
+        :param args: unused
+        :param options: command line options
+        """
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('There is no user named {}'.format(options['username']))
+
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            # Closing a GzipFile writes the gzip trailer but leaves the file it wraps open
+            destination = gzip.GzipFile(fileobj=output, mode='wb') if options['gzip'] else output
+            for chunk in export.export_chunks(user, options['format']):
+                destination.write(chunk)
+            if options['gzip']:
+                destination.close()
+        finally:
+            if output is sys.stdout.buffer:
+                output.flush()
+            else:
+                output.close()
@@ -0,0 +1,39 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from base import invalidation
+from wire_profile import ingestion
+
+
+class Command(BaseCommand):
+    help = 'Save messages queued by batched ingestion using bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Flush the queue once and exit')
+        parser.add_argument('--batch-size', type=int, default=settings.MESSAGE_INGESTION['MAX_BATCH_SIZE'],
+                            help='Flush as soon as this many messages are queued')
+        parser.add_argument('--max-latency', type=float, default=settings.MESSAGE_INGESTION['MAX_FLUSH_LATENCY'],
+                            help='Maximum number of seconds a message waits in the queue')
+
+    def handle(self, *args, **options):
+        """
+        Flush the message queue whenever a full batch is waiting or the maximum latency has passed
+
+        :param args: unused
+        :param options: command line options
+        """
+        if options['once']:
+            self.stdout.write('Saved {} messages'.format(ingestion.flush_queue(options['batch_size'])))
+            return
+
+        poll_interval = min(options['max_latency'] / 10, 0.1)
+        deadline = time.monotonic() + options['max_latency']
+        # Hear about data changed by other processes while this one runs, see base/invalidation.py
+        invalidation.start_listener()
+        while True:
+            if time.monotonic() >= deadline or ingestion.pending_count() >= options['batch_size']:
+                saved = ingestion.flush_queue(options['batch_size'])
+                if saved:
+                    self.stdout.write('Saved {} messages'.format(saved))
+                deadline = time.monotonic() + options['max_latency']
+            time.sleep(poll_interval)
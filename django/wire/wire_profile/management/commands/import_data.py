@@ -0,0 +1,68 @@
+import gzip
+import io
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from wire_profile import importer
+
+
+class Command(BaseCommand):
+    help = 'Import messages and follows from NDJSON or CSV dumps in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Files to import, - for standard input, .gz files are decompressed')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson', help='The format of the files')
+        parser.add_argument('--type', choices=sorted(importer.FIELDS),
+                            help='The type of every record in CSV files, whose header names the fields')
+        parser.add_argument('--batch-size', type=int, help='The number of records loaded in one transaction')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Do not recount the follower and activity counters after importing')
+
+    def handle(self, *args, **options):
+        """
+        Stream the records from each file into the database, then rebuild the data derived from them
+
+        :param args: unused
+        :param options: command line options
+        """
+        if options['format'] == 'csv' and not options['type']:
+            raise CommandError('CSV files need --type')
+
+        start = time.monotonic()
+        verbosity = options['verbosity']
+
+        def report(run):
+            if verbosity > 1:
+                self.stdout.write(self.rate(run, start))
+
+        run = importer.Importer(batch_size=options['batch_size'], progress=report)
+        for path in options['files']:
+            with self.open(path) as lines:
+                if options['format'] == 'csv':
+                    run.run(importer.read_csv(lines, options['type']))
+                else:
+                    run.run(importer.read_ndjson(lines))
+        run.finish(rebuild_counters=not options['skip_rebuild'])
+        self.stdout.write(self.rate(run, start))
+
+    def open(self, path):
+        """
+        :param path: A file path, - for standard input
+        :return: The file opened as text, decompressed if its name ends in .gz
+        """
+        if path == '-':
+            return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8', newline='')
+        return open(path, encoding='utf-8', newline='')
+
+    def rate(self, run, start):
+        """
+        :param run: The Importer
+        :param start: The time.monotonic() the import started at
+        :return: A line with the numbers of rows imported and skipped, and the rows imported per second
+        """
+        imported = run.counts['message'] + run.counts['follow']
+        elapsed = max(time.monotonic() - start, 0.001)
+        return 'Imported {} messages and {} follows, skipped {} records, {:.0f} rows/s'.format(
+            run.counts['message'], run.counts['follow'], run.counts['skipped'], imported / elapsed)
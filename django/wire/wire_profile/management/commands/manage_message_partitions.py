@@ -0,0 +1,45 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from wire_profile import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions of the message table and detach old ones (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Create partitions for this many months after the current one')
+        parser.add_argument('--detach-before', metavar='YYYY-MM',
+                            help='Detach partitions for months before this one')
+        parser.add_argument('--no-concurrently', action='store_true',
+                            help='Detach with an exclusive lock, for PostgreSQL versions before 14')
+
+    def handle(self, *args, **options):
+        """
+        Create future partitions and optionally detach old partitions
+
+        :param args: unused
+        :param options: command line options
+        """
+        if not partitions.supports_partitioning(connection):
+            raise CommandError('The message table can only be partitioned on PostgreSQL 11 or later')
+
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                raise CommandError('The message table is not partitioned')
+            for month in partitions.create_future_partitions(cursor, timezone.now(), options['months_ahead']):
+                self.stdout.write('Partition {} is ready'.format(partitions.partition_name(month)))
+
+            if options['detach_before']:
+                try:
+                    year, month = map(int, options['detach_before'].split('-'))
+                    cutoff = datetime(year, month, 1, tzinfo=timezone.utc)
+                except ValueError:
+                    raise CommandError('--detach-before must be a month in the form YYYY-MM')
+
+                for month in partitions.partition_months(cursor):
+                    if month < cutoff:
+                        partitions.detach_partition(cursor, month, concurrently=not options['no_concurrently'])
+                        self.stdout.write('Detached partition {}'.format(partitions.partition_name(month)))
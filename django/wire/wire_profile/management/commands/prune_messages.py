@@ -0,0 +1,48 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from wire_profile import retention
+
+
+class Command(BaseCommand):
+    help = 'Delete messages beyond the retention limits in small batches, optionally archiving them first'
+
+    def add_arguments(self, parser):
+        retention_settings = settings.MESSAGE_RETENTION
+        parser.add_argument('--max-age-days', type=int, default=retention_settings['MAX_AGE_DAYS'],
+                            help='Prune messages created more than this many days ago')
+        parser.add_argument('--max-per-user', type=int, default=retention_settings['MAX_PER_USER'],
+                            help="Prune each user's messages beyond their newest ones")
+        parser.add_argument('--batch-size', type=int, default=retention_settings['BATCH_SIZE'],
+                            help='The most messages to prune in one transaction')
+        parser.add_argument('--pause', type=float, default=retention_settings['BATCH_PAUSE'],
+                            help='Number of seconds to wait after each batch')
+        parser.add_argument('--archive-dir', default=retention_settings['ARCHIVE_DIR'],
+                            help='Write pruned messages to a gzipped NDJSON file in this directory first')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the messages that would be pruned')
+
+    def handle(self, *args, **options):
+        """
+        Prune messages by age, then by the number each user has
+
+        :param args: unused
+        :param options: command line options
+        """
+        if options['max_age_days'] is None and options['max_per_user'] is None:
+            raise CommandError('Set MESSAGE_RETENTION or pass --max-age-days or --max-per-user')
+        archive = None
+        if options['archive_dir'] and not options['dry_run']:
+            archive = retention.Archive(options['archive_dir'])
+
+        verb = 'Would prune' if options['dry_run'] else 'Pruned'
+        batch_options = {'batch_size': options['batch_size'], 'pause': options['pause'], 'archive': archive,
+                         'dry_run': options['dry_run']}
+        if options['max_age_days'] is not None:
+            pruned = retention.prune_expired(options['max_age_days'], **batch_options)
+            self.stdout.write('{} {} messages older than {} days'.format(verb, pruned, options['max_age_days']))
+        if options['max_per_user'] is not None:
+            pruned = retention.prune_excess(options['max_per_user'], **batch_options)
+            self.stdout.write('{} {} messages beyond the newest {} of each user'.format(
+                verb, pruned, options['max_per_user']))
+        if archive and os.path.exists(archive.path):
+            self.stdout.write('Archived pruned messages to {}'.format(archive.path))
@@ -0,0 +1,38 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from base import invalidation
+from wire_profile import leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recompute the leaderboards and delete activity counts that are no longer needed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Refresh once and exit')
+        parser.add_argument('--interval', type=float, default=settings.LEADERBOARD_TIMEOUT / 2,
+                            help='Number of seconds between refreshes')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recount every counter from the follow and message tables first')
+
+    def handle(self, *args, **options):
+        """
+        Refresh the leaderboards, so they are always served from the cache
+
+        :param args: unused
+        :param options: command line options
+        """
+        if options['rebuild']:
+            leaderboard.rebuild_counters()
+            self.stdout.write('Rebuilt the leaderboard counters')
+        if not options['once']:
+            # Hear about data changed by other processes while this one runs, see base/invalidation.py
+            invalidation.start_listener()
+        while True:
+            leaderboard.refresh_leaderboards()
+            deleted = leaderboard.prune_activity()
+            if deleted:
+                self.stdout.write('Deleted {} old activity counts'.format(deleted))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from base import invalidation
+from wire_profile import trending
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending hashtags and delete counters that are no longer needed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Refresh once and exit')
+        parser.add_argument('--interval', type=float, default=settings.TRENDING_TAG_TIMEOUT / 2,
+                            help='Number of seconds between refreshes')
+
+    def handle(self, *args, **options):
+        """
+        Refresh the trending hashtags, so they are always served from the cache
+
+        :param args: unused
+        :param options: command line options
+        """
+        if not options['once']:
+            # Hear about data changed by other processes while this one runs, see base/invalidation.py
+            invalidation.start_listener()
+        while True:
+            trending.refresh_top_tags()
+            deleted = trending.prune_counters()
+            if deleted:
+                self.stdout.write('Deleted {} old counters'.format(deleted))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
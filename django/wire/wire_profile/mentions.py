@@ -0,0 +1,69 @@
+"""
+Mentions of users in messages.
+
+New messages are scanned for @username, every mentioned username is resolved in one query, and a Mention row is saved
+for each mentioned user. A user's mentions are read newest first from the (user, message) index, so their inbox never
+has to search the text of every message.
+"""
+import re
+from django.contrib.auth.models import User
+from base.invalidation import publish
+from .models import Mention, Message
+
+MENTION = re.compile(r'(?<![\w@])@([\w.@+-]{1,150})')
+
+
+def find_mentions(message_text):
+    """
+    :param message_text: The text of a message
+    :return: The distinct usernames mentioned in the text, without the @
+    """
+    # A full stop straight after a mention ends the sentence rather than the username
+    return {username.rstrip('.') for username in MENTION.findall(message_text)} - {''}
+
+
+def fill_in_ids(messages):
+    """
+    Fill in the ids of messages saved by a bulk insert on a database that does not return them
+
+    :param messages: Saved messages, their ids are set in place
+    """
+    missing = [message for message in messages if message.id is None]
+    if missing:
+        saved = Message.objects.filter(user_id__in={message.user_id for message in missing},
+                                       created__in={message.created for message in missing})
+        ids = {(user_id, created, message_text): message_id for message_id, user_id, created, message_text
+               in saved.values_list('id', 'user_id', 'created', 'message_text')}
+        for message in missing:
+            message.id = ids.get((message.user_id, message.created, message.message_text))
+
+
+def record_mentions(messages):
+    """
+    Save the mentions in new messages
+
+    :param messages: The new messages
+    """
+    mentioned = [(message, find_mentions(message.message_text)) for message in messages]
+    mentioned = [(message, usernames) for message, usernames in mentioned if usernames]
+    if not mentioned:
+        return
+
+    user_ids = dict(User.objects.filter(username__in=set().union(*[usernames for message, usernames in mentioned]))
+                    .values_list('username', 'id'))
+    fill_in_ids([message for message, usernames in mentioned])
+    # Identical messages from one bulk insert resolve to the same id, so only mention each user once per id
+    pairs = {(message.id, user_ids[username]) for message, usernames in mentioned if message.id is not None
+             for username in usernames if username in user_ids}
+    Mention.objects.bulk_create([Mention(message_id=message_id, user_id=user_id) for message_id, user_id in pairs])
+    mentions_changed([user_id for message_id, user_id in pairs])
+
+
+def mentions_changed(user_ids):
+    """
+    Invalidate cached data depending on the mentions of the given users
+
+    :param user_ids: The ids of the mentioned users
+    """
+    if user_ids:
+        publish(*['mentions:user:{}'.format(user_id) for user_id in set(user_ids)])
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:20
+
+from django.db import migrations, models
+from django.utils import timezone
+from wire_profile import partitions
+
+
+def partition_message_table(apps, schema_editor):
+    """
+    Partition the message table by month on PostgreSQL 11 or later. Other databases keep a single table
+    """
+    if not partitions.supports_partitioning(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        partitions.partition_table(cursor, timezone.now())
+
+
+def unpartition_message_table(apps, schema_editor):
+    if not partitions.supports_partitioning(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if partitions.is_partitioned(cursor):
+            partitions.unpartition_table(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wire_profile', '0004_message_bigint_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_message_table, unpartition_message_table),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['user', '-created', '-id'], name='message_user_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['-created', '-id'], name='message_created_id_idx'),
+        ),
+    ]
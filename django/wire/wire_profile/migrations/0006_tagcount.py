@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wire_profile', '0005_partition_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100)),
+                ('period', models.IntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tagcount',
+            index=models.Index(fields=['period', 'bucket'], name='tagcount_period_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tagcount',
+            unique_together={('tag', 'period', 'bucket')},
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:36
+
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def count_existing(apps, schema_editor):
+    """
+    Fill the leaderboard counters from the existing follows and recent messages
+    """
+    Follow = apps.get_model('wire_profile', 'Follow')
+    Message = apps.get_model('wire_profile', 'Message')
+    UserStats = apps.get_model('wire_profile', 'UserStats')
+    UserActivity = apps.get_model('wire_profile', 'UserActivity')
+
+    UserStats.objects.bulk_create(
+        UserStats(user_id=row['following_id'], followers=row['followers'])
+        for row in Follow.objects.values('following_id').annotate(followers=Count('id')).order_by()
+    )
+    activity = Counter()
+    recent = Message.objects.filter(created__gte=timezone.now() - timedelta(days=settings.LEADERBOARD_ACTIVITY_DAYS))
+    for user_id, created in recent.values_list('user_id', 'created').iterator():
+        activity[(user_id, created.astimezone(timezone.utc).date())] += 1
+    UserActivity.objects.bulk_create(UserActivity(user_id=user_id, day=day, messages=messages)
+                                     for (user_id, day), messages in activity.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wire_profile', '0007_mention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('messages', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('followers', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(fields=['-followers'], name='userstats_followers_idx'),
+        ),
+        migrations.AddField(
+            model_name='useractivity',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['day'], name='useractivity_day_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='useractivity',
+            unique_together={('user', 'day')},
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
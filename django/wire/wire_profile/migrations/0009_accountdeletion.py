@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wire_profile', '0008_leaderboard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDeletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150)),
+                ('requested', models.DateTimeField()),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('stage', models.CharField(default='mentions', max_length=20)),
+                ('deleted_rows', models.BigIntegerField(default=0)),
+                ('user', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deletion', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='accountdeletion',
+            index=models.Index(fields=['finished', 'requested'], name='accountdeletion_pending_idx'),
+        ),
+    ]
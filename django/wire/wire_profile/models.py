@@ -1,16 +1,242 @@
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
+from django.dispatch import Signal
+from django.utils import timezone
 from django.contrib.auth.models import User
+from . import snowflake
+
+# Sent with the list of new messages whenever messages are created, one at a time or in bulk
+messages_created = Signal(providing_args=['messages'])
+
+# Sent with the list of new follows whenever follows are created, one at a time or in bulk
+follows_created = Signal(providing_args=['follows'])
+
+
+def newest_first_order(prefix=''):
+    """
+    :param prefix: The path from the model being ordered to its message, such as 'message__', or '' for messages
+    :return: list of the fields that order messages from newest to oldest, see MessageQuerySet.newest_first
+    """
+    if settings.MESSAGE_SNOWFLAKE_IDS:
+        return ['-{}id'.format(prefix)]
+    return ['-{}created'.format(prefix), '-{}id'.format(prefix)]
+
+
+def position_filter(created, message_id, older, prefix=''):
+    """
+    :param created: The created time of a position in the newest first order, or None to compare ids alone
+    :param message_id: The id of the position
+    :param older: True for the messages that come after it in newest first order, False for those before it
+    :param prefix: The path from the model being filtered to its message, such as 'message__', or '' for messages
+    :return: The filter keeping the messages after or before the position
+    """
+    direction = 'lt' if older else 'gt'
+    by_id = models.Q(**{'{}id__{}'.format(prefix, direction): message_id})
+    if created is None or settings.MESSAGE_SNOWFLAKE_IDS:
+        return by_id
+    return models.Q(**{'{}created__{}'.format(prefix, direction): created}) | \
+        (models.Q(**{'{}created'.format(prefix): created}) & by_id)
+
+
+def page_filter(message_id, older, prefix=''):
+    """
+    :param message_id: The id of a message already shown
+    :param older: True for the messages that come after it in newest first order, False for those before it
+    :param prefix: The path from the model being filtered to its message, such as 'message__', or '' for messages
+    :return: The filter keeping the messages after or before the given message. When it has been deleted, messages
+        are compared on its id alone
+    """
+    created = None
+    if not settings.MESSAGE_SNOWFLAKE_IDS:
+        created = Message.objects.filter(id=message_id).values_list('created', flat=True).first()
+    return position_filter(created, message_id, older, prefix)
+
+
+class MessageQuerySet(models.QuerySet):
+    def newest_first(self):
+        """
+        Order messages from newest to oldest, using the primary key when ids are time ordered. Otherwise ids only break
+        ties between messages created at the same time, as messages can be saved in a different order to the one they
+        were created in, by imports and batched ingestion
+        """
+        return self.order_by(*newest_first_order())
+
+    def page_from(self, message_id, older):
+        """
+        Keep the messages after or before the given message in the newest_first order, for paging on a message already
+        shown
+
+        :param message_id: The id of a message
+        :param older: True for the messages that come after it in newest first order, False for those before it
+        :return: The filtered messages
+        """
+        return self.filter(page_filter(message_id, older))
+
+    def older_than(self, created, message_id):
+        """
+        Keep the messages that come after the given position in the newest_first order, for paging on a message that
+        may have been deleted since
+
+        :param created: The created time of the position
+        :param message_id: The id of the position
+        :return: The filtered messages
+        """
+        return self.filter(position_filter(created, message_id, older=True))
+
+    def recent(self):
+        """
+        Only include messages from the last MESSAGE_RECENT_DAYS days, so partitioned tables only read recent months
+        """
+        return self.filter(created__gte=timezone.now() - timedelta(days=settings.MESSAGE_RECENT_DAYS))
+
+    def newest(self, count):
+        """
+        Get the newest messages, looking at recent messages first and only falling back to every message if there are
+        not enough of them
+
+        :param count: The number of messages to get
+        :return: list of messages, newest first
+        """
+        newest_messages = list(self.recent().newest_first()[:count])
+        if len(newest_messages) < count:
+            newest_messages = list(self.newest_first()[:count])
+        return newest_messages
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if settings.MESSAGE_SNOWFLAKE_IDS:
+            for obj in objs:
+                if obj.id is None:
+                    obj.id = snowflake.next_id()
+        created = super().bulk_create(objs, *args, **kwargs)
+        messages_created.send(sender=self.model, messages=created)
+        return created
 
 
 class Message(models.Model):
+    id = models.BigAutoField(primary_key=True)
     message_text = models.CharField(max_length=280)
     created = models.DateTimeField('created')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    objects = MessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created', '-id'], name='message_user_created_id_idx'),
+            models.Index(fields=['-created', '-id'], name='message_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.message_text
 
+    def save(self, *args, **kwargs):
+        if self.id is None and settings.MESSAGE_SNOWFLAKE_IDS:
+            self.id = snowflake.next_id()
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            messages_created.send(sender=Message, messages=[self])
+
+
+class FollowQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        follows_created.send(sender=self.model, follows=created)
+        return created
+
 
 class Follow(models.Model):
     follower_id = models.ForeignKey(User, related_name='follower_user', on_delete=models.CASCADE)
     following_id = models.ForeignKey(User, related_name='followed_user', on_delete=models.CASCADE)
+
+    objects = FollowQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            follows_created.send(sender=Follow, follows=[self])
+
+
+class TagCount(models.Model):
+    """
+    The number of messages using a hashtag in one time bucket, see wire_profile/trending.py
+    """
+    tag = models.CharField(max_length=100)
+    period = models.IntegerField()
+    bucket = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('tag', 'period', 'bucket')
+        indexes = [
+            models.Index(fields=['period', 'bucket'], name='tagcount_period_bucket_idx'),
+        ]
+
+
+class Mention(models.Model):
+    """
+    A user mentioned in a message, see wire_profile/mentions.py. The message table can be partitioned, which rules out
+    foreign keys to it in the database, so the relation is only enforced by Django
+    """
+    # Both columns lead one of the indexes below, so they need no index of their own
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, db_constraint=False, db_index=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        unique_together = ('message', 'user')
+        indexes = [
+            models.Index(fields=['user', '-message'], name='mention_user_message_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    """
+    The number of followers of a user, kept up to date as follows are created and deleted, see
+    wire_profile/leaderboard.py
+    """
+    user = models.OneToOneField(User, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    followers = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-followers'], name='userstats_followers_idx'),
+        ]
+
+
+class UserActivity(models.Model):
+    """
+    The number of messages a user created on one day, see wire_profile/leaderboard.py
+    """
+    # The user column leads the unique index below, so it needs no index of its own
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    messages = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'day')
+        indexes = [
+            models.Index(fields=['day'], name='useractivity_day_idx'),
+        ]
+
+
+class AccountDeletion(models.Model):
+    """
+    A deleted account whose messages, follows and mentions are being deleted in batches, see wire_profile/deletion.py
+    """
+    user = models.OneToOneField(User, null=True, related_name='deletion', on_delete=models.SET_NULL)
+    username = models.CharField(max_length=150)
+    requested = models.DateTimeField()
+    finished = models.DateTimeField(null=True, blank=True)
+    stage = models.CharField(max_length=20, default='mentions')
+    deleted_rows = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['finished', 'requested'], name='accountdeletion_pending_idx'),
+        ]
+
+    def __str__(self):
+        return self.username
@@ -0,0 +1,185 @@
+"""
+Range partitioning of the message table by the month messages were created, on PostgreSQL.
+
+Queries that filter on created only read the partitions for the months they cover, and old months can be detached
+from the table without rewriting it. PostgreSQL requires the partition key in the primary key, so the primary key of a
+partitioned table is (id, created). Ids stay unique as they come from the sequence or from wire_profile.snowflake.
+
+Partitioning needs PostgreSQL 11 or later, older servers keep a single table. There is no default partition, as
+PostgreSQL cannot detach partitions concurrently while one exists. Inserting a message for a month without a partition
+fails, so the manage_message_partitions command should run regularly to create partitions a few months ahead. Imports
+of older messages create the partitions they need, see ensure_partitions.
+"""
+import re
+from datetime import datetime, timezone
+
+TABLE = 'wire_profile_message'
+PARTITION_NAME = re.compile(r'^' + TABLE + r'_y(\d{4})m(\d{2})$')
+
+
+def supports_partitioning(connection):
+    """
+    :param connection: A database connection
+    :return: True if the database can partition the message table, which needs PostgreSQL 11 or later
+    """
+    return connection.vendor == 'postgresql' and connection.pg_version >= 110000
+
+
+def is_partitioned(cursor):
+    """
+    :param cursor: A cursor for a PostgreSQL database
+    :return: True if the message table is partitioned
+    """
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass', [TABLE])
+    return cursor.fetchone()[0] == 'p'
+
+
+def month_start(moment):
+    """
+    :param moment: An aware datetime
+    :return: The start of the month containing the given time, in UTC
+    """
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, months):
+    """
+    :param month: The start of a month
+    :param months: The number of months to move forwards, or backwards if negative
+    :return: The start of the month the given number of months away
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month):
+    """
+    :param month: The start of a month
+    :return: The name of the partition holding messages from that month
+    """
+    return '{}_y{:04d}m{:02d}'.format(TABLE, month.year, month.month)
+
+
+def create_partition(cursor, month):
+    """
+    Create the partition for the given month if it does not exist
+
+    :param cursor: A cursor for a PostgreSQL database
+    :param month: The start of the month to create the partition for
+    """
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'.format(
+            partition_name(month), TABLE),
+        [month, add_months(month, 1)]
+    )
+
+
+def ensure_partitions(cursor, moments):
+    """
+    Create the partitions needed to insert messages created at the given times, if the message table is partitioned
+
+    :param cursor: A cursor for a PostgreSQL database
+    :param moments: Iterable of aware datetimes
+    """
+    if is_partitioned(cursor):
+        for month in sorted({month_start(moment) for moment in moments}):
+            create_partition(cursor, month)
+
+
+def partition_months(cursor):
+    """
+    :param cursor: A cursor for a PostgreSQL database
+    :return: The start of each month that has a partition attached to the message table, oldest first
+    """
+    cursor.execute(
+        'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE pg_inherits.inhparent = %s::regclass', [TABLE]
+    )
+    months = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc))
+    return sorted(months)
+
+
+def detach_partition(cursor, month, concurrently=True):
+    """
+    Detach the partition for the given month from the message table, leaving it as a standalone table.
+    Detaching concurrently (PostgreSQL 14+) avoids blocking queries on the message table, but cannot be run inside a
+    transaction
+
+    :param cursor: A cursor for a PostgreSQL database
+    :param month: The start of the month to detach
+    :param concurrently: Whether to detach without an exclusive lock on the message table
+    """
+    cursor.execute('ALTER TABLE {} DETACH PARTITION {}{}'.format(
+        TABLE, partition_name(month), ' CONCURRENTLY' if concurrently else ''))
+
+
+def create_future_partitions(cursor, now, months_ahead):
+    """
+    Create partitions from the month of the given time up to the given number of months ahead
+
+    :param cursor: A cursor for a PostgreSQL database
+    :param now: An aware datetime
+    :param months_ahead: The number of months after the current one to create partitions for
+    :return: The start of each month a partition was created or checked for
+    """
+    current = month_start(now)
+    months = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    for month in months:
+        create_partition(cursor, month)
+    return months
+
+
+def partition_table(cursor, now, months_ahead=3):
+    """
+    Replace the message table with a table partitioned by month, keeping every message and the id sequence
+
+    :param cursor: A cursor for a PostgreSQL database
+    :param now: An aware datetime
+    :param months_ahead: The number of months after the current one to create partitions for
+    """
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute('ALTER TABLE {0} RENAME TO {0}_unpartitioned'.format(TABLE))
+    cursor.execute('CREATE TABLE {0} (LIKE {0}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created)'
+                   .format(TABLE))
+    cursor.execute('ALTER TABLE {0} ADD CONSTRAINT {0}_pkey_partitioned PRIMARY KEY (id, created)'.format(TABLE))
+    cursor.execute('ALTER TABLE {0} ADD CONSTRAINT {0}_user_id_fk_partitioned FOREIGN KEY (user_id) '
+                   'REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED'.format(TABLE))
+
+    cursor.execute('SELECT MIN(created) FROM {}_unpartitioned'.format(TABLE))
+    oldest = cursor.fetchone()[0] or now
+    month = month_start(oldest)
+    while month < month_start(now):
+        create_partition(cursor, month)
+        month = add_months(month, 1)
+    create_future_partitions(cursor, now, months_ahead)
+
+    cursor.execute('INSERT INTO {0} SELECT * FROM {0}_unpartitioned'.format(TABLE))
+    cursor.execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(sequence, TABLE))
+    cursor.execute('DROP TABLE {}_unpartitioned'.format(TABLE))
+
+
+def unpartition_table(cursor):
+    """
+    Replace the partitioned message table with a single table, keeping every message and the id sequence
+
+    :param cursor: A cursor for a PostgreSQL database
+    """
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute('ALTER TABLE {0} RENAME TO {0}_partitioned'.format(TABLE))
+    cursor.execute('CREATE TABLE {0} (LIKE {0}_partitioned INCLUDING DEFAULTS)'.format(TABLE))
+    cursor.execute('ALTER TABLE {0} ADD CONSTRAINT {0}_pkey PRIMARY KEY (id)'.format(TABLE))
+    cursor.execute('ALTER TABLE {0} ADD CONSTRAINT {0}_user_id_fk FOREIGN KEY (user_id) '
+                   'REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED'.format(TABLE))
+    cursor.execute('CREATE INDEX {0}_user_id ON {0} (user_id)'.format(TABLE))
+    cursor.execute('INSERT INTO {0} SELECT * FROM {0}_partitioned'.format(TABLE))
+    cursor.execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(sequence, TABLE))
+    cursor.execute('DROP TABLE {}_partitioned CASCADE'.format(TABLE))
@@ -0,0 +1,139 @@
+"""
+Retention of messages.
+
+Messages older than MESSAGE_RETENTION['MAX_AGE_DAYS'] days, and every message of a user beyond their newest
+MESSAGE_RETENTION['MAX_PER_USER'], are deleted by the prune_messages command. They are deleted in small batches, each in
+its own transaction with a pause after it, so the dead rows left for vacuum arrive as a steady trickle. Expired messages
+are walked in id order from where the previous batch stopped, so no query has to skip over rows already deleted. Excess
+messages are only looked for among the users over the limit, found with one aggregate query, and each user's are walked
+newest first from their oldest kept message, again starting every batch where the previous one stopped. When an archive
+directory is given, each batch is written to a gzipped NDJSON file before it is deleted.
+
+On PostgreSQL with the message table partitioned by month, whole months are cheaper to remove by detaching their
+partitions with the manage_message_partitions command. Pruning by age is for tables that are not partitioned.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from .deletion import delete_message_batch
+from .models import Message
+
+MESSAGE_FIELDS = ('id', 'user', 'created', 'message_text')
+
+
+class Archive:
+    """
+    A gzipped NDJSON file pruned messages are appended to, one JSON object per line
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'messages-{}.ndjson.gz'.format(timezone.now().strftime('%Y%m%d%H%M%S')))
+
+    def write(self, batch):
+        """
+        Append messages to the archive, and make sure they are on disk before they are deleted
+
+        :param batch: The messages to archive
+        """
+        with gzip.open(self.path, 'at', encoding='utf-8') as archive:
+            for message in batch:
+                archive.write(json.dumps({'id': message.id, 'user': message.user_id, 'created': message.created,
+                                          'message_text': message.message_text}, cls=DjangoJSONEncoder) + '\n')
+            archive.flush()
+            os.fsync(archive.fileno())
+
+
+def prune_batch(batch, archive=None):
+    """
+    Archive and delete a batch of messages in one transaction
+
+    :param batch: The messages to prune
+    :param archive: Optional Archive to write them to first
+    :return: The number of messages pruned
+    """
+    if not batch:
+        return 0
+    if archive:
+        archive.write(batch)
+    with transaction.atomic():
+        delete_message_batch(batch)
+    return len(batch)
+
+
+def prune_expired(max_age_days, batch_size, pause=0, archive=None, dry_run=False):
+    """
+    Prune messages created more than the given number of days ago
+
+    :param max_age_days: The age in days after which messages are pruned
+    :param batch_size: The most messages to prune in one transaction
+    :param pause: Seconds to wait after each batch
+    :param archive: Optional Archive to write pruned messages to
+    :param dry_run: Only count the messages that would be pruned
+    :return: The number of messages pruned
+    """
+    cutoff = timezone.now() - timedelta(days=max_age_days)
+    expired = Message.objects.filter(created__lt=cutoff)
+    if dry_run:
+        return expired.count()
+
+    pruned = 0
+    last_id = None
+    while True:
+        # Ids grow over time, so expired messages are at the start of the primary key index
+        batch_query = expired.only(*MESSAGE_FIELDS).order_by('id')
+        if last_id is not None:
+            batch_query = batch_query.filter(id__gt=last_id)
+        batch = list(batch_query[:batch_size])
+        if not batch:
+            return pruned
+        pruned += prune_batch(batch, archive)
+        last_id = batch[-1].id
+        if pause:
+            time.sleep(pause)
+
+
+def prune_excess(max_per_user, batch_size, pause=0, archive=None, dry_run=False):
+    """
+    Prune the messages of each user beyond their newest ones
+
+    :param max_per_user: The number of newest messages kept for every user
+    :param batch_size: The most messages to prune in one transaction
+    :param pause: Seconds to wait after each batch
+    :param archive: Optional Archive to write pruned messages to
+    :param dry_run: Only count the messages that would be pruned
+    :return: The number of messages pruned
+    """
+    over_limit = list(Message.objects.values('user_id').annotate(messages=Count('id'))
+                      .filter(messages__gt=max_per_user).order_by('user_id'))
+    if dry_run:
+        return sum(user['messages'] - max_per_user for user in over_limit)
+
+    pruned = 0
+    for user in over_limit:
+        # Read from the (user, created, id) index, starting after the oldest message that is kept
+        user_messages = Message.objects.filter(user_id=user['user_id']).newest_first()
+        position = None
+        if max_per_user:
+            kept = list(user_messages.values_list('created', 'id')[max_per_user - 1:max_per_user])
+            if not kept:
+                continue
+            position = kept[0]
+        while True:
+            batch_query = user_messages.only(*MESSAGE_FIELDS)
+            if position is not None:
+                batch_query = batch_query.older_than(*position)
+            batch = list(batch_query[:batch_size])
+            if not batch:
+                break
+            pruned += prune_batch(batch, archive)
+            position = (batch[-1].created, batch[-1].id)
+            if pause:
+                time.sleep(pause)
+    return pruned
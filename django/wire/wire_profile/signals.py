@@ -0,0 +1,106 @@
+"""
+Keep cached data in step with changes to messages, follows and users, in every process through the invalidation bus,
+and purge the cached pages showing them.
+
+Bulk inserts do not send post_save, so code saving messages or follows in bulk calls messages_changed or
+follows_changed itself.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from base.bloom import username_namespace
+from base.invalidation import publish
+from base.pagecache import purge
+from .models import Message, Follow, Mention, follows_created, messages_created
+from . import leaderboard, mentions, trending
+
+
+def messages_changed(user_ids):
+    """
+    Invalidate cached data depending on the messages of the given users
+
+    :param user_ids: The ids of the users whose messages changed
+    """
+    publish('messages', *['messages:user:{}'.format(user_id) for user_id in set(user_ids)])
+    purge('page:home', *['page:user:{}'.format(user_id) for user_id in set(user_ids)])
+
+
+def follows_changed(user_ids):
+    """
+    Invalidate cached data depending on who the given users follow, or are followed by
+
+    :param user_ids: The ids of the users on either side of the changed follows
+    """
+    publish(*['follows:user:{}'.format(user_id) for user_id in set(user_ids)])
+    purge(*['page:user:{}'.format(user_id) for user_id in set(user_ids)])
+
+
+@receiver([post_save, post_delete], sender=Message)
+def message_saved(sender, instance, **kwargs):
+    messages_changed([instance.user_id])
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    leaderboard.count_messages([instance], -1)
+
+
+@receiver(messages_created)
+def index_new_messages(sender, messages, **kwargs):
+    trending.count_tags(messages)
+    mentions.record_mentions(messages)
+    leaderboard.count_messages(messages)
+
+
+@receiver(post_delete, sender=Mention)
+def mention_deleted(sender, instance, **kwargs):
+    mentions.mentions_changed([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def follow_saved(sender, instance, **kwargs):
+    follows_changed([instance.follower_id_id, instance.following_id_id])
+
+
+@receiver(follows_created)
+def count_new_follows(sender, follows, **kwargs):
+    leaderboard.count_follows(follows)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    leaderboard.count_follows([instance], -1)
+
+
+def public_fields(user):
+    """
+    :param user: A user
+    :return: The fields shown to other users, without loading any that were deferred
+    """
+    return user.__dict__.get('username'), user.__dict__.get('is_active')
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._saved_public_fields = public_fields(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    # Logging in saves the last login time, which nothing cached depends on
+    if kwargs.get('update_fields') and set(kwargs['update_fields']) == {'last_login'}:
+        return
+    namespaces = ['user:{0}'.format(instance.id)]
+    # Only new, deleted, renamed, deactivated and reactivated users change what other users are shown
+    if kwargs['signal'] is post_delete or kwargs.get('created') or \
+            public_fields(instance) != getattr(instance, '_saved_public_fields', None):
+        # A new user can reuse the id of a deleted one, so never let them see cached data for that id
+        namespaces += ['users', 'messages:user:{0}'.format(instance.id), 'follows:user:{0}'.format(instance.id),
+                       'mentions:user:{0}'.format(instance.id)]
+        if kwargs['signal'] is post_save:
+            # Adds new and renamed usernames to the username filter of every process
+            namespaces.append(username_namespace(instance.username))
+        purge('page:user:{}'.format(instance.id))
+    instance._saved_public_fields = public_fields(instance)
+    publish(*namespaces)
@@ -0,0 +1,139 @@
+"""
+Time ordered 64 bit ids, generated without a round trip to the database.
+
+An id is made of the milliseconds since EPOCH (41 bits), the id of the worker that made it (10 bits) and a sequence
+number for ids made in the same millisecond (12 bits). Sorting by id therefore sorts by creation time, so feeds can be
+ordered and paginated on the primary key alone.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+# 2018-01-01T00:00:00Z in milliseconds, ids will run out in 2087
+EPOCH = 1514764800000
+
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+def timestamp_ms(moment=None):
+    """
+    :param moment: An aware datetime, defaults to now
+    :return: The given time in milliseconds since the unix epoch
+    """
+    if moment is None:
+        return int(time.time() * 1000)
+    return int(moment.timestamp() * 1000)
+
+
+def lowest_id_at(moment):
+    """
+    Get the smallest id that could be made at the given time, for comparing ids against a time
+
+    :param moment: An aware datetime
+    :return: The smallest id for the given time
+    """
+    return max(timestamp_ms(moment) - EPOCH, 0) << (WORKER_ID_BITS + SEQUENCE_BITS)
+
+
+def created_at(snowflake_id):
+    """
+    :param snowflake_id: An id made by a SnowflakeGenerator
+    :return: The time the id was made as an aware datetime
+    """
+    milliseconds = (snowflake_id >> (WORKER_ID_BITS + SEQUENCE_BITS)) + EPOCH
+    return datetime.fromtimestamp(milliseconds / 1000, tz=timezone.utc)
+
+
+class SnowflakeGenerator:
+    """
+    Make unique, time ordered ids for one worker. Every process making ids at the same time needs its own worker id
+    """
+
+    def __init__(self, worker_id):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError('The worker id must be between 0 and {}'.format(MAX_WORKER_ID))
+        self.worker_id = worker_id
+        self.last_timestamp = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        """
+        :return: A new id, larger than any id made before it by this generator
+        """
+        with self.lock:
+            # Never go backwards if the clock is adjusted
+            timestamp = max(timestamp_ms(), self.last_timestamp)
+            if timestamp == self.last_timestamp:
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    # Every id for this millisecond has been used, wait for the next one
+                    while timestamp <= self.last_timestamp:
+                        timestamp = timestamp_ms()
+            else:
+                self.sequence = 0
+            self.last_timestamp = timestamp
+
+            return ((timestamp - EPOCH) << (WORKER_ID_BITS + SEQUENCE_BITS)) \
+                | (self.worker_id << SEQUENCE_BITS) | self.sequence
+
+
+# The first key of the PostgreSQL advisory locks workers hold on their ids, the second is the worker id
+WORKER_LOCK_CLASS = 0x5749
+
+_generator = None
+_generator_pid = None
+_generator_lock = threading.Lock()
+# The connection holding this process's worker id lock, the lock is released when it closes
+_worker_connection = None
+
+
+def allocate_worker_id():
+    """
+    Claim a worker id no other running process holds, with a PostgreSQL advisory lock held on a connection of its own
+    for the life of the process
+
+    :return: The claimed worker id
+    :raises ImproperlyConfigured: if every worker id is taken, or the database cannot allocate them
+    """
+    global _worker_connection
+    database = connections['default']
+    if database.vendor != 'postgresql':
+        raise ImproperlyConfigured('Set SNOWFLAKE_WORKER_ID to a different number for each process creating messages')
+    worker_connection = database.get_new_connection(database.get_connection_params())
+    worker_connection.autocommit = True
+    with worker_connection.cursor() as cursor:
+        for worker_id in range(MAX_WORKER_ID + 1):
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [WORKER_LOCK_CLASS, worker_id])
+            if cursor.fetchone()[0]:
+                _worker_connection = worker_connection
+                return worker_id
+    worker_connection.close()
+    raise ImproperlyConfigured('Every snowflake worker id is in use')
+
+
+def next_id():
+    """
+    Make a new id using the worker id from the SNOWFLAKE_WORKER_ID setting. When it is not set, a worker id is claimed
+    from the database, so processes never share one by accident
+
+    :return: A new id
+    """
+    global _generator, _generator_pid
+    # Forked worker processes must not share the generator or worker id of their parent
+    if _generator is None or _generator_pid != os.getpid():
+        with _generator_lock:
+            if _generator is None or _generator_pid != os.getpid():
+                worker_id = settings.SNOWFLAKE_WORKER_ID
+                if worker_id is None:
+                    worker_id = allocate_worker_id()
+                _generator = SnowflakeGenerator(worker_id)
+                _generator_pid = os.getpid()
+    return _generator.next_id()
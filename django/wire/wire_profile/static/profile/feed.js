@@ -0,0 +1,161 @@
+/*
+Shows a feed of messages after the header of a list, loading the next page of
+messages from the server whenever the end of the list is scrolled into view.
+
+Each page of messages is rendered as one block, built as a single string and
+inserted at once. Blocks far outside the window are emptied and only keep their
+height, so the page holds a bounded number of elements however many messages
+have been loaded, and the scroll position does not move.
+
+@param options: Object with the following properties
+    header:        The jQuery element of the list header, messages are shown after it
+    pageUrl:       Function returning the url of the page of messages older than the given message id
+    formatMessage: Function returning the HTML of a message, given the message object
+    emptyText:     The text shown when there are no messages
+*/
+function WireFeed(options) {
+    this.options = options;
+    this.blocks = [];
+    this.resets = 0;
+    this.loading = false;
+    this.finished = true;
+    this.updateScheduled = false;
+    this.loader = $("<li class='list-group-item loader-container'><div class='loader'></div></li>");
+
+    $(window).on('scroll resize', this.scheduleUpdate.bind(this));
+}
+
+// Blocks within this many window heights of the visible part of the page are kept rendered
+WireFeed.RENDER_MARGIN = 2;
+
+/*
+Replace the messages shown with the given first page
+
+@param messages: list of message objects, newest first
+*/
+WireFeed.prototype.reset = function(messages) {
+    this.options.header.nextAll('li').remove();
+    this.blocks = [];
+    this.resets += 1;
+    this.finished = false;
+
+    if (messages.length === 0) {
+        this.finished = true;
+        this.options.header.after("<li class='list-group-item'>" + this.options.emptyText + "</li>");
+        return;
+    }
+    this.options.header.after(this.loader);
+    this.append(messages);
+};
+
+/*
+Add a page of older messages to the end of the feed
+
+@param messages: list of message objects, newest first
+*/
+WireFeed.prototype.append = function(messages) {
+    if (messages.length === 0) {
+        this.finished = true;
+        this.loader.remove();
+        return;
+    }
+
+    var block = {
+        messages: messages,
+        element: $("<li class='feed-block'><ul class='list-group'></ul></li>")[0],
+        rendered: false
+    };
+    this.renderBlock(block);
+    this.loader.before(block.element);
+    this.blocks.push(block);
+    this.scheduleUpdate();
+};
+
+WireFeed.prototype.renderBlock = function(block) {
+    block.element.firstChild.innerHTML = block.messages.map(this.options.formatMessage).join('');
+    block.element.style.height = '';
+    block.rendered = true;
+};
+
+WireFeed.prototype.hideBlock = function(block, height) {
+    block.element.style.height = height + 'px';
+    block.element.firstChild.innerHTML = '';
+    block.rendered = false;
+};
+
+/*
+Run update once before the next repaint, however many scroll events arrive before then
+*/
+WireFeed.prototype.scheduleUpdate = function() {
+    if (!this.updateScheduled) {
+        this.updateScheduled = true;
+        window.requestAnimationFrame(this.update.bind(this));
+    }
+};
+
+/*
+Render the blocks near the window, empty the others and load the next page when the end of the list is near
+*/
+WireFeed.prototype.update = function() {
+    this.updateScheduled = false;
+    var margin = window.innerHeight * WireFeed.RENDER_MARGIN;
+    var top = -margin;
+    var bottom = window.innerHeight + margin;
+
+    // Measure every block before changing any, so the layout is only worked out once
+    var positions = this.blocks.map(function(block) {
+        return block.element.getBoundingClientRect();
+    });
+    var self = this;
+    this.blocks.forEach(function(block, index) {
+        var near = positions[index].bottom > top && positions[index].top < bottom;
+        if (near && !block.rendered) {
+            self.renderBlock(block);
+        } else if (!near && block.rendered) {
+            self.hideBlock(block, positions[index].height);
+        }
+    });
+
+    if (!this.loading && !this.finished && this.loader[0].getBoundingClientRect().top < bottom) {
+        this.loadNextPage();
+    }
+};
+
+/*
+Request the page of messages older than the last one shown
+*/
+WireFeed.prototype.loadNextPage = function() {
+    var lastMessages = this.blocks[this.blocks.length - 1].messages;
+    // Messages that have not been saved yet have no id and are shown first, so there are no saved ones to page through
+    var lastId = lastMessages[lastMessages.length - 1].id;
+    if (lastId === null) {
+        this.append([]);
+        return;
+    }
+
+    var self = this;
+    var resets = this.resets;
+    this.loading = true;
+    $.ajax(
+        {
+            url: this.options.pageUrl(lastId),
+            type: "GET",
+            success: function (result) {
+                if (resets !== self.resets) {
+                    // The feed was replaced while the page was loading
+                    return;
+                }
+                if (!result.success && result.success !== undefined) {
+                    console.log(result.message);
+                    self.append([]);
+                } else {
+                    self.append(result);
+                }
+            },
+            complete: function () {
+                self.loading = false;
+                self.scheduleUpdate();
+            }
+        }
+    )
+};
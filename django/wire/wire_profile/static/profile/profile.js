@@ -1,14 +1,15 @@
 $(document).ready(function() {
 
     /*
-    Formats each message into HTML to be shown on the frontend and then displays the message.
+    Formats each message into HTML to be shown on the frontend.
 
     @param message:           The contents of the message
     @param messageDateString: Date and time as a string
+
+    @return String: The message formatted as a bootstrap list item
     */
     function formatMessage(message, messageDateString) {
         var formattedMessage = createLinksForHashtags(message);
-        var messagesList = $("#messages-list");
         var messagesHtml = "<li class='list-group-item'>";
         messagesHtml += "<h4 class='list-group-item-heading'>" + formattedMessage + "</h4>";
         messagesHtml += "<p class='list-group-item-text'>";
@@ -16,172 +17,122 @@ $(document).ready(function() {
         messagesHtml += "</p>";
         messagesHtml += "</li>";
 
-        $('.user-wires .loader-container').remove();
-        messagesList.append(messagesHtml);
+        return messagesHtml;
     }
 
-    // Load all messages posted by followers using AJAX
-    function loadMessages() {
-        $.ajax(
-            {
-                url: "/message/".concat(jsUsername),
-                type: "GET",
-                success: function (result) {
-                    var messagesHeader = $("#messages-header");
-                    // Display a message if the user has not posted any messages
-                    if (result.length === 0) {
-                        messagesHeader.nextAll('li').remove();
-                        messagesHeader.after("<li class='list-group-item'>This user has not created any wires</li>");
-                    } else {
-                        messagesHeader.nextAll('li').remove();
-                        // Display messages if we received a result from the server
-                        $.each(result, function(index, messageObject) {
-                            // Format the date from the message to
-                            var messageDate = new Date(messageObject.created);
-                            var messageDateString = formatTimeStamp(messageDate);
-
-                            formatMessage(messageObject.message_text, messageDateString, messageObject.user);
-                        });
-                    }
-                }
-            }
-        )
+    var feed = new WireFeed({
+        header: $("#messages-header"),
+        pageUrl: function(beforeId) {
+            return "/feed/" + jsUsername + "?before_id=" + beforeId;
+        },
+        formatMessage: function(messageObject) {
+            return formatMessage(messageObject.message_text, formatTimeStamp(new Date(messageObject.created)));
+        },
+        emptyText: "This user has not created any wires"
+    });
+
+    // Display the messages posted by the user, loading older ones as the page is scrolled
+    function showMessages(messages) {
+        feed.reset(messages);
     }
 
     /*
-    Load users not followed by the currently logged in user or, if user is
-    not logged in, load some random users.
+    Display users not followed by the currently logged in user or, if user is
+    not logged in, some random users.
     */
-    function loadRecommendedUsers() {
-        // Retrieve other users to display on the frontend
-        $.ajax(
-            {
-                url: "/get-recommended-users/".concat(jsUsername),
-                type: "GET",
-                success: function (result) {
-                    var usersHTML = "";
-                    var recommendedUsersHeader = $("#recommended-users-header");
-
-                    result.forEach(function(userObject) {
-                        usersHTML += formatUserList(userObject.username, "visit");
-                    });
-
-                    if (usersHTML === "") {
-                        usersHTML += "<li class='list-group-item clearfix'>";
-                        usersHTML += "<span>There are no users to recommend at this time</span>";
-                        usersHTML += "</li>";
-                    }
+    function showRecommendedUsers(users) {
+        var usersHTML = "";
+        var recommendedUsersHeader = $("#recommended-users-header");
+
+        users.forEach(function(userObject) {
+            usersHTML += formatUserList(userObject.username, "visit");
+        });
+
+        if (usersHTML === "") {
+            usersHTML += "<li class='list-group-item clearfix'>";
+            usersHTML += "<span>There are no users to recommend at this time</span>";
+            usersHTML += "</li>";
+        }
+
+        recommendedUsersHeader.nextAll('li').remove();
+        recommendedUsersHeader.after(usersHTML);
+    }
 
-                    recommendedUsersHeader.nextAll('li').remove();
-                    recommendedUsersHeader.after(usersHTML);
-                }
-            }
-        )
+    /*
+    Display users who are being followed by the user whose profile page is being viewed
+    */
+    function showFollows(users) {
+        var usersHTML = "";
+        var followingHeader = $("#following-header");
+
+        if (users.length !== 0) {
+            users.forEach(function (userObject) {
+                usersHTML += formatUserList(userObject.username, "visit");
+            });
+        } else {
+            usersHTML += "<li class='list-group-item clearfix'>";
+            usersHTML += "<span>This user is not following anyone</span>";
+            usersHTML += "</li>";
+        }
+
+        followingHeader.nextAll('li').remove();
+        followingHeader.after(usersHTML);
     }
 
+    /*
+    Display users following the person whose profile page is being viewed.
+    */
+    function showFollowers(users) {
+        var followersHeader = $("#followers-header");
+        var usersHTML = "";
+
+        if (users.length !== 0) {
+            users.forEach(function (userObject) {
+                usersHTML += formatUserList(userObject.username, "visit", "default");
+            });
+        } else {
+            usersHTML += "<li class='list-group-item clearfix'>";
+            usersHTML += "<span>This user does not have any followers</span>";
+            usersHTML += "</li>";
+        }
+
+        followersHeader.nextAll('li').remove();
+        followersHeader.after(usersHTML);
+    }
 
     /*
-    Load users who are being followed by the user whose profile page is being viewed
+    Display all the data shown on the profile page
     */
-    function loadFollows() {
-        $.ajax(
-            {
-                url: "/following/".concat(jsUsername),
-                type: "GET",
-                success: function (result) {
-                    if (!result.success && result.success !== undefined) {
-                        console.log(result.message);
-                    } else {
-                        var usersHTML = "";
-                        var followingHeader = $("#following-header");
-
-                        if (result.length !== 0) {
-                            // Store following user Ids in an array
-                            var followingUserIds = [];
-                            result.forEach(function (followInfo) {
-                                followingUserIds.push(followInfo.following_id);
-                            });
-
-                            $.ajax(
-                                {
-                                    url: "/users/" + followingUserIds.join('/') + "/",
-                                    type: "GET",
-                                    success: function (result) {
-                                        result.forEach(function (userObject) {
-                                            usersHTML += formatUserList(userObject.username, "visit");
-                                        });
-
-                                        followingHeader.nextAll('li').remove();
-                                        followingHeader.after(usersHTML);
-                                    }
-                                }
-                            )
-                        } else {
-                            usersHTML += "<li class='list-group-item clearfix'>";
-                            usersHTML += "<span>This user is not following anyone</span>";
-                            usersHTML += "</li>";
-
-                            followingHeader.nextAll('li').remove();
-                            followingHeader.after(usersHTML);
-                        }
-                    }
-                }
-            }
-        )
+    function showProfileData(profileData) {
+        showMessages(profileData.messages);
+        showRecommendedUsers(profileData.recommended_users);
+        showFollows(profileData.following);
+        showFollowers(profileData.followers);
     }
 
     /*
-    Load users following the person whose profile page is being viewed.
+    Load the profile page data in a single request
     */
-    function loadFollowers() {
+    function loadProfileData() {
         $.ajax(
             {
-                url: "/followers/".concat(jsUsername),
+                url: "/profile-data/".concat(jsUsername),
                 type: "GET",
                 success: function (result) {
                     if (!result.success && result.success !== undefined) {
                         console.log(result.message);
                     } else {
-                        var followersHeader = $("#followers-header");
-                        var usersHTML = "";
-
-                        if (result.length !== 0) {
-                            // Store follower user Ids in an array
-                            var followerUserIds = [];
-                            result.forEach(function (followInfo) {
-                                followerUserIds.push(followInfo.follower_id);
-                            });
-
-                            $.ajax(
-                                {
-                                    url: "/users/" + followerUserIds.join('/') + "/",
-                                    type: "GET",
-                                    success: function (result) {
-                                        result.forEach(function (userObject) {
-                                            usersHTML += formatUserList(userObject.username, "visit", "default");
-                                        });
-
-                                        followersHeader.nextAll('li').remove();
-                                        followersHeader.after(usersHTML);
-                                    }
-                                }
-                            )
-                        } else {
-                            usersHTML += "<li class='list-group-item clearfix'>";
-                            usersHTML += "<span>This user does not have any followers</span>";
-                            usersHTML += "</li>";
-
-                            followersHeader.nextAll('li').remove();
-                            followersHeader.after(usersHTML);
-                        }
+                        showProfileData(result);
                     }
                 }
             }
         )
     }
 
-    loadMessages();
-    loadRecommendedUsers();
-    loadFollows();
-    loadFollowers();
+    // Use the data embedded in the page if the server provided it
+    if (jsProfileData) {
+        showProfileData(jsProfileData);
+    } else {
+        loadProfileData();
+    }
 });
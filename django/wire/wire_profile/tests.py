@@ -1,9 +1,23 @@
-from django.test import TestCase
+import glob
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.core.cache import cache as django_cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
 from .forms import NewWireForm, SearchForm
-from .models import Message, Follow
+from .models import AccountDeletion, Message, MessageQuerySet, Follow, Mention, TagCount, UserActivity, UserStats
+from . import deletion, importer, ingestion, leaderboard, mentions, partitions, retention, snowflake, trending
+from base.pagination import EstimatedCountPaginator, estimated_count
 
 
 class ProfileViewTest(TestCase):
@@ -202,11 +216,9 @@ class CreateMessageTest(TestCase):
 class GetMessagesTest(TestCase):
     def test_get_message_for_invalid_user(self):
         response = self.client.get(reverse('wire_profile:get_message', kwargs={'username': 'foo'}), follow=True)
-        message = list(response.context['messages'])[0]
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(message.tags, 'danger error')
-        self.assertEqual(str(message), 'The requested user was not found')
+        self.assertEqual(response.json(), {'success': False, 'message': 'The requested user was not found'})
 
     def test_get_message_with_no_messages(self):
         User.objects.create_user('foo', 'test@test.com', 'test')
@@ -627,3 +639,884 @@ class GetUserIdTest(TestCase):
         self.assertIn('"username": "' + user.username + '"', response_content)
         self.assertNotIn('"username": "' + user2.username + '"', response_content)
         self.assertNotIn('"username": "' + user3.username + '"', response_content)
+
+
+class GetProfileDataTest(TestCase):
+    def test_get_profile_data_unregistered_user(self):
+        response = self.client.get(reverse('wire_profile:get_profile_data', kwargs={'username': 'foo'}))
+        response_content = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('"success": false', response_content)
+        self.assertIn('"message": "The given username was not found"', response_content)
+
+    def test_get_profile_data_own_messages(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        user2 = User.objects.create_user('bar', 'bar@test.com', 'test')
+        user3 = User.objects.create_user('baz', 'baz@test.com', 'test')
+        Follow.objects.create(follower_id=user, following_id=user2)
+        Follow.objects.create(follower_id=user3, following_id=user)
+        Message.objects.create(message_text='foofoo', created=timezone.now(), user=user)
+        Message.objects.create(message_text='barbar', created=timezone.now(), user=user2)
+
+        response = self.client.get(reverse('wire_profile:get_profile_data', kwargs={'username': user.username}))
+        data = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['user'], {'id': user.id, 'username': 'foo'})
+        self.assertEqual(data['following'], [{'id': user2.id, 'username': 'bar'}])
+        self.assertEqual(data['followers'], [{'id': user3.id, 'username': 'baz'}])
+        self.assertEqual([message['message_text'] for message in data['messages']], ['foofoo'])
+        self.assertEqual(data['messages'][0]['username'], 'foo')
+        self.assertNotIn({'username': 'foo'}, data['recommended_users'])
+
+    def test_get_profile_data_following_feed(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        user2 = User.objects.create_user('bar', 'bar@test.com', 'test')
+        user3 = User.objects.create_user('baz', 'baz@test.com', 'test')
+        Follow.objects.create(follower_id=user, following_id=user2)
+        Message.objects.create(message_text='foofoo', created=timezone.now(), user=user)
+        Message.objects.create(message_text='barbar', created=timezone.now(), user=user2)
+        Message.objects.create(message_text='bazbaz', created=timezone.now(), user=user3)
+
+        url = reverse('wire_profile:get_profile_data', kwargs={'username': user.username}) + '?feed=following'
+        response = self.client.get(url)
+        data = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message['message_text'] for message in data['messages']], ['barbar'])
+        self.assertEqual(data['messages'][0]['username'], 'bar')
+
+    def test_profile_data_inlined_in_profile_page(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        Message.objects.create(message_text='</script>', created=timezone.now(), user=user)
+
+        response = self.client.get(reverse('wire_profile:profile', kwargs={'username': user.username}))
+        response_content = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('var jsProfileData = {', response_content)
+        self.assertIn('\\u003C/script\\u003E', response_content)
+
+    @override_settings(FEED_PAGE_SIZE=2, MESSAGE_SNOWFLAKE_IDS=True, SNOWFLAKE_WORKER_ID=1)
+    def test_feed_loaded_a_page_at_a_time(self):
+        django_cache.clear()
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        for text in ('first', 'second', 'third'):
+            Message.objects.create(message_text=text, created=timezone.now(), user=user)
+
+        first_page = self.client.get(reverse('wire_profile:get_profile_data', kwargs={'username': 'foo'})).json()
+        before_id = first_page['messages'][-1]['id']
+        url = reverse('wire_profile:get_feed', kwargs={'username': 'foo'})
+        second_page = self.client.get(url, {'before_id': before_id}).json()
+        last_page = self.client.get(url, {'before_id': second_page[-1]['id']}).json()
+        limited = self.client.get(url, {'limit': 100}).json()
+
+        self.assertEqual([message['message_text'] for message in first_page['messages']], ['third', 'second'])
+        self.assertEqual([message['message_text'] for message in second_page], ['first'])
+        self.assertEqual(second_page[0]['username'], 'foo')
+        self.assertEqual(last_page, [])
+        self.assertEqual(len(limited), 2)
+
+    def test_get_feed_following(self):
+        django_cache.clear()
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        user2 = User.objects.create_user('bar', 'bar@test.com', 'test')
+        Follow.objects.create(follower_id=user, following_id=user2)
+        Message.objects.create(message_text='foofoo', created=timezone.now(), user=user)
+        Message.objects.create(message_text='barbar', created=timezone.now(), user=user2)
+
+        response = self.client.get(reverse('wire_profile:get_feed', kwargs={'username': 'foo'}), {'feed': 'following'})
+
+        self.assertEqual([message['message_text'] for message in response.json()], ['barbar'])
+
+    def test_following_feed_keyed_on_followed_users(self):
+        django_cache.clear()
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        user2 = User.objects.create_user('bar', 'bar@test.com', 'test')
+        user3 = User.objects.create_user('baz', 'baz@test.com', 'test')
+        Follow.objects.create(follower_id=user, following_id=user2)
+        Message.objects.create(message_text='barbar', created=timezone.now(), user=user2)
+        url = reverse('wire_profile:get_feed', kwargs={'username': 'foo'})
+        self.client.get(url, {'feed': 'following'})
+
+        Message.objects.create(message_text='bazbaz', created=timezone.now(), user=user3)
+        # Only the user is looked up, the feed comes from the cache
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, {'feed': 'following'}).json()
+        Message.objects.create(message_text='barbar again', created=timezone.now(), user=user2)
+        refreshed = self.client.get(url, {'feed': 'following'}).json()
+
+        self.assertEqual([message['message_text'] for message in cached], ['barbar'])
+        self.assertEqual([message['message_text'] for message in refreshed], ['barbar again', 'barbar'])
+
+    def test_get_feed_unregistered_user(self):
+        response = self.client.get(reverse('wire_profile:get_feed', kwargs={'username': 'foo'}))
+
+        self.assertEqual(response.json(), {'success': False, 'message': 'The given username was not found'})
+
+
+class BatchedIngestionTest(TestCase):
+    def setUp(self):
+        queue_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(queue_dir.cleanup)
+        settings_override = override_settings(MESSAGE_INGESTION={
+            'MODE': 'batched',
+            'QUEUE_PATH': os.path.join(queue_dir.name, 'queue.ndjson'),
+            'MAX_BATCH_SIZE': 2,
+            'MAX_FLUSH_LATENCY': 1.0,
+            'MAX_FLUSH_ATTEMPTS': 2,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_created_message_is_queued(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        self.client.post(reverse('base:verify'), {'username': user.username, 'password': 'test'})
+
+        response = self.client.post(reverse('wire_profile:message'), {'message': 'test'}, follow=True)
+        message = list(response.context['messages'])[1]
+
+        self.assertEqual(str(message), 'Message created successfully')
+        self.assertEqual(Message.objects.count(), 0)
+        self.assertEqual(ingestion.pending_count(), 1)
+
+    def test_author_reads_queued_messages(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        User.objects.create_user('bar', 'bar@test.com', 'test')
+        ingestion.enqueue_message(user, 'queuedqueued', timezone.now())
+
+        response = self.client.get(reverse('wire_profile:get_profile_data', kwargs={'username': 'foo'}))
+        self.assertNotIn('queuedqueued', response.content.decode())
+
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+        response = self.client.get(reverse('wire_profile:get_profile_data', kwargs={'username': 'foo'}))
+        self.assertIn('queuedqueued', response.content.decode())
+
+        self.client.post(reverse('base:verify'), {'username': 'bar', 'password': 'test'})
+        response = self.client.get(reverse('wire_profile:get_profile_data', kwargs={'username': 'foo'}))
+        self.assertNotIn('queuedqueued', response.content.decode())
+
+    def test_flush_saves_queued_messages(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        for message_text in ['foo', 'bar', 'baz']:
+            ingestion.enqueue_message(user, message_text, timezone.now())
+
+        self.assertEqual(ingestion.flush_queue(), 3)
+        self.assertEqual(ingestion.pending_count(), 0)
+        self.assertEqual(ingestion.pending_messages(user.id), [])
+        self.assertEqual(sorted(Message.objects.values_list('message_text', flat=True)), ['bar', 'baz', 'foo'])
+        self.assertEqual(ingestion.flush_queue(), 0)
+
+    def test_author_reads_queued_messages_in_following_feed(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        ingestion.enqueue_message(user, 'queuedqueued', timezone.now())
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+
+        response = self.client.get(reverse('wire_profile:current_profile'))
+
+        self.assertIn('queuedqueued', response.content.decode())
+
+    def test_flush_does_not_save_messages_twice(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        created = timezone.now()
+        ingestion.enqueue_message(user, 'foo', created)
+        # A flush that committed but stopped before removing its queue file
+        Message.objects.create(message_text='foo', created=created, user=user)
+        os.rename(ingestion.queue_path(), ingestion.queue_path() + '.00000000000000000001.flushing')
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+
+        response = self.client.get(reverse('wire_profile:get_profile_data', kwargs={'username': 'foo'}))
+        self.assertEqual([message['message_text'] for message in response.json()['messages']], ['foo'])
+
+        self.assertEqual(ingestion.flush_queue(), 0)
+        self.assertEqual(Message.objects.count(), 1)
+        self.assertEqual(ingestion.claimed_paths(), [])
+
+    def test_messages_of_deleted_authors_dropped(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        other = User.objects.create_user('bar', 'bar@test.com', 'test')
+        ingestion.enqueue_message(user, 'foo', timezone.now())
+        ingestion.enqueue_message(other, 'bar', timezone.now())
+        user.delete()
+
+        self.assertEqual(ingestion.flush_queue(), 1)
+        self.assertEqual(list(Message.objects.values_list('message_text', flat=True)), ['bar'])
+
+    def test_failing_queue_file_moved_aside(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        ingestion.enqueue_message(user, 'foo', timezone.now())
+        failing = mock.patch.object(MessageQuerySet, 'bulk_create', side_effect=DatabaseError)
+
+        with failing, self.assertLogs('wire_profile.ingestion', 'ERROR'):
+            ingestion.flush_queue()
+            self.assertEqual(len(ingestion.claimed_paths()), 1)
+            ingestion.flush_queue()
+
+        self.assertEqual(ingestion.claimed_paths(), [])
+        self.assertEqual(len(glob.glob(ingestion.queue_path() + '.*.failed')), 1)
+
+
+class BulkCreateMessagesTest(TestCase):
+    def test_unauthenticated_access_is_blocked(self):
+        response = self.client.post(reverse('wire_profile:bulk_create_messages'), '{"messages": ["foo"]}',
+                                    content_type='application/json')
+
+        self.assertEqual(response.json()['success'], False)
+        self.assertEqual(Message.objects.count(), 0)
+
+    def test_invalid_body(self):
+        User.objects.create_user('foo', 'test@test.com', 'test')
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+
+        response = self.client.post(reverse('wire_profile:bulk_create_messages'), 'foo',
+                                    content_type='application/json')
+
+        self.assertEqual(response.json(), {'success': False,
+                                           'message': 'Please send a JSON object with a list of messages'})
+
+    def test_create_multiple_messages(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+
+        response = self.client.post(reverse('wire_profile:bulk_create_messages'),
+                                    '{"messages": ["foofoo", "", "barbar", "' + 'a' * 281 + '"]}',
+                                    content_type='application/json')
+        results = response.json()['results']
+
+        self.assertEqual([result['success'] for result in results], [True, False, True, False])
+        self.assertEqual(sorted(Message.objects.filter(user=user).values_list('message_text', flat=True)),
+                         ['barbar', 'foofoo'])
+
+
+class BulkFollowUsersTest(TestCase):
+    def test_unauthenticated_access_is_blocked(self):
+        User.objects.create_user('bar', 'bar@test.com', 'test')
+        response = self.client.post(reverse('wire_profile:bulk_follow_users'), '{"usernames": ["bar"]}',
+                                    content_type='application/json')
+
+        self.assertEqual(response.json()['success'], False)
+        self.assertEqual(Follow.objects.count(), 0)
+
+    def test_follow_multiple_users(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        user2 = User.objects.create_user('bar', 'bar@test.com', 'test')
+        user3 = User.objects.create_user('baz', 'baz@test.com', 'test')
+        user4 = User.objects.create_user('bam', 'bam@test.com', 'test')
+        Follow.objects.create(follower_id=user, following_id=user4)
+        self.client.post(reverse('base:verify'), {'username': 'foo', 'password': 'test'})
+
+        response = self.client.post(reverse('wire_profile:bulk_follow_users'),
+                                    '{"usernames": ["bar", "baz", "bam", "foo", "unknown", "bar"]}',
+                                    content_type='application/json')
+        results = response.json()['results']
+
+        self.assertEqual([result['success'] for result in results], [True, True, True, False, False, True])
+        self.assertEqual(results[2]['message'], 'You are already following bam')
+        self.assertEqual(results[3]['message'], 'You cannot follow yourself!')
+        self.assertEqual(results[4]['message'], 'The user you tried to follow was not found')
+        self.assertEqual(sorted(Follow.objects.filter(follower_id=user).values_list('following_id', flat=True)),
+                         sorted([user2.id, user3.id, user4.id]))
+
+
+class SnowflakeIdTest(TestCase):
+    def test_ids_are_unique_and_increasing(self):
+        generator = snowflake.SnowflakeGenerator(5)
+        ids = [generator.next_id() for _ in range(10000)]
+
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_ids_are_ordered_by_time(self):
+        now = timezone.now()
+        snowflake_id = snowflake.SnowflakeGenerator(1023).next_id()
+
+        self.assertLessEqual(snowflake.lowest_id_at(now), snowflake_id)
+        self.assertLess(abs((snowflake.created_at(snowflake_id) - now).total_seconds()), 1)
+
+    @override_settings(MESSAGE_SNOWFLAKE_IDS=True, SNOWFLAKE_WORKER_ID=1)
+    def test_messages_get_time_ordered_ids(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        old_message = Message.objects.create(message_text='foo', created=timezone.now(), user=user)
+        bulk_messages = Message.objects.bulk_create([
+            Message(message_text='bar', created=timezone.now(), user=user),
+            Message(message_text='baz', created=timezone.now(), user=user),
+        ])
+
+        self.assertGreaterEqual(old_message.id, snowflake.lowest_id_at(old_message.created))
+        self.assertLess(old_message.id, bulk_messages[0].id)
+        self.assertLess(bulk_messages[0].id, bulk_messages[1].id)
+        self.assertEqual([message.message_text for message in Message.objects.newest_first()], ['baz', 'bar', 'foo'])
+
+    @override_settings(MESSAGE_SNOWFLAKE_IDS=True, SNOWFLAKE_WORKER_ID=1)
+    def test_get_messages_since_and_before_id(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        first = Message.objects.create(message_text='first', created=timezone.now(), user=user)
+        second = Message.objects.create(message_text='second', created=timezone.now(), user=user)
+        Message.objects.create(message_text='third', created=timezone.now(), user=user)
+        url = reverse('wire_profile:get_message', kwargs={'username': 'foo'})
+
+        newer = self.client.get(url, {'since_id': first.id}).json()
+        older = self.client.get(url, {'before_id': second.id}).json()
+        latest = self.client.get(url, {'limit': 2}).json()
+
+        self.assertEqual([message['message_text'] for message in newer], ['third', 'second'])
+        self.assertEqual([message['message_text'] for message in older], ['first'])
+        self.assertEqual([message['message_text'] for message in latest], ['third', 'second'])
+
+    def test_pages_follow_created_when_ids_are_out_of_order(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        now = timezone.now()
+        # Saved newest first, as an import or a batched flush can
+        for text, age in (('third', 1), ('first', 3), ('second', 2)):
+            Message.objects.create(message_text=text, created=now - timedelta(minutes=age), user=user)
+        third, first, second = Message.objects.order_by('id')
+        url = reverse('wire_profile:get_message', kwargs={'username': 'foo'})
+
+        older = self.client.get(url, {'before_id': third.id}).json()
+        newer = self.client.get(url, {'since_id': first.id}).json()
+        last = self.client.get(url, {'before_id': second.id}).json()
+
+        self.assertEqual([message['message_text'] for message in older], ['second', 'first'])
+        self.assertEqual([message['message_text'] for message in newer], ['third', 'second'])
+        self.assertEqual([message['message_text'] for message in last], ['first'])
+
+    @override_settings(MESSAGE_SNOWFLAKE_IDS=True, SNOWFLAKE_WORKER_ID=None)
+    def test_worker_id_required_without_postgresql(self):
+        with mock.patch.object(snowflake, '_generator', None):
+            with self.assertRaises(ImproperlyConfigured):
+                snowflake.next_id()
+
+
+class MessagePartitionTest(TestCase):
+    def test_month_helpers(self):
+        month = partitions.month_start(datetime(2018, 12, 15, 10, 30, tzinfo=timezone.utc))
+
+        self.assertEqual(month, datetime(2018, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(partitions.add_months(month, 1), datetime(2019, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(partitions.add_months(month, -12), datetime(2017, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(partitions.partition_name(month), 'wire_profile_message_y2018m12')
+
+    def test_newest_messages_fall_back_to_older_messages(self):
+        user = User.objects.create_user('foo', 'test@test.com', 'test')
+        Message.objects.create(message_text='old', created=timezone.now() - timedelta(days=365), user=user)
+        Message.objects.create(message_text='new', created=timezone.now(), user=user)
+
+        self.assertEqual([message.message_text for message in Message.objects.newest(1)], ['new'])
+        self.assertEqual([message.message_text for message in Message.objects.newest(2)], ['new', 'old'])
+
+    def test_partitioning_needs_postgresql_11(self):
+        self.assertFalse(partitions.supports_partitioning(connection))
+        with self.assertRaises(CommandError):
+            call_command('manage_message_partitions')
+
+
+class TrendingTagsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('foo', 'test@test.com', 'test')
+
+    def test_find_tags(self):
+        self.assertEqual(trending.find_tags('#foo bar #Baz #foo x#nope ##bam'), {'foo', 'baz'})
+
+    def test_new_messages_counted(self):
+        now = timezone.now()
+        Message.objects.create(message_text='hello #foo', created=now, user=self.user)
+        Message.objects.bulk_create([Message(message_text='#foo #bar', created=now, user=self.user),
+                                     Message(message_text='no tags', created=now, user=self.user)])
+
+        self.assertEqual(TagCount.objects.get(tag='foo', period=60).count, 2)
+        self.assertEqual(TagCount.objects.get(tag='bar', period=3600).count, 1)
+        self.assertEqual(trending.compute_top_tags('hour'), [{'tag': 'foo', 'total': 2}, {'tag': 'bar', 'total': 1}])
+
+    def test_old_buckets_outside_window(self):
+        now = timezone.now()
+        Message.objects.create(message_text='#old', created=now - timedelta(hours=2), user=self.user)
+        Message.objects.create(message_text='#new', created=now, user=self.user)
+
+        self.assertEqual([tag['tag'] for tag in trending.compute_top_tags('hour')], ['new'])
+        self.assertEqual([tag['tag'] for tag in trending.compute_top_tags('day')], ['new', 'old'])
+
+        self.assertEqual(trending.prune_counters(now + timedelta(hours=2)), 2)
+        self.assertEqual(TagCount.objects.filter(tag='old').count(), 1)
+
+    def test_trending_tags_on_home_page(self):
+        Message.objects.create(message_text='hello #foo', created=timezone.now(), user=self.user)
+        trending.refresh_top_tags()
+
+        response = self.client.get(reverse('base:home'))
+        self.assertIn('/search/wire/%23foo', response.content.decode())
+
+
+class MentionsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('foo', 'test@test.com', 'test')
+        self.bar = User.objects.create_user('bar', 'bar@test.com', 'test')
+        self.baz = User.objects.create_user('baz.qux', 'baz@test.com', 'test')
+
+    def test_find_mentions(self):
+        self.assertEqual(mentions.find_mentions('hi @bar, @baz.qux. and @bar me@example.com'), {'bar', 'baz.qux'})
+
+    def test_mentions_recorded_for_existing_users(self):
+        message = Message.objects.create(message_text='hi @bar @nobody @baz.qux', created=timezone.now(),
+                                         user=self.user)
+        Message.objects.bulk_create([Message(message_text='@bar again', created=timezone.now(), user=self.user)])
+
+        self.assertEqual(Mention.objects.filter(message=message).count(), 2)
+        self.assertEqual(Mention.objects.filter(user=self.bar).count(), 2)
+
+    def test_unauthenticated_access_is_blocked(self):
+        response = self.client.get(reverse('wire_profile:get_mentions'))
+
+        self.assertEqual(response.json()['success'], False)
+
+    def test_mentions_paginated_newest_first(self):
+        for message_text in ['@bar one', 'two', '@bar three', '@bar four']:
+            Message.objects.create(message_text=message_text, created=timezone.now(), user=self.user)
+        self.client.post(reverse('base:verify'), {'username': 'bar', 'password': 'test'})
+
+        first_page = self.client.get(reverse('wire_profile:get_mentions') + '?limit=2').json()
+        self.assertEqual([message['message_text'] for message in first_page], ['@bar four', '@bar three'])
+        self.assertEqual(first_page[0]['username'], 'foo')
+
+        url = reverse('wire_profile:get_mentions') + '?limit=2&before_id={}'.format(first_page[1]['id'])
+        self.assertEqual([message['message_text'] for message in self.client.get(url).json()], ['@bar one'])
+
+    def test_mentions_follow_created_when_ids_are_out_of_order(self):
+        now = timezone.now()
+        # Saved newest first, as an import or a batched flush can
+        for days, message_text in [(0, '@bar new'), (1, '@bar middle'), (2, '@bar old')]:
+            Message.objects.create(message_text=message_text, created=now - timedelta(days=days), user=self.user)
+        self.client.post(reverse('base:verify'), {'username': 'bar', 'password': 'test'})
+        url = reverse('wire_profile:get_mentions')
+
+        first_page = self.client.get(url, {'limit': 2}).json()
+        older = self.client.get(url, {'before_id': first_page[1]['id']}).json()
+        newer = self.client.get(url, {'since_id': first_page[1]['id']}).json()
+
+        self.assertEqual([message['message_text'] for message in first_page], ['@bar new', '@bar middle'])
+        self.assertEqual([message['message_text'] for message in older], ['@bar old'])
+        self.assertEqual([message['message_text'] for message in newer], ['@bar new'])
+
+    def test_deleted_message_removed_from_mentions(self):
+        message = Message.objects.create(message_text='@bar hi', created=timezone.now(), user=self.user)
+        self.client.post(reverse('base:verify'), {'username': 'bar', 'password': 'test'})
+        self.assertEqual(len(self.client.get(reverse('wire_profile:get_mentions')).json()), 1)
+
+        message.delete()
+        self.assertEqual(self.client.get(reverse('wire_profile:get_mentions')).json(), [])
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.users = [User.objects.create_user('user{}'.format(index), 'test@test.com', 'test') for index in range(4)]
+
+    def follow(self, follower, following):
+        return Follow.objects.create(follower_id=self.users[follower], following_id=self.users[following])
+
+    def test_follower_counts_maintained(self):
+        self.follow(0, 1)
+        follow = self.follow(2, 1)
+        Follow.objects.bulk_create([Follow(follower_id=self.users[0], following_id=self.users[3])])
+        self.assertEqual(UserStats.objects.get(user=self.users[1]).followers, 2)
+        self.assertEqual(UserStats.objects.get(user=self.users[3]).followers, 1)
+
+        follow.delete()
+        self.assertEqual(UserStats.objects.get(user=self.users[1]).followers, 1)
+
+    def test_activity_counts_maintained(self):
+        now = timezone.now()
+        message = Message.objects.create(message_text='foo', created=now, user=self.users[0])
+        Message.objects.bulk_create([Message(message_text='bar', created=now, user=self.users[0])])
+        self.assertEqual(UserActivity.objects.get(user=self.users[0]).messages, 2)
+
+        message.delete()
+        self.assertEqual(UserActivity.objects.get(user=self.users[0]).messages, 1)
+
+    def test_rebuild_matches_counters(self):
+        self.follow(0, 1)
+        self.follow(2, 1)
+        Message.objects.create(message_text='foo', created=timezone.now(), user=self.users[2])
+        counted = (leaderboard.compute_top_followed(), leaderboard.compute_top_active())
+
+        leaderboard.rebuild_counters()
+        self.assertEqual((leaderboard.compute_top_followed(), leaderboard.compute_top_active()), counted)
+
+    def test_leaderboard_endpoint(self):
+        self.follow(0, 1)
+        self.follow(2, 1)
+        self.follow(0, 2)
+        Message.objects.create(message_text='foo', created=timezone.now() - timedelta(days=30), user=self.users[3])
+        Message.objects.create(message_text='bar', created=timezone.now(), user=self.users[0])
+
+        response = self.client.get(reverse('wire_profile:get_leaderboard')).json()
+        self.assertEqual([entry['username'] for entry in response['followers']], ['user1', 'user2'])
+        self.assertEqual(response['followers'][0]['followers'], 2)
+        self.assertEqual(response['active'], [{'id': self.users[0].id, 'username': 'user0', 'messages': 1}])
+
+    def test_search_ranked_by_followers(self):
+        self.follow(0, 3)
+        leaderboard.refresh_leaderboards()
+
+        response = self.client.get(reverse('wire_profile:search_user', kwargs={'query': 'user'}))
+        self.assertEqual(response.context['search_results'][0], {'id': self.users[3].id, 'username': 'user3'})
+
+    def test_anonymous_recommendations_most_followed_first(self):
+        self.follow(0, 3)
+        self.follow(1, 2)
+        self.follow(0, 2)
+        leaderboard.refresh_leaderboards()
+
+        response = self.client.get(reverse('base:recommended_users', kwargs={'excluded_username': 'user0'}))
+        self.assertEqual([user['username'] for user in response.json()][:2], ['user2', 'user3'])
+        self.assertEqual(len(response.json()), 3)
+
+
+class AdminTest(TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@test.com', 'test')
+        self.client.login(username='admin', password='test')
+        self.foo = User.objects.create_user('foo', 'foo@test.com', 'test')
+        self.bar = User.objects.create_user('bar', 'bar@test.com', 'test')
+        self.old = Message.objects.create(message_text='old', created=timezone.now() - timedelta(days=10),
+                                          user=self.foo)
+        self.new = Message.objects.create(message_text='new', created=timezone.now(), user=self.bar)
+        Follow.objects.create(follower_id=self.foo, following_id=self.bar)
+
+    def changelist(self, model, params=None):
+        return self.client.get(reverse('admin:wire_profile_{}_changelist'.format(model)), params or {})
+
+    def test_message_changelist(self):
+        response = self.changelist('message')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message.message_text for message in response.context['cl'].result_list], ['new', 'old'])
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_message_search_by_exact_username_or_id(self):
+        by_username = self.changelist('message', {'q': 'foo'})
+        by_id = self.changelist('message', {'q': str(self.new.id)})
+        by_substring = self.changelist('message', {'q': 'fo'})
+
+        self.assertEqual(list(by_username.context['cl'].result_list), [self.old])
+        self.assertEqual(list(by_id.context['cl'].result_list), [self.new])
+        self.assertEqual(list(by_substring.context['cl'].result_list), [])
+
+    def test_message_posted_filter(self):
+        response = self.changelist('message', {'posted': 'week'})
+
+        self.assertEqual(list(response.context['cl'].result_list), [self.new])
+
+    def test_follow_search_matches_either_user(self):
+        follower = self.changelist('follow', {'q': 'foo'})
+        following = self.changelist('follow', {'q': 'bar'})
+
+        self.assertEqual(follower.status_code, 200)
+        self.assertEqual(len(follower.context['cl'].result_list), 1)
+        self.assertEqual(len(following.context['cl'].result_list), 1)
+
+    def test_paginator_counts_exactly_without_estimates(self):
+        self.assertIsNone(estimated_count(Message.objects.all()))
+        self.assertEqual(EstimatedCountPaginator(Message.objects.order_by('id'), 1).count, 2)
+
+
+class AccountDeletionTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = User.objects.create_user('foo', 'foo@test.com', 'test')
+        self.other = User.objects.create_user('bar', 'bar@test.com', 'test')
+        now = timezone.now()
+        Message.objects.bulk_create([Message(message_text='hello @bar {}'.format(number), created=now, user=self.user)
+                                     for number in range(5)])
+        Message.objects.create(message_text='hi @foo', created=now, user=self.other)
+        Follow.objects.create(follower_id=self.user, following_id=self.other)
+        Follow.objects.create(follower_id=self.other, following_id=self.user)
+
+    def test_request_deactivates_account(self):
+        account_deletion = deletion.request_deletion(self.user)
+
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        self.assertFalse(self.client.login(username='foo', password='test'))
+        self.assertEqual(account_deletion.username, 'foo')
+        self.assertEqual(list(deletion.pending_deletions()), [account_deletion])
+
+    def test_deactivated_account_hidden(self):
+        leaderboard.refresh_leaderboards()
+        deletion.request_deletion(self.user)
+
+        profile = self.client.get(reverse('wire_profile:get_profile_data', kwargs={'username': 'foo'})).json()
+        search = self.client.get(reverse('wire_profile:search_user', kwargs={'query': 'foo'}))
+        feed = self.client.get(reverse('wire_profile:get_feed', kwargs={'username': 'bar'}), {'feed': 'following'})
+
+        self.assertFalse(profile['success'])
+        self.assertEqual(list(search.context['search_results']), [])
+        self.assertEqual(feed.json(), [])
+        self.assertNotIn('foo', leaderboard.follower_ranks())
+
+    def test_deletions_not_added_in_admin(self):
+        User.objects.create_superuser('admin', 'admin@test.com', 'test')
+        self.client.login(username='admin', password='test')
+
+        response = self.client.get(reverse('admin:wire_profile_accountdeletion_add'))
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_data_deleted_in_batches(self):
+        account_deletion = deletion.request_deletion(self.user)
+        progress = []
+
+        deletion.run_deletion(account_deletion, batch_size=2, pause=0,
+                              progress=lambda job: progress.append((job.stage, job.deleted_rows)))
+
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(list(Message.objects.values_list('message_text', flat=True)), ['hi @foo'])
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(Mention.objects.exists())
+        self.assertEqual(UserStats.objects.get(user=self.other).followers, 0)
+        # One mention of foo, then five messages and the mention in each, then two follows
+        self.assertEqual(account_deletion.deleted_rows, 13)
+        self.assertEqual(progress[-1], ('done', 13))
+        self.assertGreater(len(progress), 6)
+        account_deletion.refresh_from_db()
+        self.assertIsNotNone(account_deletion.finished)
+        self.assertIsNone(account_deletion.user)
+
+    def test_interrupted_deletion_resumes(self):
+        deletion.request_deletion(self.user)
+
+        def interrupt(job):
+            if job.stage == 'messages' and job.deleted_rows > 1:
+                raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            deletion.run_deletion(deletion.pending_deletions()[0], batch_size=2, pause=0, progress=interrupt)
+        self.assertEqual(Message.objects.filter(user=self.user).count(), 3)
+
+        output = StringIO()
+        call_command('delete_accounts', '--once', '--pause=0', stdout=output)
+
+        self.assertIn('Deleted foo and 13 rows of their data', output.getvalue())
+        self.assertFalse(User.objects.filter(username='foo').exists())
+        self.assertFalse(deletion.pending_deletions().exists())
+
+    def test_delete_account_view(self):
+        self.client.login(username='foo', password='test')
+
+        self.client.post(reverse('base:delete_account'), {'password': 'wrong'})
+        self.assertTrue(User.objects.get(pk=self.user.pk).is_active)
+
+        response = self.client.post(reverse('base:delete_account'), {'password': 'test'})
+        self.assertRedirects(response, reverse('base:home'))
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        self.assertTrue(AccountDeletion.objects.filter(user=self.user, finished__isnull=True).exists())
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+
+class RetentionTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.foo = User.objects.create_user('foo', 'foo@test.com', 'test')
+        self.bar = User.objects.create_user('bar', 'bar@test.com', 'test')
+        now = timezone.now()
+        for days in (100, 50, 3, 2, 1):
+            Message.objects.create(message_text='foo {} days @bar'.format(days), created=now - timedelta(days=days),
+                                   user=self.foo)
+        Message.objects.create(message_text='bar 200 days', created=now - timedelta(days=200), user=self.bar)
+
+    def texts(self):
+        return sorted(Message.objects.values_list('message_text', flat=True))
+
+    def test_prune_expired_in_batches(self):
+        pruned = retention.prune_expired(30, batch_size=1)
+
+        self.assertEqual(pruned, 3)
+        self.assertEqual(self.texts(), ['foo 1 days @bar', 'foo 2 days @bar', 'foo 3 days @bar'])
+        self.assertEqual(Mention.objects.count(), 3)
+
+    def test_prune_excess_keeps_newest(self):
+        pruned = retention.prune_excess(2, batch_size=2)
+
+        self.assertEqual(pruned, 3)
+        self.assertEqual(self.texts(), ['bar 200 days', 'foo 1 days @bar', 'foo 2 days @bar'])
+
+    def test_prune_excess_only_reads_users_over_the_limit(self):
+        # Nobody has more than five messages, so no user's messages are read
+        with self.assertNumQueries(1):
+            self.assertEqual(retention.prune_excess(5, batch_size=2), 0)
+
+        self.assertEqual(retention.prune_excess(0, batch_size=10), 6)
+        self.assertEqual(Message.objects.count(), 0)
+
+    def test_prune_excess_with_messages_created_together(self):
+        created = timezone.now()
+        Message.objects.bulk_create([Message(message_text='bar {}'.format(number), created=created, user=self.bar)
+                                     for number in range(4)])
+        newest = Message.objects.filter(user=self.bar).newest_first()[0]
+
+        self.assertEqual(retention.prune_excess(1, batch_size=1), 8)
+        self.assertEqual(list(Message.objects.filter(user=self.bar)), [newest])
+
+    def test_dry_run_deletes_nothing(self):
+        self.assertEqual(retention.prune_expired(30, batch_size=10, dry_run=True), 3)
+        self.assertEqual(retention.prune_excess(1, batch_size=10, dry_run=True), 4)
+        self.assertEqual(Message.objects.count(), 6)
+
+    def test_command_archives_before_pruning(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        output = StringIO()
+
+        call_command('prune_messages', '--max-age-days=30', '--pause=0', '--archive-dir', archive_dir.name,
+                     stdout=output)
+
+        self.assertIn('Pruned 3 messages older than 30 days', output.getvalue())
+        archive_name, = os.listdir(archive_dir.name)
+        with gzip.open(os.path.join(archive_dir.name, archive_name), 'rt') as archive:
+            archived = [json.loads(line) for line in archive]
+        self.assertEqual(sorted(message['message_text'] for message in archived),
+                         ['bar 200 days', 'foo 100 days @bar', 'foo 50 days @bar'])
+        self.assertEqual(len(self.texts()), 3)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.foo = User.objects.create_user('foo', 'foo@test.com', 'test')
+        self.bar = User.objects.create_user('bar', 'bar@test.com', 'test')
+        Message.objects.create(message_text='hello, "world"', created=timezone.now(), user=self.foo)
+        Message.objects.create(message_text='second', created=timezone.now(), user=self.foo)
+        Message.objects.create(message_text='not exported', created=timezone.now(), user=self.bar)
+        Follow.objects.create(follower_id=self.bar, following_id=self.foo)
+
+    def export(self, params=None):
+        response = self.client.get(reverse('wire_profile:export_data'), params or {})
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        self.client.login(username='foo', password='test')
+
+        response, content = self.export()
+        records = [json.loads(line) for line in content.splitlines()]
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('filename="wire-foo.ndjson"', response['Content-Disposition'])
+        self.assertEqual([(record['type'], record.get('message_text')) for record in records], [
+            ('user', None), ('message', 'hello, "world"'), ('message', 'second'), ('follower', None)])
+        self.assertEqual(records[-1]['username'], 'bar')
+
+    def test_export_csv(self):
+        self.client.login(username='foo', password='test')
+
+        response, content = self.export({'format': 'csv'})
+        lines = content.splitlines()
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(lines[0], 'type,id,username,created,message_text')
+        self.assertTrue(lines[2].endswith(',"hello, ""world"""'))
+        self.assertEqual(len(lines), 5)
+
+    def test_export_requires_login_and_staff_for_other_users(self):
+        anonymous = self.client.get(reverse('wire_profile:export_data')).json()
+        self.client.login(username='foo', password='test')
+        other_user = self.client.get(reverse('wire_profile:export_data'), {'username': 'bar'}).json()
+        bad_format = self.client.get(reverse('wire_profile:export_data'), {'format': 'xml'}).json()
+
+        self.assertFalse(anonymous['success'])
+        self.assertFalse(other_user['success'])
+        self.assertFalse(bad_format['success'])
+
+    def test_large_accounts_not_exported_from_the_web(self):
+        self.client.login(username='foo', password='test')
+
+        with override_settings(EXPORT_MAX_WEB_ROWS=3):
+            allowed, content = self.export()
+        with override_settings(EXPORT_MAX_WEB_ROWS=2):
+            too_large = self.client.get(reverse('wire_profile:export_data')).json()
+
+        self.assertEqual(len(content.splitlines()), 4)
+        self.assertFalse(too_large['success'])
+        self.assertIn('export_user_data', too_large['message'])
+
+    def test_command_exports_gzipped_file(self):
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        path = os.path.join(export_dir.name, 'foo.ndjson.gz')
+
+        call_command('export_user_data', 'foo', '--gzip', '--output', path)
+
+        with gzip.open(path, 'rt') as export_file:
+            self.assertEqual([json.loads(line)['type'] for line in export_file],
+                             ['user', 'message', 'message', 'follower'])
+
+
+class ImportTest(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.foo = User.objects.create_user('foo', 'foo@test.com', 'test')
+        self.bar = User.objects.create_user('bar', 'bar@test.com', 'test')
+        Follow.objects.create(follower_id=self.foo, following_id=self.bar)
+        self.import_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.import_dir.cleanup)
+
+    def write(self, name, lines):
+        path = os.path.join(self.import_dir.name, name)
+        with (gzip.open(path, 'wt') if name.endswith('.gz') else open(path, 'w')) as import_file:
+            import_file.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_import_ndjson_in_batches(self):
+        records = [{'type': 'message', 'username': 'foo', 'created': '2018-03-01T12:00:{:02}'.format(number),
+                    'message_text': 'imported #wire @bar {}'.format(number)} for number in range(5)]
+        records += [{'type': 'follow', 'follower': 'bar', 'following': 'foo'},
+                    {'type': 'follow', 'follower': 'foo', 'following': 'bar'},
+                    {'type': 'message', 'username': 'nobody', 'created': '2018-03-01T12:00:00',
+                     'message_text': 'unknown user'},
+                    {'type': 'message', 'username': 'foo', 'created': 'yesterday', 'message_text': 'bad date'}]
+        lines = [json.dumps(record) for record in records] + ['not json']
+        batches = []
+
+        run = importer.Importer(batch_size=3, progress=lambda job: batches.append(dict(job.counts)))
+        run.run(importer.read_ndjson(lines))
+        run.finish()
+
+        self.assertEqual(run.counts, {'message': 5, 'follow': 1, 'skipped': 4})
+        self.assertEqual(len(batches), 4)
+        message = Message.objects.get(message_text='imported #wire @bar 0')
+        self.assertEqual(message.created, datetime(2018, 3, 1, 12, 0, tzinfo=timezone.utc))
+        self.assertEqual(Mention.objects.filter(user=self.bar).count(), 5)
+        self.assertTrue(TagCount.objects.filter(tag='wire').exists())
+        self.assertEqual(Follow.objects.count(), 2)
+        self.assertEqual(UserStats.objects.get(user=self.foo).followers, 1)
+
+    @override_settings(MESSAGE_SNOWFLAKE_IDS=True, SNOWFLAKE_WORKER_ID=1)
+    def test_snowflake_ids_made_from_created(self):
+        live = Message.objects.create(message_text='live', created=timezone.now(), user=self.foo)
+        records = [{'type': 'message', 'username': 'foo', 'created': created, 'message_text': text}
+                   for created, text in [('2019-03-01T12:00:00', 'second'), ('2017-03-01T12:00:00', 'first'),
+                                         ('2019-03-01T12:00:00', 'third')]]
+
+        run = importer.Importer(batch_size=2)
+        run.run(records)
+        run.run(records[:1])
+
+        messages = list(Message.objects.filter(user=self.foo).newest_first())
+        self.assertEqual([message.message_text for message in messages], ['live', 'second', 'third', 'second',
+                                                                          'first'])
+        self.assertEqual(messages[0], live)
+        self.assertEqual(snowflake.created_at(messages[1].id), datetime(2019, 3, 1, 12, 0, tzinfo=timezone.utc))
+        self.assertLess(messages[-1].id, 0)
+
+    def test_command_imports_gzipped_csv(self):
+        path = self.write('messages.csv.gz', ['username,created,message_text', 'bar,2018-03-01T12:00:00Z,"hi, foo"',
+                                             'foo,2018-03-02T12:00:00+01:00,second'])
+        output = StringIO()
+
+        call_command('import_data', path, '--format=csv', '--type=message', stdout=output)
+
+        self.assertIn('Imported 2 messages and 0 follows, skipped 0 records', output.getvalue())
+        self.assertIn('rows/s', output.getvalue())
+        self.assertEqual(sorted(Message.objects.values_list('message_text', flat=True)), ['hi, foo', 'second'])
+
+    def test_command_requires_type_for_csv(self):
+        path = self.write('follows.csv', ['follower,following', 'bar,foo'])
+
+        with self.assertRaises(CommandError):
+            call_command('import_data', path, '--format=csv')
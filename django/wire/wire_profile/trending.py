@@ -0,0 +1,108 @@
+"""
+Trending hashtags from time bucketed counters.
+
+Every new message adds one to the counter of each of its hashtags in the current bucket of each period, per minute and
+per hour by default. The most used tags in a window, such as the last hour, are the sums of the buckets inside it. As
+only buckets are read, working out the top tags costs the same however many messages there are, and the result is
+cached so serving it costs a single cache read. Deleted messages are not taken off the counters.
+"""
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.db.models import Sum
+from base.cache import cached_query, compute_and_store, versioned_key
+from .counters import add_to_counters
+from .models import TagCount
+
+TAG = re.compile(r'(?<![\w#])#(\w{1,100})')
+
+
+def find_tags(message_text):
+    """
+    :param message_text: The text of a message
+    :return: The distinct hashtags in the text, lower case and without the #
+    """
+    return {tag.lower() for tag in TAG.findall(message_text)}
+
+
+def bucket_start(moment, period):
+    """
+    :param moment: An aware datetime
+    :param period: The length of a bucket in seconds
+    :return: The start of the bucket containing the given time, in UTC
+    """
+    seconds = int(moment.timestamp())
+    return datetime.fromtimestamp(seconds - seconds % period, tz=timezone.utc)
+
+
+def periods():
+    """
+    :return: The bucket lengths used by the trending windows
+    """
+    return {period for period, length in settings.TRENDING_TAG_WINDOWS.values()}
+
+
+def count_tags(messages):
+    """
+    Add the hashtags of new messages to the counters
+
+    :param messages: The new messages
+    """
+    counts = Counter()
+    for message in messages:
+        for tag in find_tags(message.message_text):
+            for period in periods():
+                counts[(tag, period, bucket_start(message.created, period))] += 1
+    add_to_counters(TagCount, ('tag', 'period', 'bucket'), 'count', counts)
+
+
+def compute_top_tags(window, now=None):
+    """
+    Sum the buckets inside a window
+
+    :param window: The name of a window in TRENDING_TAG_WINDOWS
+    :param now: An aware datetime for the end of the window, defaults to now
+    :return: list of the most used tags and their counts, most used first
+    """
+    period, length = settings.TRENDING_TAG_WINDOWS[window]
+    start = bucket_start((now or datetime.now(timezone.utc)) - timedelta(seconds=length), period)
+    return list(TagCount.objects.filter(period=period, bucket__gt=start).values('tag')
+                .annotate(total=Sum('count')).order_by('-total', 'tag')[:settings.TRENDING_TAG_COUNT])
+
+
+def top_tags(window):
+    """
+    Get the most used tags in a window, as last computed by refresh_top_tags
+
+    :param window: The name of a window in TRENDING_TAG_WINDOWS
+    :return: list of dictionaries with tag and total
+    """
+    return cached_query('trending_tags:' + window, [], lambda: compute_top_tags(window),
+                        timeout=settings.TRENDING_TAG_TIMEOUT)
+
+
+def refresh_top_tags():
+    """
+    Compute the top tags of every window and store them for top_tags to serve
+    """
+    for window in settings.TRENDING_TAG_WINDOWS:
+        compute_and_store(versioned_key('trending_tags:' + window, []), lambda: compute_top_tags(window),
+                          settings.TRENDING_TAG_TIMEOUT)
+
+
+def prune_counters(now=None):
+    """
+    Delete buckets that are no longer inside any window
+
+    :param now: An aware datetime, defaults to now
+    :return: The number of buckets deleted
+    """
+    now = now or datetime.now(timezone.utc)
+    deleted = 0
+    for period in periods():
+        length = max(length for bucket_period, length in settings.TRENDING_TAG_WINDOWS.values()
+                     if bucket_period == period)
+        deleted += TagCount.objects.filter(period=period, bucket__lte=now - timedelta(seconds=length + period))\
+            .delete()[0]
+    return deleted
@@ -8,6 +8,8 @@ app_name = 'wire_profile'
 urlpatterns = [
     path('profile/<path:username>', ProfileView.as_view(), name='profile'),
     path('profile/', CurrentProfileView.as_view(), name='current_profile'),
+    path('bulk/message/', views.bulk_create_messages, name='bulk_create_messages'),
+    path('bulk/follow/', views.bulk_follow_users, name='bulk_follow_users'),
     path('message/<path:username>', views.get_messages, name='get_message'),
     path('messages/<path:user_ids>', views.get_messages_by_ids, name='get_messages_by_ids'),
     path('message/', views.create_message, name='message'),
@@ -16,6 +18,11 @@ urlpatterns = [
     path('following/<path:username>', views.get_following, name='get_following'),
     path('users/<path:user_ids>', views.get_user_ids, name='get_user_ids'),
     path('user/id/<int:user_id>', views.get_user_id, name='get_user_id'),
+    path('profile-data/<path:username>', views.get_profile_data, name='get_profile_data'),
+    path('feed/<path:username>', views.get_feed, name='get_feed'),
+    path('export/', views.export_data, name='export_data'),
+    path('mentions/', views.get_mentions, name='get_mentions'),
+    path('leaderboard/', views.get_leaderboard, name='get_leaderboard'),
     path('search', SearchView.as_view(), name='search'),
     path('search/wire/<path:query>', SearchMessageView.as_view(), name='search_message'),
     path('search/user/<path:query>', SearchUserView.as_view(), name='search_user'),
@@ -1,20 +1,68 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
 from django.shortcuts import render
 from django.template.loader import get_template
-from django.http import HttpResponseRedirect, HttpResponse, JsonResponse
+from django.http import HttpResponseRedirect, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.views.generic import TemplateView
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
-from django.db import DatabaseError
+from django.utils.decorators import method_decorator
+from django.utils.safestring import mark_safe
+from django.db import DatabaseError, connection, connections, router, transaction
 from django.db.models import ObjectDoesNotExist, FieldDoesNotExist
 from django.core import serializers
 from .forms import NewWireForm, SearchForm
-from .models import Message, Follow
+from .models import Message, Follow, Mention, newest_first_order, page_filter
+from . import export, ingestion, leaderboard
+from .signals import follows_changed, messages_changed
+from base.bloom import usernames
+from base.cache import LocalCache, cached_query
+from base.compression import compression
+from base.middleware import public_read
+from base.pagecache import cache_anonymous_page
+from base.views import get_recommended_users
+from wire.routers import reading_from, writes_to_primary
 
 # Create your views here.
 
+users_by_username = LocalCache(settings.LOCAL_CACHE_TIMEOUT)
 
+
+def get_user_by_username(username):
+    """
+    Get the active user with the given username, from the cache local to this process when possible. Deactivated
+    users, such as those whose accounts are being deleted, are treated as if they did not exist
+
+    :param username: The username of the user
+    :return: The user
+    :raises User.DoesNotExist: if there is no active user with the given username
+    """
+    user = users_by_username.get(username)
+    if user is None:
+        if not usernames.may_exist(username):
+            raise User.DoesNotExist('User matching query does not exist.')
+        user = User.objects.get(username=username, is_active=True)
+        users_by_username.set(username, user, ['user:{}'.format(user.id)])
+    return user
+
+
+def profile_page_keys(request, username):
+    """
+    :param request: The current request
+    :param username: The username of the profile being shown
+    :return: The surrogate keys of the profile page, or None if the user was not found
+    """
+    try:
+        return ['page:user:{}'.format(get_user_by_username(username.rstrip('/')).id)]
+    except ObjectDoesNotExist:
+        return None
+
+
+@method_decorator(cache_anonymous_page(profile_page_keys), name='get')
 class ProfileView(TemplateView):
     template_name = "wire_profile/profile.html"
 
@@ -32,8 +80,10 @@ class ProfileView(TemplateView):
         context['is_current_user'] = False
 
         try:
-            user = User.objects.get(username=username)
+            user = get_user_by_username(username)
             context['user'] = user
+            if settings.PROFILE_DATA_INLINE:
+                context['profile_data'] = profile_data_for_script(collect_profile_data(user, request.user))
             return self.render_to_response(context)
 
         except (ObjectDoesNotExist, FieldDoesNotExist):
@@ -59,6 +109,9 @@ class CurrentProfileView(TemplateView):
             form = NewWireForm()
             context['form'] = form
             context['user'] = request.user
+            if settings.PROFILE_DATA_INLINE:
+                data = collect_profile_data(request.user, request.user, feed='following')
+                context['profile_data'] = profile_data_for_script(data)
             return self.render_to_response(context)
         else:
             messages.error(request, 'You must log in to view your profile page', extra_tags='danger')
@@ -110,7 +163,8 @@ class SearchMessageView(TemplateView):
         :return: Render the search message results page
         """
         query = self.kwargs['query']
-        search_results = Message.objects.filter(message_text__icontains=query).all()
+        search_results = cached_query('search_messages:' + query, ['messages'], lambda: list(
+            Message.objects.filter(message_text__icontains=query).select_related('user')))
         context = self.get_context_data(**kwargs)
         context['search_results'] = search_results
         return self.render_to_response(context)
@@ -129,12 +183,17 @@ class SearchUserView(TemplateView):
         :return: Render the search message results page
         """
         query = self.kwargs['query']
-        search_results = User.objects.filter(username__icontains=query).all()
+        search_results = cached_query('search_users:' + query, ['users'], lambda: list(
+            User.objects.filter(username__icontains=query, is_active=True).values('id', 'username')))
+        # Show the most followed users first
+        ranks = leaderboard.follower_ranks()
+        search_results = sorted(search_results, key=lambda user: -ranks.get(user['username'], 0))
         context = self.get_context_data(**kwargs)
         context['search_results'] = search_results
         return self.render_to_response(context)
 
 
+@writes_to_primary
 def create_message(request):
     """
     Create a message for the logged in user
@@ -148,10 +207,13 @@ def create_message(request):
             if request.user.is_authenticated:
                 message = form.cleaned_data['message']
                 try:
-                    Message.objects.create(message_text=message, created=timezone.now(), user=request.user)
+                    if ingestion.is_batched():
+                        ingestion.enqueue_message(request.user, message, timezone.now())
+                    else:
+                        Message.objects.create(message_text=message, created=timezone.now(), user=request.user)
                     messages.success(request, 'Message created successfully', extra_tags='success')
                     return HttpResponseRedirect(reverse('wire_profile:current_profile'))
-                except DatabaseError:
+                except (DatabaseError, OSError):
                     messages.error(request, 'Error creating message, please contact support', extra_tags='danger')
                     return HttpResponseRedirect(reverse('wire_profile:current_profile'))
             else:
@@ -165,44 +227,81 @@ def create_message(request):
         return HttpResponseRedirect(reverse('base:home'))
 
 
+def paginate_messages(user_messages, params):
+    """
+    Order messages newest first and apply the pagination parameters. since_id fetches messages newer than one already
+    shown and before_id fetches the page after it, comparing on the same keys the messages are ordered by
+
+    :param user_messages: The messages to paginate
+    :param params: dictionary that may contain since_id, before_id and limit
+    :return: The page of messages
+    """
+    try:
+        if params.get('since_id'):
+            user_messages = user_messages.page_from(int(params['since_id']), older=False)
+        if params.get('before_id'):
+            user_messages = user_messages.page_from(int(params['before_id']), older=True)
+        user_messages = user_messages.newest_first()
+        if params.get('limit'):
+            user_messages = user_messages[:max(int(params['limit']), 0)]
+    except ValueError:
+        return user_messages.none()
+    return user_messages
+
+
+def page_name(params):
+    """
+    :param params: dictionary that may contain since_id, before_id and limit
+    :return: A name for the page of messages, for use in cache keys
+    """
+    return ':'.join(str(params.get(name, '')) for name in ('since_id', 'before_id', 'limit'))
+
+
+@public_read
 def get_messages(request, username):
     """
     Retrieve messages for the given username in JSON format
 
     :param request: The request sent by the user
     :param username: The username to retrieve messages for
-    :return:
+    :return: list of messages or failure message in JSON format
     """
     try:
-        user = User.objects.get(username=username)
-        user_messages = Message.objects.filter(user=user).order_by('-created').values('message_text', 'created', 'user')
-        return JsonResponse(list(user_messages), safe=False)
+        user = get_user_by_username(username)
+        user_messages = cached_query(
+            'get_messages:{}:{}'.format(user.id, page_name(request.GET)), ['messages:user:{}'.format(user.id)],
+            lambda: list(paginate_messages(Message.objects.filter(user=user), request.GET)
+                         .values('id', 'message_text', 'created', 'user')))
+        return JsonResponse(user_messages, safe=False)
 
     except (ObjectDoesNotExist, FieldDoesNotExist):
-        messages.error(request, 'The requested user was not found', extra_tags='danger')
-        return HttpResponseRedirect(reverse('base:home'))
+        return JsonResponse({'success': False, 'message': 'The requested user was not found'})
 
 
+@public_read
 def get_messages_by_ids(request, user_ids):
     """
     Retrieve messages for the given user ids in JSON format
 
     :param request: The request sent by the user
     :param user_ids: The user ids to retrieve messages for
-    :return:
+    :return: list of messages or failure message in JSON format
     """
     try:
         user_ids_list = filter(bool, user_ids.split('/'))
-        user_ids_list = list(map(int, user_ids_list))
-        users = User.objects.filter(pk__in=user_ids_list)
-        user_messages = Message.objects.filter(user__in=users).order_by('-created').values('message_text', 'created', 'user')
-        return JsonResponse(list(user_messages), safe=False)
+        user_ids_list = sorted(set(map(int, user_ids_list)))
+        user_messages = cached_query(
+            'get_messages_by_ids:{}:{}'.format(user_ids_list, page_name(request.GET)),
+            ['messages:user:{}'.format(user_id) for user_id in user_ids_list],
+            lambda: list(paginate_messages(Message.objects.filter(user__in=user_ids_list), request.GET)
+                         .values('id', 'message_text', 'created', 'user')))
+        return JsonResponse(user_messages, safe=False)
 
     except (ObjectDoesNotExist, FieldDoesNotExist):
-        messages.error(request, 'Error retrieving messages, Please contact support', extra_tags='danger')
-        return HttpResponseRedirect(reverse('base:home'))
+        return JsonResponse({'success': False, 'message': 'Error retrieving messages, Please contact support'})
 
 
+@writes_to_primary
 def follow_user(request, username):
     """
     Follow the given username
@@ -217,7 +316,7 @@ def follow_user(request, username):
     if request.user.username == username:
         return JsonResponse({'success': False, 'message': 'You cannot follow yourself!'})
     try:
-        user = User.objects.get(username=username)
+        user = get_user_by_username(username)
         maybe_following = Follow.objects.filter(follower_id=request.user).filter(following_id=user)
         if maybe_following.count() > 0:
             maybe_following.delete()
@@ -229,6 +328,112 @@ def follow_user(request, username):
         return JsonResponse({'success': False, 'message': 'The user you tried to follow was not found'})
 
 
+def load_bulk_items(request, key):
+    """
+    Read the list of items sent in the JSON body of a bulk request
+
+    :param request: The request sent by the user
+    :param key: The key of the list in the JSON body
+    :return: list of items
+    :raises ValueError: if the body is not valid or has too many items
+    """
+    try:
+        items = json.loads(request.body.decode())[key]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Please send a JSON object with a list of ' + key)
+    if not isinstance(items, list):
+        raise ValueError('Please send a JSON object with a list of ' + key)
+    if len(items) > settings.BULK_MAX_ITEMS:
+        raise ValueError('A maximum of {} {} can be sent at once'.format(settings.BULK_MAX_ITEMS, key))
+    return items
+
+
+@writes_to_primary
+def bulk_create_messages(request):
+    """
+    Create several messages for the logged in user in one transaction
+
+    :param request: The request sent by the user, with a JSON body of the form {"messages": ["...", ...]}
+    :return: success or failure message for each message in JSON format
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Sorry, you cannot access that URL'})
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'Sorry, only registered users can create messages'})
+    try:
+        message_texts = load_bulk_items(request, 'messages')
+    except ValueError as error:
+        return JsonResponse({'success': False, 'message': str(error)})
+
+    results = []
+    new_messages = []
+    created = timezone.now()
+    for message_text in message_texts:
+        form = NewWireForm({'message': message_text if isinstance(message_text, str) else ''})
+        if form.is_valid():
+            new_messages.append(Message(message_text=form.cleaned_data['message'], created=created, user=request.user))
+            results.append({'success': True, 'message': 'Message created successfully'})
+        else:
+            results.append({'success': False, 'message': 'Please enter a message of at most 280 characters'})
+
+    try:
+        with transaction.atomic():
+            Message.objects.bulk_create(new_messages)
+        messages_changed([request.user.id])
+    except DatabaseError:
+        return JsonResponse({'success': False, 'message': 'Error creating messages, please contact support'})
+    return JsonResponse({'success': True, 'results': results})
+
+
+@writes_to_primary
+def bulk_follow_users(request):
+    """
+    Follow several users in one transaction. Users that are already being followed stay followed
+
+    :param request: The request sent by the user, with a JSON body of the form {"usernames": ["...", ...]}
+    :return: success or failure message for each username in JSON format
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Sorry, you cannot access that URL'})
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'You must be logged in to follow a user'})
+    try:
+        usernames = load_bulk_items(request, 'usernames')
+    except ValueError as error:
+        return JsonResponse({'success': False, 'message': str(error)})
+
+    usernames = [str(username).rstrip('/') for username in usernames]
+    user_ids = dict(User.objects.filter(username__in=usernames, is_active=True).values_list('username', 'id'))
+    followed_ids = set(Follow.objects.filter(follower_id=request.user, following_id__in=user_ids.values())
+                       .values_list('following_id', flat=True))
+
+    results = []
+    new_follows = []
+    for username in usernames:
+        if username == request.user.username:
+            results.append({'username': username, 'success': False, 'message': 'You cannot follow yourself!'})
+        elif username not in user_ids:
+            results.append({'username': username, 'success': False,
+                            'message': 'The user you tried to follow was not found'})
+        elif user_ids[username] in followed_ids:
+            results.append({'username': username, 'success': True,
+                            'message': 'You are already following ' + username})
+        else:
+            followed_ids.add(user_ids[username])
+            new_follows.append(Follow(follower_id=request.user, following_id_id=user_ids[username]))
+            results.append({'username': username, 'success': True,
+                            'message': 'You have successfully followed ' + username})
+
+    try:
+        with transaction.atomic():
+            Follow.objects.bulk_create(new_follows)
+        follows_changed([request.user.id] + [follow.following_id_id for follow in new_follows])
+    except DatabaseError:
+        return JsonResponse({'success': False, 'message': 'Error following users, please contact support'})
+    return JsonResponse({'success': True, 'results': results})
+
+
+@public_read
 def get_followers(request, username):
     """
     Get the users following the given user
@@ -238,13 +443,15 @@ def get_followers(request, username):
     :return: list of followers or failure message in JSON format
     """
     try:
-        user = User.objects.get(username=username)
-        followers = Follow.objects.filter(following_id=user).values('follower_id', 'following_id')
-        return JsonResponse(list(followers), safe=False)
+        user = get_user_by_username(username)
+        followers = cached_query('get_followers:{}'.format(user.id), ['follows:user:{}'.format(user.id)], lambda: list(
+            Follow.objects.filter(following_id=user).values('follower_id', 'following_id')))
+        return JsonResponse(followers, safe=False)
     except(ObjectDoesNotExist, FieldDoesNotExist):
         return JsonResponse({'success': False, 'message': 'The given username was not found'})
 
 
+@public_read
 def get_following(request, username):
     """
     Get the users followed by the given user
@@ -254,13 +461,15 @@ def get_following(request, username):
     :return: list of followers or failure message in JSON format
     """
     try:
-        user = User.objects.get(username=username)
-        followers = Follow.objects.filter(follower_id=user).values('follower_id', 'following_id')
-        return JsonResponse(list(followers), safe=False)
+        user = get_user_by_username(username)
+        followers = cached_query('get_following:{}'.format(user.id), ['follows:user:{}'.format(user.id)], lambda: list(
+            Follow.objects.filter(follower_id=user).values('follower_id', 'following_id')))
+        return JsonResponse(followers, safe=False)
     except(ObjectDoesNotExist, FieldDoesNotExist):
         return JsonResponse({'success': False, 'message': 'The given username was not found'})
 
 
+@public_read
 def get_user_ids(request, user_ids):
     """
     Get the users with the given IDs in JSON format
@@ -275,6 +484,8 @@ def get_user_ids(request, user_ids):
     return JsonResponse(list(users), safe=False)
 
 
+@public_read
+@compression(enabled=False)
 def get_user_id(request, user_id):
     """
     Get the user with the given ID in JSON format
@@ -285,3 +496,256 @@ def get_user_id(request, user_id):
     """
     users = User.objects.filter(pk=user_id).values('username')
     return JsonResponse(list(users), safe=False)
+
+
+@public_read
+def get_leaderboard(request):
+    """
+    Get the most followed users and the users who posted the most messages recently
+
+    :param request: The request that called this function
+    :return: both leaderboards in JSON format
+    """
+    return JsonResponse({
+        'followers': [{'id': entry['user_id'], 'username': entry['user__username'], 'followers': entry['followers']}
+                      for entry in leaderboard.top_users('followers')],
+        'active': [{'id': entry['user_id'], 'username': entry['user__username'], 'messages': entry['messages']}
+                   for entry in leaderboard.top_users('active')],
+    })
+
+
+def run_queries(queries):
+    """
+    Evaluate independent queries, running them on separate threads and connections when the database supports it.
+    The connections all import a snapshot exported by this thread's connection, so they see the same data
+
+    :param queries: dictionary of names to functions returning the evaluated query
+    :return: dictionary of names to query results
+    """
+    if not settings.PROFILE_DATA_CONCURRENT or connection.vendor != 'postgresql':
+        return {name: query() for name, query in queries.items()}
+
+    alias = router.db_for_read(Message)
+    if alias != 'default' and connections[alias].pg_version < 100000:
+        # Snapshots can only be exported from standby servers since PostgreSQL 10
+        with reading_from(alias):
+            return {name: query() for name, query in queries.items()}
+
+    def run_query(query, snapshot):
+        try:
+            with reading_from(alias), transaction.atomic(using=alias):
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                    cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+                return query()
+        finally:
+            # Every thread opens its own connection, so close it before the thread is reused
+            connections.close_all()
+
+    # The snapshot can be imported for as long as the transaction exporting it is open
+    with reading_from(alias), transaction.atomic(using=alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT pg_export_snapshot()')
+            snapshot = cursor.fetchone()[0]
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            futures = {name: executor.submit(run_query, query, snapshot) for name, query in queries.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+
+def followed_users(user):
+    """
+    :param user: A user
+    :return: list of the ids and usernames of the users they follow
+    """
+    return cached_query('profile_following:{}'.format(user.id), ['follows:user:{}'.format(user.id)], lambda: list(
+        Follow.objects.filter(follower_id=user).values('following_id', 'following_id__username')))
+
+
+def load_feed(user, feed='own', params=None):
+    """
+    Get a page of the messages shown on a profile page, newest first. Pages hold FEED_PAGE_SIZE messages unless a
+    smaller limit is given
+
+    :param user: The user whose profile is being shown
+    :param feed: 'own' for the user's messages or 'following' for messages from the users they follow
+    :param params: Optional since_id, before_id and limit parameters for the messages
+    :return: list of messages
+    """
+    params = dict((params or {}).items())
+    try:
+        params['limit'] = min(max(int(params.get('limit') or settings.FEED_PAGE_SIZE), 0), settings.FEED_PAGE_SIZE)
+    except ValueError:
+        return []
+    if feed == 'following':
+        # Deactivated users are left out, their namespaces are published when they are deactivated
+        feed_messages = Message.objects.filter(user__followed_user__follower_id=user, user__is_active=True)
+        # Only new messages from the users followed invalidate the feed
+        feed_namespaces = ['follows:user:{}'.format(user.id)] + [
+            'messages:user:{}'.format(follow['following_id']) for follow in followed_users(user)]
+    else:
+        feed = 'own'
+        feed_messages = Message.objects.filter(user=user)
+        feed_namespaces = ['messages:user:{}'.format(user.id)]
+
+    user_messages = cached_query(
+        'profile_messages:{}:{}:{}'.format(feed, user.id, page_name(params)), feed_namespaces,
+        lambda: list(paginate_messages(feed_messages, params)
+                     .values('id', 'message_text', 'created', 'user', 'user__username')))
+    return [{'id': message['id'], 'message_text': message['message_text'], 'created': message['created'],
+             'user': message['user'], 'username': message['user__username']}
+            for message in user_messages]
+
+
+def collect_profile_data(user, viewer, feed='own', params=None):
+    """
+    Gather everything a profile page needs to display for the given user
+
+    :param user: The user whose profile is being shown
+    :param viewer: The user viewing the profile, may be anonymous
+    :param feed: 'own' for the user's messages or 'following' for messages from the users they follow
+    :param params: Optional since_id, before_id and limit parameters for the messages
+    :return: dictionary of the user, their follows, their followers, recommended users and messages
+    """
+    params = params or {}
+    follows_namespace = 'follows:user:{}'.format(user.id)
+    viewer_id = viewer.id if viewer.is_authenticated else None
+    viewer_namespaces = ['users'] + (['follows:user:{}'.format(viewer_id)] if viewer_id else [])
+
+    results = run_queries({
+        'following': lambda: followed_users(user),
+        'followers': lambda: cached_query('profile_followers:{}'.format(user.id), [follows_namespace], lambda: list(
+            Follow.objects.filter(following_id=user).values('follower_id', 'follower_id__username'))),
+        'recommended_users': lambda: cached_query(
+            'recommended_users:{}:{}'.format(viewer_id, user.username), viewer_namespaces,
+            lambda: list(get_recommended_users(viewer, user.username))),
+        'messages': lambda: load_feed(user, feed, params),
+    })
+
+    if ingestion.is_batched() and viewer == user and 'before_id' not in params:
+        # Show authors the messages they have posted that have not been saved yet, in their own feed and the feed of
+        # the users they follow. Messages saved by a flush that has not removed its queue file yet are shown once
+        shown = {(message['user'], message['created'], message['message_text']) for message in results['messages']}
+        pending = [{'id': None, 'message_text': message['message_text'], 'created': message['created'],
+                    'user': user.id, 'username': user.username}
+                   for message in ingestion.pending_messages(user.id)
+                   if (user.id, message['created'], message['message_text']) not in shown]
+        results['messages'] = pending + results['messages']
+
+    return {
+        'user': {'id': user.id, 'username': user.username},
+        'following': [{'id': follow['following_id'], 'username': follow['following_id__username']}
+                      for follow in results['following']],
+        'followers': [{'id': follow['follower_id'], 'username': follow['follower_id__username']}
+                      for follow in results['followers']],
+        'recommended_users': results['recommended_users'],
+        'messages': results['messages'],
+    }
+
+
+def profile_data_for_script(data):
+    """
+    Serialise profile data so it can be safely placed inside a script tag
+
+    :param data: The profile data to serialise
+    :return: JSON string marked as safe for use in a template
+    """
+    data_json = json.dumps(data, cls=DjangoJSONEncoder)
+    data_json = data_json.replace('<', '\\u003C').replace('>', '\\u003E').replace('&', '\\u0026')
+    return mark_safe(data_json)
+
+
+def get_mentions(request):
+    """
+    Get the messages mentioning the logged in user, newest first. Pages are selected with since_id and before_id like
+    the other message endpoints, and hold MENTIONS_PAGE_SIZE messages unless a smaller limit is given
+
+    :param request: The request that called this function
+    :return: list of messages or failure message in JSON format
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'You must be logged in to view your mentions'})
+    try:
+        mentions = Mention.objects.filter(user=request.user)
+        # Paged and ordered like every other list of messages, see MessageQuerySet.newest_first
+        if request.GET.get('since_id'):
+            mentions = mentions.filter(page_filter(int(request.GET['since_id']), older=False, prefix='message__'))
+        if request.GET.get('before_id'):
+            mentions = mentions.filter(page_filter(int(request.GET['before_id']), older=True, prefix='message__'))
+        limit = min(max(int(request.GET.get('limit') or settings.MENTIONS_PAGE_SIZE), 0), settings.MENTIONS_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Please send valid message ids and limit'})
+
+    mentioned_messages = cached_query(
+        'get_mentions:{}:{}'.format(request.user.id, page_name(request.GET)),
+        ['mentions:user:{}'.format(request.user.id)],
+        lambda: list(mentions.order_by(*newest_first_order('message__')).values(
+            'message_id', 'message__message_text', 'message__created', 'message__user', 'message__user__username'
+        )[:limit]))
+    return JsonResponse([{'id': mention['message_id'], 'message_text': mention['message__message_text'],
+                          'created': mention['message__created'], 'user': mention['message__user'],
+                          'username': mention['message__user__username']}
+                         for mention in mentioned_messages], safe=False)
+
+
+def get_profile_data(request, username):
+    """
+    Get all the data shown on a profile page in a single JSON response
+
+    :param request: The request that called this function
+    :param username: The user to get the profile data for
+    :return: profile data or failure message in JSON format
+    """
+    username = username.rstrip('/')
+    try:
+        user = get_user_by_username(username)
+        data = collect_profile_data(user, request.user, feed=request.GET.get('feed', 'own'), params=request.GET)
+        return JsonResponse(data)
+    except(ObjectDoesNotExist, FieldDoesNotExist):
+        return JsonResponse({'success': False, 'message': 'The given username was not found'})
+
+
+@public_read
+def get_feed(request, username):
+    """
+    Get a page of the messages shown on a profile page, so the page can load more as it is scrolled
+
+    :param request: The request that called this function
+    :param username: The user whose profile is being shown
+    :return: list of messages or failure message in JSON format
+    """
+    try:
+        user = get_user_by_username(username.rstrip('/'))
+        return JsonResponse(load_feed(user, request.GET.get('feed', 'own'), request.GET), safe=False)
+    except(ObjectDoesNotExist, FieldDoesNotExist):
+        return JsonResponse({'success': False, 'message': 'The given username was not found'})
+
+
+def export_data(request):
+    """
+    Stream all the data of the logged in user as NDJSON or CSV. Staff can export any user by sending their username
+
+    :param request: The request that called this function, with an optional format of ndjson or csv
+    :return: The streamed export or failure message in JSON format
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'You must be logged in to export your data'})
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in export.FORMATS:
+        return JsonResponse({'success': False, 'message': 'The export format must be one of ' +
+                                                          ', '.join(sorted(export.FORMATS))})
+    user = request.user
+    if request.GET.get('username') and request.GET['username'] != user.username:
+        if not request.user.is_staff:
+            return JsonResponse({'success': False, 'message': 'Only staff can export other users'})
+        try:
+            user = User.objects.get(username=request.GET['username'])
+        except ObjectDoesNotExist:
+            return JsonResponse({'success': False, 'message': 'The given username was not found'})
+    if export.too_large_for_web(user):
+        return JsonResponse({'success': False, 'message': 'This account is too large to export here, please ask an '
+                                                          'administrator to export it with export_user_data'})
+
+    response = StreamingHttpResponse(export.export_chunks(user, export_format),
+                                     content_type=export.FORMATS[export_format][1])
+    response['Content-Disposition'] = 'attachment; filename="wire-{}.{}"'.format(user.username, export_format)
+    return response